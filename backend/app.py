@@ -9,6 +9,7 @@ from werkzeug.exceptions import RequestEntityTooLarge, HTTPException
 
 from backend.auth.auth import auth_bp
 from backend.config import Config
+from backend.core.search import ensure_search_indexes
 from backend.core.view import files_bp
 from backend.helpers import print_loaded_config
 from backend.models import db
@@ -77,11 +78,16 @@ if limiter:
     limiter.limit("5 per minute")(app.view_functions["jwt_auth.api_login"])
     limiter.limit("5 per minute")(app.view_functions["jwt_auth.api_callback"])
     limiter.limit("20 per minute")(app.view_functions["jwt_auth.api_refresh_token"])
+    limiter.limit("10 per minute")(app.view_functions["share_bp.public_share_access"])
 
 
 print(app.url_map)
 with app.app_context():
     db.create_all()
+    ensure_search_indexes()
+
+print('Starting job scheduler')
+app.scheduler.start()
 
 @app.errorhandler(RequestEntityTooLarge)
 def handle_large_file(error):
@@ -1,73 +1,97 @@
+import time
 from functools import wraps
 from flask import request, g, jsonify
+from backend.metrics import AUTH_SECONDS
+from backend.profiling import current_timings
 from backend.models import User
 from backend.auth.jwt_utils import decode_token
 
 
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
+def _check_login():
+    # Returns the error response, or None with g.user set
+    token = None
+    auth_header = request.headers.get('Authorization')
 
-        if auth_header:
-            try:
-                token = auth_header.split(' ')[1]  # Extract token from "Bearer <token>"
-            except IndexError:
-                return jsonify({'error': 'Invalid token format'}), 401
+    if auth_header:
+        try:
+            token = auth_header.split(' ')[1]  # Extract token from "Bearer <token>"
+        except IndexError:
+            return jsonify({'error': 'Invalid token format'}), 401
 
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
+    if not token:
+        return jsonify({'error': 'Token is missing'}), 401
 
-        payload = decode_token(token)
-        if 'error' in payload:
-            return jsonify({'error': payload['error']}), 401
+    payload = decode_token(token)
+    if 'error' in payload:
+        return jsonify({'error': payload['error']}), 401
 
-        if payload['token_type'] != 'access':
-            return jsonify({'error': 'Invalid token type'}), 401
+    if payload['token_type'] != 'access':
+        return jsonify({'error': 'Invalid token type'}), 401
 
-        user = User.query.get(payload['user_id'])
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+    user = User.query.get(payload['user_id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
 
-        g.user = user
-        return f(*args, **kwargs)
+    g.user = user
+    return None
 
-    return decorated_function
 
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
+def _check_admin():
+    token = None
+    auth_header = request.headers.get('Authorization')
+
+    if auth_header:
+        try:
+            token = auth_header.split(' ')[1]  # Extract token from "Bearer <token>"
+        except IndexError:
+            return jsonify({'error': 'Invalid token format'}), 401
+
+    if not token:
+        return jsonify({'error': 'Token is missing'}), 401
 
-        if auth_header:
-            try:
-                token = auth_header.split(' ')[1]  # Extract token from "Bearer <token>"
-            except IndexError:
-                return jsonify({'error': 'Invalid token format'}), 401
+    payload = decode_token(token)
+    if 'error' in payload:
+        return jsonify({'error': payload['error']}), 401
 
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
+    if payload['token_type'] != 'access':
+        return jsonify({'error': 'Invalid token type'}), 401
 
-        payload = decode_token(token)
-        if 'error' in payload:
-            return jsonify({'error': payload['error']}), 401
+    if not payload.get('is_admin', False):
+        return jsonify({'error': 'Admin privileges required'}), 403
 
-        if payload['token_type'] != 'access':
-            return jsonify({'error': 'Invalid token type'}), 401
+    user = User.query.get(payload['user_id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
 
-        if not payload.get('is_admin', False):
-            return jsonify({'error': 'Admin privileges required'}), 403
+    if not user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
 
-        user = User.query.get(payload['user_id'])
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+    g.user = user
+    return None
 
-        if not user.is_admin:
-            return jsonify({'error': 'Admin privileges required'}), 403
 
-        g.user = user
+def _authenticated(f, check, decorator):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        timings = current_timings()
+        db_before = timings['db'] if timings is not None else 0
+        started = time.perf_counter()
+        error = check()
+        elapsed = time.perf_counter() - started
+        AUTH_SECONDS.observe(elapsed, decorator=decorator, result='denied' if error else 'ok')
+        if timings is not None:
+            # The user lookup already counts as db time
+            timings['auth'] += elapsed - (timings['db'] - db_before)
+        if error:
+            return error
         return f(*args, **kwargs)
 
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+def login_required(f):
+    return _authenticated(f, _check_login, 'login')
+
+
+def admin_required(f):
+    return _authenticated(f, _check_admin, 'admin')
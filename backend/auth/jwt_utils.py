@@ -40,4 +40,31 @@ def decode_token(token):
     except jwt.ExpiredSignatureError:
         return {'error': 'Token has expired'}
     except jwt.InvalidTokenError:
-        return {'error': 'Invalid token'}
\ No newline at end of file
+        return {'error': 'Invalid token'}
+
+def generate_share_token(share_key, password_fingerprint):
+    """
+    Generate a short-lived access token for a password-protected share
+    """
+    payload = {
+        'share_key': share_key,
+        'pwd': password_fingerprint,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=current_app.config['SHARE_TOKEN_EXPIRES']),
+        'iat': datetime.datetime.utcnow(),
+        'token_type': 'share'
+    }
+    return jwt.encode(payload, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
+
+
+def generate_events_token(user_id):
+    """
+    Generate a short-lived token for opening the event stream.
+    EventSource can't send headers, so this token travels in the query string instead of the access token.
+    """
+    payload = {
+        'user_id': user_id,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=current_app.config['EVENTS_TOKEN_EXPIRES']),
+        'iat': datetime.datetime.utcnow(),
+        'token_type': 'events'
+    }
+    return jwt.encode(payload, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -15,6 +16,15 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
+    BLOB_FOLDER = os.getenv('BLOB_FOLDER', os.path.join(UPLOAD_FOLDER, 'blobs'))  # file data, see backend/storage/blobs.py
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')  # 'local' (BLOB_FOLDER) or 's3', which needs boto3
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')  # prepended to every blob key
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # for MinIO and other S3-compatible stores
+    S3_REGION = os.getenv('S3_REGION')
+    S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY')
+    COLD_BLOB_FOLDER = os.getenv('COLD_BLOB_FOLDER')  # cold tier on a slower disk, tiering is off when unset
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mp3', 'zip', 'rar', '7z','srt'}
     REDIRECT_URI = os.getenv('REDIRECT_URI', 'https://localhost:5000/callback')
     SESSION_COOKIE_SECURE = True
@@ -22,7 +32,60 @@ class Config:
     PREMIUM_DISCORD_USER_ID = os.getenv('PREMIUM_DISCORD_USER_ID', 0)
     PREFERRED_URL_SCHEME = 'https'
     FRONTEND_URI = os.getenv('FRONTEND_URI', 'https://localhost:3000')
-    MONITOR_SERVICE_URL = os.getenv('MONITOR_SERVICE_URL', 'http://localhost:61208/api/3/all')
+    MONITOR_SERVICE_URL = os.getenv('MONITOR_SERVICE_URL', 'http://localhost:61208/api/3/all')  # Glances, read when psutil isn't installed or HOST_METRICS_SOURCE is 'glances'
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-for-jwt')
     JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 3600))  # 1 hour in seconds
-    JWT_REFRESH_TOKEN_EXPIRES = int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 2592000))  # 30 days in seconds
\ No newline at end of file
+    JWT_REFRESH_TOKEN_EXPIRES = int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 2592000))  # 30 days in seconds
+    SHARE_TOKEN_EXPIRES = int(os.getenv('SHARE_TOKEN_EXPIRES', 900))  # 15 minutes in seconds
+    HOT_FILE_CACHE_MAX_BYTES = int(os.getenv('HOT_FILE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # 1 GB of mapped files
+    HOT_FILE_CACHE_MAX_FILES = int(os.getenv('HOT_FILE_CACHE_MAX_FILES', 32))
+    HOT_FILE_CACHE_MAX_FILE_SIZE = int(os.getenv('HOT_FILE_CACHE_MAX_FILE_SIZE', 256 * 1024 * 1024))  # 256 MB
+    HOT_FILE_CACHE_MIN_HITS = int(os.getenv('HOT_FILE_CACHE_MIN_HITS', 5))  # requests within the window
+    HOT_FILE_CACHE_WINDOW = int(os.getenv('HOT_FILE_CACHE_WINDOW', 60))  # seconds
+    SHARE_CACHE_TTL = int(os.getenv('SHARE_CACHE_TTL', 60))  # seconds
+    SHARE_CACHE_MAX_ENTRIES = int(os.getenv('SHARE_CACHE_MAX_ENTRIES', 10000))
+    SHARE_CACHE_URL = os.getenv('SHARE_CACHE_URL')  # e.g. redis://localhost:6379/1 to share the cache between workers
+    SHARE_STATS_FLUSH_INTERVAL = int(os.getenv('SHARE_STATS_FLUSH_INTERVAL', 10))  # seconds between batched writes
+    LISTING_CACHE_MAX_BYTES = int(os.getenv('LISTING_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 64 MB of rendered listings
+    FILES_PAGE_SIZE = int(os.getenv('FILES_PAGE_SIZE', 500))  # files per /files page unless ?limit= is given
+    CHANGE_LOG_COMPACT_AFTER = int(os.getenv('CHANGE_LOG_COMPACT_AFTER', 60 * 60))  # seconds before superseded entries are dropped
+    CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', 30))  # older cursors need a full resync
+    CHANGE_LOG_COMPACT_INTERVAL = int(os.getenv('CHANGE_LOG_COMPACT_INTERVAL', 15 * 60))  # seconds between compaction runs
+    EVENTS_URL = os.getenv('EVENTS_URL')  # e.g. redis://localhost:6379/2 to deliver events across workers
+    EVENTS_TOKEN_EXPIRES = int(os.getenv('EVENTS_TOKEN_EXPIRES', 60))  # seconds to open the stream with a token
+    EVENTS_HEARTBEAT = int(os.getenv('EVENTS_HEARTBEAT', 15))  # seconds between keep-alive comments
+    EVENTS_STREAM_TIMEOUT = int(os.getenv('EVENTS_STREAM_TIMEOUT', 60 * 60))  # streams are closed and reopened with a fresh token
+    EVENTS_MAX_STREAMS_PER_USER = int(os.getenv('EVENTS_MAX_STREAMS_PER_USER', 5))
+    EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', 16))  # per worker, keep it below gunicorn's --threads
+    EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 256))  # undelivered events per stream before it is told to resync
+    BLOB_RECLAIM_INTERVAL = int(os.getenv('BLOB_RECLAIM_INTERVAL', 60))  # seconds between retries of pending disk deletes
+    BLOB_RECLAIM_BATCH_SIZE = int(os.getenv('BLOB_RECLAIM_BATCH_SIZE', 1000))  # paths removed per transaction
+    BLOB_RECLAIM_DELAY = int(os.getenv('BLOB_RECLAIM_DELAY', 120))  # seconds a queued path stays readable, keep above SHARE_CACHE_TTL
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 10 * 60))  # seconds without a chunk before an upload is abandoned
+    FILE_ACCESS_FLUSH_INTERVAL = int(os.getenv('FILE_ACCESS_FLUSH_INTERVAL', 30))  # seconds between batched read counter writes
+    TIERING_INTERVAL = int(os.getenv('TIERING_INTERVAL', 60 * 60))  # seconds between runs of the tiering job
+    TIERING_COLD_AFTER_DAYS = int(os.getenv('TIERING_COLD_AFTER_DAYS', 90))  # files not read for this long move to the cold tier
+    TIERING_MIN_SIZE = int(os.getenv('TIERING_MIN_SIZE', 1024 * 1024))  # smaller files stay hot, 1 MB
+    TIERING_BATCH_SIZE = int(os.getenv('TIERING_BATCH_SIZE', 100))  # files moved per transaction
+    SCRUB_INTERVAL = int(os.getenv('SCRUB_INTERVAL', 24 * 60 * 60))  # seconds between the end of a scrub pass and the next, 0 disables it
+    SCRUB_BATCH_SIZE = int(os.getenv('SCRUB_BATCH_SIZE', 200))  # files or blobs checked per step
+    SCRUB_PAUSE = float(os.getenv('SCRUB_PAUSE', 1))  # seconds between steps
+    SCRUB_BYTES_PER_SECOND = int(os.getenv('SCRUB_BYTES_PER_SECOND', 20 * 1024 * 1024))  # read bandwidth for hashing, 0 is unlimited
+    SCRUB_VERIFY_HASHES = os.getenv('SCRUB_VERIFY_HASHES', '1') == '1'  # read every file to record and verify its sha256
+    SCRUB_ORPHAN_MIN_AGE = int(os.getenv('SCRUB_ORPHAN_MIN_AGE', 60 * 60))  # seconds before an unreferenced blob counts as orphan
+    JOBS_MAX_WORKERS = int(os.getenv('JOBS_MAX_WORKERS', 4))  # threads running background jobs in each worker
+    JOBS_LEADER_ELECTION = os.getenv('JOBS_LEADER_ELECTION', 'auto')  # 'postgres', 'file' (one host), 'off' (one process) or 'auto'
+    JOBS_LOCK_FILE = os.getenv('JOBS_LOCK_FILE', os.path.join(UPLOAD_FOLDER, '.jobs.lock'))  # used by the 'file' election
+    JOBS_LEADER_RETRY = int(os.getenv('JOBS_LEADER_RETRY', 15))  # seconds before a standby worker tries to take over
+    JOBS_STATUS_INTERVAL = int(os.getenv('JOBS_STATUS_INTERVAL', 10))  # seconds between snapshots of the leader's jobs
+    HOST_METRICS_SOURCE = os.getenv('HOST_METRICS_SOURCE', 'auto')  # 'psutil', 'glances' or 'auto' (psutil when installed)
+    HOST_METRICS_FILE = os.getenv('HOST_METRICS_FILE', os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'passthebytes-host-metrics'))  # ring buffer shared by the workers of a host
+    HOST_METRICS_HISTORY = int(os.getenv('HOST_METRICS_HISTORY', 3600))  # samples kept
+    HOST_METRICS_INTERVAL = int(os.getenv('HOST_METRICS_INTERVAL', 1))  # seconds between samples while the dashboard is open
+    HOST_METRICS_IDLE_INTERVAL = int(os.getenv('HOST_METRICS_IDLE_INTERVAL', 15))  # seconds between samples otherwise
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'passthebytes-metrics'))  # one file per worker, summed by /metrics
+    METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))  # seconds between writes of a worker's metrics
+    PROFILING_REFRESH = int(os.getenv('PROFILING_REFRESH', 5))  # seconds before a worker sees profiling started or stopped elsewhere
+    PROFILING_MAX_DURATION = int(os.getenv('PROFILING_MAX_DURATION', 60 * 60))  # seconds profiling stays on at most
+    PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 200))  # stored profiles, the oldest are dropped
+    PROFILING_TOP_FUNCTIONS = int(os.getenv('PROFILING_TOP_FUNCTIONS', 40))  # functions in the report of a profile
@@ -4,3 +4,12 @@ from backend.core.file_upload import *
 from backend.core.view import *
 from backend.core.directory import *
 from backend.core.multi_delete import *
+from backend.core.search import *
+from backend.core.rollups import *
+from backend.core.changes import *
+from backend.core.events import *
+from backend.core.move import *
+from backend.core.blob_migration import *
+from backend.core.tiering import *
+from backend.core.scrub import *
+from backend.core.quota import *
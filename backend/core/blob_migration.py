@@ -0,0 +1,78 @@
+import os
+import time
+
+import click
+from flask import current_app
+
+from backend.core.view import files_bp
+from backend.models import db, File, Checkpoint, PendingBlobDelete
+from backend.share.share_cache import invalidate_file_shares
+from backend.storage.blobs import new_blob_key
+
+MIGRATION_CHECKPOINT = 'blob_migration'
+
+
+def migrate_blobs(batch_size=500, max_batches=None, pause=0.0, echo=print):
+    """
+    Move files of the legacy layout into blobs, one batch per transaction, while the app keeps serving.
+    Progress is kept in a Checkpoint, so an interrupted run continues where it stopped.
+
+    Each file is copied into its blob on the configured storage and the row switched over with a compare-and-set on the old
+    filepath, so a file moved or deleted meanwhile is left alone. The old copy is queued in
+    PendingBlobDelete instead of being removed, downloads that already resolved it can finish.
+    Returns (migrated, skipped).
+    """
+    checkpoint = db.session.get(Checkpoint, MIGRATION_CHECKPOINT) or Checkpoint(name=MIGRATION_CHECKPOINT, value='0')
+    migrated = skipped = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        last_id = int(checkpoint.value or 0)
+        rows = db.session.query(File.id, File.filepath).filter(
+            File.id > last_id,
+            File.filepath.startswith('/')
+        ).order_by(File.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        for file_id, old_path in rows:
+            if not os.path.exists(old_path):
+                echo(f'File {file_id}: {old_path} is missing, skipped')
+                skipped += 1
+                continue
+            key = new_blob_key()
+            current_app.storage.put_file(key, old_path)
+            switched = db.session.execute(
+                db.update(File).where(File.id == file_id, File.filepath == old_path).values(filepath=key)
+            ).rowcount
+            if switched:
+                db.session.add(PendingBlobDelete(path=old_path, kind='file'))
+                migrated += 1
+            else:
+                current_app.storage.delete(key)
+                skipped += 1
+
+        checkpoint.value = str(rows[-1][0])
+        db.session.add(checkpoint)
+        db.session.commit()
+        # Cached share resolutions still point at the old paths
+        invalidate_file_shares([file_id for file_id, _ in rows])
+        batches += 1
+        echo(f'Migrated up to file {checkpoint.value}: {migrated} migrated, {skipped} skipped')
+        if pause:
+            time.sleep(pause)  # leave I/O headroom for live traffic
+
+    return migrated, skipped
+
+
+@files_bp.cli.command('migrate-blobs')
+@click.option('--batch-size', type=int, default=500, help='Files per transaction.')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches, run again to continue.')
+@click.option('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+@click.option('--restart', is_flag=True, help='Forget the saved progress and scan all files again.')
+def migrate_blobs_command(batch_size, max_batches, pause, restart):
+    """Move stored files into the hash-sharded blob layout."""
+    if restart:
+        Checkpoint.query.filter_by(name=MIGRATION_CHECKPOINT).delete()
+        db.session.commit()
+    migrated, skipped = migrate_blobs(batch_size, max_batches, pause, echo=click.echo)
+    click.echo(f'Done: {migrated} files migrated, {skipped} skipped.')
@@ -0,0 +1,170 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from backend.core.changes import record_change, file_path
+from backend.core.quota import free_space, publish_quota
+from backend.core.rollups import adjust_rollups
+from backend.helpers import log_warning
+from backend.models import db, File, Directory, Share, PendingBlobDelete
+from backend.storage.blobs import is_blob_key
+
+def delete_items(user, files, directories):
+    """
+    Delete files and whole directory subtrees with a fixed number of set-based statements,
+    however many rows they contain. `files` and `directories` are rows already checked to be owned by `user`.
+
+    Only the database is touched here: the paths on disk are queued in PendingBlobDelete
+    in the same transaction and removed later by the blob reclaimer.
+    Returns (deleted_files, deleted_dirs).
+    """
+    # A selected directory inside another selected directory is already covered by its ancestor
+    dir_paths = sorted(d.path for d in directories)
+    roots = [d for d in directories if not any(d.path.startswith(f"{p}/") for p in dir_paths)]
+    root_paths = [d.path for d in roots]
+
+    subtree_conditions = [
+        db.or_(Directory.path == path, Directory.path.startswith(f"{path}/", autoescape=True))
+        for path in root_paths
+    ]
+    subtree_ids = db.session.query(Directory.id).filter(
+        Directory.user_id == user.id,
+        db.or_(*subtree_conditions)
+    ) if roots else None
+
+    loose_files = [
+        f for f in files
+        if not (f.directory and any(f.directory.path == p or f.directory.path.startswith(f"{p}/") for p in root_paths))
+    ]
+    file_conditions = []
+    if loose_files:
+        file_conditions.append(File.id.in_([f.id for f in loose_files]))
+    if subtree_ids is not None:
+        file_conditions.append(File.directory_id.in_(subtree_ids))
+    if not file_conditions and not roots:
+        return 0, 0
+    file_filter = db.and_(File.user_id == user.id, db.or_(*file_conditions)) if file_conditions else db.false()
+
+    freed_space, deleted_files = db.session.query(
+        db.func.coalesce(db.func.sum(File.filesize), 0), db.func.count(File.id)
+    ).filter(file_filter).one()
+
+    # Shares pointing into the deleted set, to drop from the share cache once committed
+    shared_file_keys = [key for (key,) in db.session.query(Share.share_key).filter(
+        Share.owner_id == user.id,
+        Share.object_type == 'file',
+        Share.object_id.in_(db.session.query(File.id).filter(file_filter))
+    )]
+    shared_dir_keys = [key for (key,) in db.session.query(Share.share_key).filter(
+        Share.owner_id == user.id,
+        Share.object_type == 'directory',
+        Share.object_id.in_(subtree_ids)
+    )] if subtree_ids is not None else []
+
+    # Rollups: subtrees take their recorded totals along, loose files are summed per directory
+    for d in roots:
+        adjust_rollups(user.id, d.path, -d.total_size, -d.total_files, include_self=False)
+    loose_by_dir = defaultdict(lambda: [0, 0])
+    for f in loose_files:
+        if f.directory:
+            loose_by_dir[f.directory.path][0] -= f.filesize
+            loose_by_dir[f.directory.path][1] -= 1
+    for path, (size_delta, files_delta) in loose_by_dir.items():
+        adjust_rollups(user.id, path, size_delta, files_delta)
+
+    # Only the selected items are logged, their contents are implied
+    for f in loose_files:
+        record_change(user.id, 'delete', 'file', f.id, name=f.filename, path=file_path(f), parent_id=f.directory_id)
+    for d in roots:
+        record_change(user.id, 'delete', 'directory', d.id, name=d.name, path=d.path, parent_id=d.parent_dir_id)
+
+    now = datetime.utcnow()
+    db.session.execute(db.insert(PendingBlobDelete).from_select(
+        ['path', 'kind', 'attempts', 'created_at'],
+        db.select(File.filepath, db.literal('file'), db.literal(0), db.literal(now)).where(file_filter)
+    ))
+    deleted_dirs = 0
+    if subtree_ids is not None:
+        user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user.id))
+        db.session.execute(db.insert(PendingBlobDelete).from_select(
+            ['path', 'kind', 'attempts', 'created_at'],
+            db.select(
+                db.literal(f"{user_folder}{os.sep}") + Directory.path, db.literal('dir'), db.literal(0), db.literal(now)
+            ).where(Directory.id.in_(subtree_ids))
+        ))
+
+    db.session.execute(db.delete(File).where(file_filter))
+    if subtree_ids is not None:
+        # Materialize the ids first, a DELETE can't select from its own table on every database
+        dir_ids = [dir_id for (dir_id,) in subtree_ids]
+        deleted_dirs = db.session.execute(
+            db.delete(Directory).where(Directory.id.in_(dir_ids))
+        ).rowcount
+    free_space(user.id, freed_space)
+    db.session.commit()
+
+    current_app.share_cache.invalidate(*shared_file_keys, *shared_dir_keys)
+    publish_quota(user)
+
+    return deleted_files, deleted_dirs
+
+
+def reclaim_pending_blobs(batch_size, min_age=0, max_attempts=5):
+    """
+    Remove queued paths from disk, one batch per transaction so it can stop and resume anywhere.
+    Files go first and folders deepest first, so folders are empty by the time they are removed.
+    Entries younger than `min_age` seconds are left for later, readers that resolved the path
+    just before it was queued can still open it.
+    Returns the number of queue entries processed. Must run inside an app context.
+    """
+    processed = 0
+    failed_ids = []  # retried on the next run, not in a tight loop
+    queued_before = datetime.utcnow() - timedelta(seconds=min_age)
+    while True:
+        batch = PendingBlobDelete.query.filter(
+            PendingBlobDelete.created_at <= queued_before,
+            PendingBlobDelete.attempts < max_attempts,
+            PendingBlobDelete.id.notin_(failed_ids)
+        ).order_by(
+            # 'dir' sorts before 'file', so descending puts files first
+            PendingBlobDelete.kind.desc(), db.func.length(PendingBlobDelete.path).desc(), PendingBlobDelete.id
+        ).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not batch:
+            return processed
+
+        # A path can be taken again before it is reclaimed, e.g. by an upload under the same name
+        reused = {path for (path,) in db.session.query(File.filepath).filter(
+            File.filepath.in_([entry.path for entry in batch if entry.kind == 'file'])
+        )}
+
+        done_ids = []
+        for entry in batch:
+            if entry.path in reused:
+                done_ids.append(entry.id)
+                continue
+            try:
+                if entry.kind == 'dir':
+                    os.rmdir(entry.path)
+                elif is_blob_key(entry.path):
+                    current_app.storage.delete(entry.path)
+                else:
+                    os.remove(entry.path)
+                done_ids.append(entry.id)
+            except FileNotFoundError:
+                done_ids.append(entry.id)
+            except Exception as e:
+                if entry.kind == 'dir' and isinstance(e, OSError):
+                    # Not empty, e.g. an upload still in progress: leave the folder alone
+                    done_ids.append(entry.id)
+                else:
+                    entry.attempts += 1
+                    failed_ids.append(entry.id)
+                    log_warning(None, "BlobReclaim", f"Failed to remove {entry.path}: {e}")
+
+        if done_ids:
+            db.session.execute(db.delete(PendingBlobDelete).where(PendingBlobDelete.id.in_(done_ids)))
+        db.session.commit()
+        processed += len(batch)
+
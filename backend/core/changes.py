@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+
+from flask import request, g, jsonify, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, aliased
+
+from backend.auth.decorators import login_required
+from backend.core.pagination import get_page_size
+from backend.core.versioning import bump_tree_version
+from backend.core.view import files_bp
+from backend.models import db, ChangeLog, Checkpoint
+
+WATERMARK_CHECKPOINT = 'change_log_watermark:{user_id}'
+
+
+def record_change(user_id, event_type, object_type, object_id, name=None, path=None, parent_id=None):
+    """
+    Append an entry to the user's change log, in the current transaction.
+
+    The tree version is bumped first. That UPDATE locks the user row, so concurrent
+    changes of one user commit in sequence order and a reader following the feed never
+    skips an entry that was numbered earlier but committed later.
+    """
+    bumped = db.session.info.setdefault('tree_version_bumped', set())
+    if user_id not in bumped:
+        bump_tree_version(user_id)
+        bumped.add(user_id)
+
+    db.session.add(ChangeLog(
+        user_id=user_id,
+        event=event_type,
+        object_type=object_type,
+        object_id=object_id,
+        parent_id=parent_id,
+        name=name,
+        path=path
+    ))
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def reset_bumped_users(session):
+    session.info.pop('tree_version_bumped', None)
+
+
+def file_path(file_obj):
+    return f"{file_obj.directory.path}/{file_obj.filename}" if file_obj.directory else file_obj.filename
+
+
+def get_watermark(user_id):
+    """
+    Highest sequence number of the user that was pruned from the change log.
+    """
+    checkpoint = db.session.get(Checkpoint, WATERMARK_CHECKPOINT.format(user_id=user_id))
+    return int(checkpoint.value) if checkpoint else 0
+
+
+def serialize_change(change):
+    return {
+        'seq': change.id,
+        'event': change.event,
+        'type': change.object_type,
+        'id': change.object_id,
+        'parent_id': change.parent_id,
+        'name': change.name,
+        'path': change.path,
+        'time': change.created_at.isoformat()
+    }
+
+
+@files_bp.route('/changes', methods=['GET'])
+@login_required
+def changes():
+    """
+    Incremental sync. Without `since`, returns the current cursor to start from.
+    With `since=<cursor>`, returns up to `limit` changes after it and the cursor to continue with.
+    Responds 410 when the changes after `since` were already pruned; the client has to relist.
+    """
+    user = g.user
+    since = request.args.get('since', type=int)
+    limit = get_page_size()
+
+    if since is None:
+        latest = db.session.query(db.func.max(ChangeLog.id)).filter(ChangeLog.user_id == user.id).scalar()
+        return jsonify({'changes': [], 'cursor': max(latest or 0, get_watermark(user.id)), 'has_more': False}), 200
+
+    if since < get_watermark(user.id):
+        return jsonify({'error': 'Cursor expired, a full resync is required.'}), 410
+
+    rows = ChangeLog.query.filter(
+        ChangeLog.user_id == user.id,
+        ChangeLog.id > since
+    ).order_by(ChangeLog.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'changes': [serialize_change(change) for change in rows],
+        'cursor': rows[-1].id if rows else since,
+        'has_more': has_more
+    }), 200
+
+
+def compact_change_log():
+    """
+    Drop entries superseded by a newer entry for the same object once they are older than
+    CHANGE_LOG_COMPACT_AFTER, and prune everything older than CHANGE_LOG_RETENTION_DAYS.
+    Entries carry the object's full state, so the newest entry per object is all a client needs.
+    Returns (compacted, pruned). Must run inside an app context.
+    """
+    now = datetime.utcnow()
+    compact_before = now - timedelta(seconds=current_app.config['CHANGE_LOG_COMPACT_AFTER'])
+    retain_after = now - timedelta(days=current_app.config['CHANGE_LOG_RETENTION_DAYS'])
+
+    newer = aliased(ChangeLog)
+    superseded = db.session.query(newer.id).filter(
+        newer.user_id == ChangeLog.user_id,
+        newer.object_type == ChangeLog.object_type,
+        newer.object_id == ChangeLog.object_id,
+        newer.id > ChangeLog.id
+    ).exists()
+    compacted = ChangeLog.query.filter(
+        ChangeLog.created_at < compact_before, superseded
+    ).delete(synchronize_session=False)
+
+    # Remember up to where each user's entries were pruned,
+    # so stale cursors get a 410 instead of silently missing changes
+    pruned_up_to = db.session.query(ChangeLog.user_id, db.func.max(ChangeLog.id)).filter(
+        ChangeLog.created_at < retain_after
+    ).group_by(ChangeLog.user_id).all()
+    pruned = 0
+    for user_id, max_id in pruned_up_to:
+        pruned += ChangeLog.query.filter(
+            ChangeLog.user_id == user_id,
+            ChangeLog.id <= max_id
+        ).delete(synchronize_session=False)
+        name = WATERMARK_CHECKPOINT.format(user_id=user_id)
+        checkpoint = db.session.get(Checkpoint, name) or Checkpoint(name=name)
+        checkpoint.value = str(max(max_id, int(checkpoint.value or 0)))
+        db.session.add(checkpoint)
+
+    db.session.commit()
+    return compacted, pruned
@@ -1,10 +1,11 @@
-import os
 from typing import Optional
 
 from flask import request, g, jsonify
 from werkzeug.utils import secure_filename
 
 from backend.auth.decorators import login_required
+from backend.core.bulk_delete import delete_items
+from backend.core.changes import record_change
 from backend.core.view import files_bp
 from backend.helpers import log_info
 from backend.models import Directory, db
@@ -56,6 +57,9 @@ def create_directory():
         new_dir = Directory(name=name, user_id=user.id, path=path)
 
     db.session.add(new_dir)
+    db.session.flush()
+    record_change(user.id, 'create', 'directory', new_dir.id,
+                  name=new_dir.name, path=new_dir.path, parent_id=new_dir.parent_dir_id)
     db.session.commit()
 
     return jsonify({"success": True, "message": "Directory created"}), 201
@@ -69,33 +73,10 @@ def delete_directory(directory_id):
     if not directory:
         return jsonify({"success": False, "error": "Directory not found"}), 404
 
-    # Implement logic to delete all files and subdirectories within this directory
-    # For simplicity:
-    # 1. Delete files
-    # 2. Recursively delete child dirs
-
-    dir_deleted, files_deleted = [],[]
-    def delete_dir_contents(dir_obj, dd , fd):
-        for f in dir_obj.files:
-            # delete file from disk
-            if os.path.exists(f.filepath):
-                os.remove(f.filepath)
-            user.used_space -= f.filesize
-            files_deleted.append(f.id)
-            db.session.delete(f)
-        for child in dir_obj.child_dirs:
-            delete_dir_contents(child, dd, fd)
-            # delete the directory itself
-            os.path.exists(child.path) and os.rmdir(child.path)
-            db.session.delete(child)
-            dir_deleted.append(child.id)
-
-    delete_dir_contents(directory, dir_deleted, files_deleted)
-    # delete the directory itself
-    os.path.exists(directory.path) and os.rmdir(directory.path)
-    db.session.delete(directory)
-    db.session.commit()
+    # Rows and quota are updated in a few set-based statements, the data on disk is reclaimed in the background
+    directory_name = directory.name
+    deleted_files, deleted_dirs = delete_items(user, [], [directory])
 
-    log_info(user, "Delete directory", f"Directory {directory.name}({directory_id}) deleted along with {len(files_deleted)} files and {len(dir_deleted)} subdirectories.")
+    log_info(user, "Delete directory", f"Directory {directory_name}({directory_id}) deleted along with {deleted_files} files and {deleted_dirs - 1} subdirectories.")
     return jsonify({"success": True, "message": "Directory deleted"}), 200
 
@@ -1,13 +1,51 @@
 import os
-import tempfile
-import zipfile
 
-from flask import g, send_file, jsonify, make_response, request, Response
+from flask import g, jsonify, request, Response, current_app, stream_with_context
 
 from backend.auth.decorators import login_required
+from backend.core.archive import stream_zip
+from backend.core.tree import subtree_filter, relative_path
 from backend.core.view import files_bp
 from backend.helpers import log_warning, log_info, log_error
-from backend.models import File, Directory
+from backend.metrics import measure_stream, ARCHIVE_BUILD_SECONDS
+from backend.models import db, File, Directory
+
+MAPPED_CHUNK_SIZE = 256 * 1024  # 256 KB slices of a mapped file per iteration
+
+
+def blob_response(key, filename, size, mapping=None):
+    """
+    Stream a stored file as an attachment. A single byte range (Range: bytes=...) is answered
+    with 206 Partial Content, so downloads can be resumed and media can be seeked.
+    `mapping` is a memory mapping of the whole file to serve from instead of the storage backend.
+    """
+    start, end, status = 0, size, 200
+    if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1:
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range
+        status = 206
+
+    if mapping is not None:
+        def generate():
+            for offset in range(start, end, MAPPED_CHUNK_SIZE):
+                yield mapping[offset:min(offset + MAPPED_CHUNK_SIZE, end)]
+        body = generate()
+    else:
+        body = current_app.storage.open(key, start, end if status == 206 else None)
+
+    response = Response(body, status=status, mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Filename'] = filename
+    response.headers['Access-Control-Expose-Headers'] = 'X-Filename'
+    return response
 
 
 @files_bp.route('/download/<int:file_id>', methods=['GET'])
@@ -22,30 +60,15 @@ def download(file_id):
         return jsonify({'success': False, 'error': 'Access denied.'}), 403
 
     # Check existence
-    if not os.path.exists(file.filepath):
+    blob = current_app.storage.stat(file.filepath)
+    if blob is None:
         log_error(user, "Download; File not found", f"{file.filename} ({file_id})")
         return jsonify({'success': False, 'error': 'File not found on server.'}), 404
 
     try:
-        # Instead of using send_file, we create a generator to stream the file contents.
-        def generate():
-            with open(file.filepath, 'rb') as f:
-                while True:
-                    chunk = f.read(8192)  # 8 KB per iteration
-                    if not chunk:
-                        break
-                    yield chunk
-
-        # Build streaming response
-        response = Response(
-            generate(),
-            mimetype='application/octet-stream'
-        )
-        # Set headers for file download
-        response.headers['Content-Disposition'] = f'attachment; filename="{file.filename}"'
-        response.headers['X-Filename'] = file.filename
-        response.headers['Access-Control-Expose-Headers'] = 'X-Filename'
-
+        response = blob_response(file.filepath, file.filename, blob.size)
+        response.response = measure_stream(response.response, 'download')
+        current_app.file_access.record_read(file.id)
         log_info(user, "Download; File downloaded", f"{file.filename} ({file_id})")
         return response
 
@@ -74,45 +97,25 @@ def download_multiple_items():
         log_warning(user, "Download Multiple; Invalid directories", f"Directory IDs: {dir_ids}")
         return jsonify({"success": False, "error": "Some directories are invalid or not owned by the user."}), 400
 
-    # Gather all files from directories recursively
-    def gather_files_from_directory(dir_obj, all_files, base_path=""):
-        relative_dir_path = os.path.join(base_path, dir_obj.name)
-        for f in dir_obj.files:
-            all_files.append((f, relative_dir_path))
-        for child_dir in dir_obj.child_dirs:
-            gather_files_from_directory(child_dir, all_files, relative_dir_path)
-
-    all_files_to_zip = [(f, "") for f in files]
+    # Gather all files below the directories, one query per selected directory
+    entries = [(f.filepath, f.filename) for f in files]
+    for f in files:
+        current_app.file_access.record_read(f.id)
     for d in directories:
-        gather_files_from_directory(d, all_files_to_zip)
-
-    # Create ZIP file on disk
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as tmp_zip_file:
-            zip_file_path = tmp_zip_file.name
-            with zipfile.ZipFile(tmp_zip_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for file_obj, relative_path in all_files_to_zip:
-                    if os.path.exists(file_obj.filepath):
-                        arcname = os.path.join(relative_path, file_obj.filename)  # Include relative path
-                        zf.write(file_obj.filepath, arcname)
-                    else:
-                        log_warning(user, "Download Multiple; File not found", f"{file_obj.filename} ({file_obj.id})")
-                        return jsonify({"success": False, "error": f"File {file_obj.filename} not found on server."}), 404
-    except Exception as e:
-        log_error(user, "Download Multiple; Failed to create ZIP file", str(e))
-        return jsonify({"success": False, "error": "Failed to create ZIP file."}), 500
-
-    # Serve ZIP file
-    try:
-        # print location of zip file
-        print(zip_file_path)
-        response = make_response(
-            send_file(zip_file_path, as_attachment=True, download_name="selected_items.zip")
-        )
-        response.headers['X-Filename'] = 'selected_items.zip'
-        response.headers['Access-Control-Expose-Headers'] = 'X-Filename'
-        log_info(user, "Download Multiple; Files downloaded", f"{len(all_files_to_zip)} items zipped.")
-        return response
-    except Exception as e:
-        log_error(user, "Download Multiple; Failed to send ZIP file", str(e))
-        return jsonify({"success": False, "error": "Failed to send ZIP file."}), 500
+        rows = db.session.query(File.filepath, File.filename, Directory.path).join(
+            Directory, File.directory_id == Directory.id
+        ).filter(subtree_filter(user.id, d.id, d.path)).order_by(Directory.path, File.filename)
+        for row in rows:
+            entries.append((row.filepath, os.path.join(d.name, relative_path(row.path, d.path), row.filename)))
+
+    def on_missing(key, arcname):
+        log_warning(user, "Download Multiple; File not found", arcname)
+
+    # Streamed while it is built, no temporary ZIP file on disk
+    body = measure_stream(stream_zip(entries, on_missing=on_missing), 'archive', duration=ARCHIVE_BUILD_SECONDS)
+    response = Response(stream_with_context(body), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename="selected_items.zip"'
+    response.headers['X-Filename'] = 'selected_items.zip'
+    response.headers['Access-Control-Expose-Headers'] = 'X-Filename'
+    log_info(user, "Download Multiple; Files downloaded", f"{len(entries)} items zipped.")
+    return response
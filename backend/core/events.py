@@ -0,0 +1,257 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from flask import request, g, jsonify, current_app, Response, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from backend.auth.decorators import login_required
+from backend.auth.jwt_utils import generate_events_token, decode_token
+from backend.core.changes import serialize_change
+from backend.core.view import files_bp
+from backend.helpers import log_warning
+from backend.models import ChangeLog
+
+
+class EventSubscription:
+    """
+    Queue of events for one open stream.
+    When the client can't keep up the queue overflows, the stream is told to resync and closed.
+    """
+
+    def __init__(self, user_id, max_size):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+
+class MemoryEventBackend:
+    """
+    Delivers events to streams of this worker only.
+    """
+
+    def __init__(self):
+        self.deliver = None
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, user_id, item):
+        self.deliver(user_id, item)
+
+
+class RedisEventBackend:
+    """
+    Fans events out over a Redis channel, so a stream sees events of requests handled by any worker.
+    """
+
+    def __init__(self, url, channel='passthebytes:events'):
+        import redis  # optional dependency, only needed when EVENTS_URL is set
+
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def start(self, deliver):
+        app = current_app._get_current_object()  # for the listener thread to log in
+
+        def listen():
+            while True:
+                try:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                    for message in pubsub.listen():
+                        payload = json.loads(message['data'])
+                        deliver(payload['user_id'], payload['item'])
+                except Exception as e:
+                    with app.app_context():
+                        log_warning(None, "Events", f"Event listener lost its Redis connection, reconnecting: {e}")
+                    time.sleep(1)
+
+        threading.Thread(target=listen, daemon=True).start()
+
+    def publish(self, user_id, item):
+        self.client.publish(self.channel, json.dumps({'user_id': user_id, 'item': item}))
+
+
+class EventBus:
+    """
+    Per-user publish/subscribe for the event stream.
+    """
+
+    def __init__(self, backend, queue_size, max_streams_per_user, max_streams):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.max_streams_per_user = max_streams_per_user
+        self.max_streams = max_streams
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)  # user_id -> {EventSubscription}
+        self.backend.start(self._deliver)
+
+    @classmethod
+    def from_config(cls, config):
+        backend = None
+        if config.get('EVENTS_URL'):
+            try:
+                backend = RedisEventBackend(config['EVENTS_URL'])
+            except ImportError:
+                log_warning(None, "Events", "redis is not installed, events are only delivered within each worker")
+        return cls(
+            backend or MemoryEventBackend(),
+            queue_size=config['EVENTS_QUEUE_SIZE'],
+            max_streams_per_user=config['EVENTS_MAX_STREAMS_PER_USER'],
+            max_streams=config['EVENTS_MAX_STREAMS'],
+        )
+
+    def subscribe(self, user_id):
+        """
+        Return (subscription, None), or (None, 'worker') / (None, 'user') when this worker
+        or the user already has too many open streams.
+        """
+        with self._lock:
+            # Every stream holds a thread of the worker, some have to be left for the other requests
+            if sum(len(subscriptions) for subscriptions in self._subscriptions.values()) >= self.max_streams:
+                return None, 'worker'
+            if len(self._subscriptions[user_id]) >= self.max_streams_per_user:
+                return None, 'user'
+            subscription = EventSubscription(user_id, self.queue_size)
+            self._subscriptions[user_id].add(subscription)
+            return subscription, None
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event_type, data, event_id=None):
+        try:
+            self.backend.publish(user_id, {'event': event_type, 'data': data, 'id': event_id})
+        except Exception as e:
+            log_warning(None, "Events", f"Publish failed: {e}")
+
+    def stream_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def _deliver(self, user_id, item):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(item)
+
+
+@files_bp.record
+def on_load(state):
+    app = state.app
+    with app.app_context():
+        app.event_bus = EventBus.from_config(app.config)
+
+
+def publish_event(user_id, event_type, data):
+    """
+    Push an event to the user's open streams right away.
+    Use it for state that isn't stored in the database, like upload progress.
+    """
+    current_app.event_bus.publish(user_id, event_type, data)
+
+
+# Database changes are only pushed once they are committed: the rows written in a
+# transaction are collected at flush time and published after the commit.
+
+@event.listens_for(Session, 'after_flush')
+def collect_events(session, flush_context):
+    if not has_app_context():
+        return
+    pending = session.info.setdefault('pending_events', [])
+    for obj in session.new:
+        if isinstance(obj, ChangeLog):
+            pending.append((obj.user_id, 'change', serialize_change(obj), obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_committed_events(session):
+    pending = session.info.pop('pending_events', None)
+    if not pending or not has_app_context():
+        return
+    event_bus = getattr(current_app, 'event_bus', None)
+    if event_bus is None:
+        return
+    for user_id, event_type, data, event_id in pending:
+        event_bus.publish(user_id, event_type, data, event_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def drop_uncommitted_events(session):
+    session.info.pop('pending_events', None)
+
+
+def format_event(event_type, data, event_id=None):
+    message = f"event: {event_type}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+@files_bp.route('/events/token', methods=['POST'])
+@login_required
+def events_token():
+    return jsonify({'token': generate_events_token(g.user.id)}), 200
+
+
+@files_bp.route('/events', methods=['GET'])
+def events():
+    """
+    Server-Sent Events stream of the user's changes, quota, upload progress and long running jobs.
+    Authenticated with a token from POST /events/token, since EventSource can't send headers.
+    Events of type `change` carry the change log sequence as id; after a reconnect
+    the client catches up through /changes. A `resync` event means events were dropped.
+    A stream occupies a worker thread while it is open: serve the app with threaded or async
+    workers (gunicorn -k gthread or -k gevent), each worker keeps at most EVENTS_MAX_STREAMS.
+    """
+    payload = decode_token(request.args.get('token', ''))
+    if 'error' in payload:
+        return jsonify({'error': payload['error']}), 401
+    if payload.get('token_type') != 'events':
+        return jsonify({'error': 'Invalid token type'}), 401
+
+    event_bus = current_app.event_bus
+    subscription, limit = event_bus.subscribe(payload['user_id'])
+    if limit == 'worker':
+        return jsonify({'error': 'Too many open event streams on this server'}), 503
+    if limit == 'user':
+        return jsonify({'error': 'Too many open event streams'}), 429
+
+    heartbeat = current_app.config['EVENTS_HEARTBEAT']
+    closes_at = time.monotonic() + current_app.config['EVENTS_STREAM_TIMEOUT']
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while time.monotonic() < closes_at:
+                if subscription.overflowed:
+                    yield format_event('resync', {})
+                    return
+                try:
+                    item = subscription.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(item['event'], item['data'], item.get('id'))
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # let nginx pass events through unbuffered
+    })
@@ -1,11 +1,10 @@
-import os
-
 from flask import g, jsonify
 
 from backend.auth.decorators import login_required
+from backend.core.bulk_delete import delete_items
 from backend.core.view import files_bp
-from backend.helpers import log_warning, log_error, log_info
-from backend.models import db, File
+from backend.helpers import log_warning, log_info
+from backend.models import File
 
 
 @files_bp.route('/delete/<int:file_id>', methods=['DELETE'])
@@ -18,20 +17,10 @@ def delete(file_id):
         log_warning(user,"Delete; Access denied",f"{file.filename} ({file_id})")
         return jsonify({'success': False, 'error': 'Access denied.'}), 403
 
-    # Delete the file from the filesystem
-    if os.path.exists(file.filepath):
-        os.remove(file.filepath)
-    else:
-        log_error(user,"Delete; File not found",f"{file.filepath}")
-        return jsonify({'success': False, 'error': 'File not found on the filesystem.'}), 404
-
-    # Update user's used space
-    user.used_space -= file.filesize
-    db.session.commit()
-
-    # Delete the file record from the database
-    db.session.delete(file)
-    db.session.commit()
+    # The row goes right away, the data on disk is reclaimed in the background.
+    # A file that is already missing on disk no longer blocks deleting its record.
+    filename = file.filename
+    delete_items(user, [file], [])
 
-    log_info(user,"Delete; File deleted",f"{file.filename} ({file_id})")
+    log_info(user,"Delete; File deleted",f"{filename} ({file_id})")
     return jsonify({'success': True, 'message': 'File deleted successfully.'}), 200
@@ -1,15 +1,25 @@
 import json
 import os
-import shutil
+import time
+from datetime import datetime, timedelta
 
 from flask import request, g, current_app, jsonify
 
 from backend.auth.decorators import login_required
+from backend.core.rollups import adjust_rollups
+from backend.core.changes import record_change
+from backend.core.events import publish_event
+from backend.core.quota import reserve_space, release_reservation, settle_reservation, publish_quota
 from backend.core.view import files_bp
 from backend.helpers import log_info, log_error, log_warning
-from backend.models import db, File, Directory
+from backend.metrics import UPLOAD_CHUNK_BYTES, UPLOAD_PART_SECONDS, UPLOAD_ASSEMBLY_SECONDS
+from backend.models import db, File, Directory, UploadSession, User
+from backend.storage.blobs import new_blob_key
 from werkzeug.utils import secure_filename
 
+def session_deadline():
+    return datetime.utcnow() + timedelta(seconds=current_app.config['UPLOAD_SESSION_TTL'])
+
 
 @files_bp.route('/upload_chunk', methods=['POST'])
 @login_required
@@ -36,9 +46,24 @@ def upload_chunk():
         directory_id = int(directory_id) if directory_id else None
     except ValueError:
         return jsonify({"success": False, "error": "Invalid parameter value."}), 400
+    if file_size < 0:
+        return jsonify({"success": False, "error": "Invalid parameter value."}), 400
 
     file_name = secure_filename(file_name)
 
+    chunk.stream.seek(0, os.SEEK_END)
+    chunk_length = chunk.stream.tell()
+    chunk.stream.seek(0)
+
+    # Every chunk but the last becomes a multipart part, which the storage may require to have a minimum size
+    storage = current_app.storage
+    if chunk_index + 1 < total_chunks and storage.min_part_size:
+        if chunk_length < storage.min_part_size:
+            return jsonify({
+                "success": False,
+                "error": f"Chunks must be at least {storage.min_part_size} bytes."
+            }), 400
+
     # Validate directory
     if directory_id:
         directory = Directory.query.filter_by(id=directory_id, user_id=user.id).first()
@@ -48,25 +73,17 @@ def upload_chunk():
     else:
         directory_path = ""
 
-    user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user.id))
-    temp_dir = os.path.join(user_folder, f'{upload_id}_temp')
-    os.makedirs(temp_dir, exist_ok=True)
-
-    tracking_file = os.path.join(temp_dir, 'tracking.json')
+    session = UploadSession.query.filter_by(user_id=user.id, upload_id=upload_id).first()
 
     # -------------------------------------------------------
     # 1) Handle chunk 0 (the "start" of the upload)
     # -------------------------------------------------------
     if chunk_index == 0:
-        # If tracking.json for this upload_id already exists, it suggests chunk 0 was *already* handled
-        if os.path.exists(tracking_file):
-            # Option A: treat it as an error (client might be re-sending chunk 0 again)
-            # return jsonify({"success": False, "error": "Chunk 0 has already been processed."}), 400
-
-            # Option B: return success so the client doesn't keep retrying
+        # If the session for this upload_id already exists, chunk 0 was *already* handled
+        if session:
+            # Return success so the client doesn't keep retrying
             return jsonify({"success": True, "message": "Chunk 0 was already processed."}), 200
 
-        # If tracking.json doesn't exist, proceed to DB check for existing file
         existing_file = File.query.filter_by(
             user_id=user.id,
             directory_id=directory_id,
@@ -79,114 +96,144 @@ def upload_chunk():
                 "filename": file_name
             }), 409
 
-        # Now create brand-new tracking.json
-        tracking_data = {
-            'uploaded_chunks': [0],
-            'file_size': file_size,
-            'directory_id': directory_id,
-            'file_name': file_name
-        }
-        with open(tracking_file, 'w') as tf:
-            json.dump(tracking_data, tf)
+        # The declared size is held against the quota until the upload completes or is abandoned
+        if not reserve_space(user.id, file_size):
+            db.session.rollback()
+            log_warning(user, "Upload chunk", f"{file_name} ({upload_id}) - Quota exceeded")
+            return jsonify({"success": False, "error": "Not enough storage space for this file."}), 400
+
+        # Chunks are stored as the parts of a multipart upload into a new blob,
+        # where the file sits in the tree is only recorded in the database
+        blob_key = new_blob_key()
+        try:
+            multipart_id = storage.create_multipart(blob_key)
+        except Exception as e:
+            db.session.rollback()
+            log_error(user, "Upload chunk", f"{file_name} ({upload_id}) - Failed to start multipart upload: {e}")
+            return jsonify({"success": False, "error": "Failed to start upload."}), 500
+
+        session = UploadSession(
+            upload_id=upload_id,
+            user_id=user.id,
+            directory_id=directory_id,
+            file_name=file_name,
+            file_size=file_size,
+            blob_key=blob_key,
+            multipart_id=multipart_id,
+            expires_at=session_deadline()
+        )
+        db.session.add(session)
+        try:
+            db.session.commit()
+        except Exception:
+            # Chunk 0 of the same upload_id sent twice at once, the other request won
+            db.session.rollback()
+            storage.abort_multipart(blob_key, multipart_id)
+            return jsonify({"success": True, "message": "Chunk 0 was already processed."}), 200
+        publish_quota(user)
 
     # -------------------------------------------------------
     # 2) Handle subsequent chunks (1..total_chunks-1)
     # -------------------------------------------------------
-    else:
-        # If there's no tracking.json at this point, chunk 0 never properly got through
-        if not os.path.exists(tracking_file):
-            return jsonify({
-                "success": False,
-                "error": "Out-of-order chunk. Missing tracking.json (chunk 0 not processed)."
-            }), 400
-
-        # Load existing tracking data
-        with open(tracking_file, 'r') as tf:
-            tracking_data = json.load(tf)
-
-        # If the chunk to be uploaded is not exactly last_uploaded+1, handle as an out-of-order
-        uploaded_chunks = tracking_data.get('uploaded_chunks', [])
-        last_chunk = max(uploaded_chunks)
-        if chunk_index != last_chunk + 1:
-            return jsonify({
-                "success": False,
-                "error": f"Out-of-order chunk. Expected {last_chunk + 1}, got {chunk_index}."
-            }), 400
-
-        # Append this chunk index to the list
-        uploaded_chunks.append(chunk_index)
-        tracking_data['uploaded_chunks'] = uploaded_chunks
-        with open(tracking_file, 'w') as tf:
-            json.dump(tracking_data, tf)
+    elif not session:
+        # Chunk 0 never properly got through
+        return jsonify({
+            "success": False,
+            "error": "Out-of-order chunk. Upload session not found (chunk 0 not processed)."
+        }), 400
+
+    elif chunk_index != session.uploaded_chunks:
+        return jsonify({
+            "success": False,
+            "error": f"Out-of-order chunk. Expected {session.uploaded_chunks}, got {chunk_index}."
+        }), 400
+
+    if session.received_bytes + chunk_length > session.file_size:
+        return jsonify({"success": False, "error": "Upload exceeds the declared file size."}), 400
 
     # -------------------------------------------------------
-    # 3) Save chunk to disk
+    # 3) Store the chunk as the next part of the multipart upload
     # -------------------------------------------------------
-    chunk_filename = f'chunk_{chunk_index}'
-    chunk_path = os.path.join(temp_dir, chunk_filename)
     try:
-        chunk.save(chunk_path)
+        with UPLOAD_PART_SECONDS.time():
+            part = storage.upload_part(session.blob_key, session.multipart_id, chunk_index + 1, chunk.stream)
     except Exception as e:
         return jsonify({"success": False, "error": f"Failed to save chunk. {e}"}), 500
 
+    parts = json.loads(session.parts) + [part]
+    # Compare-and-set, so a chunk sent twice at once is only counted once
+    stored = db.session.execute(
+        db.update(UploadSession).where(
+            UploadSession.id == session.id, UploadSession.uploaded_chunks == chunk_index
+        ).values(
+            parts=json.dumps(parts),
+            uploaded_chunks=chunk_index + 1,
+            received_bytes=UploadSession.received_bytes + chunk_length,
+            updated_at=datetime.utcnow(),
+            expires_at=session_deadline()
+        )
+    ).rowcount
+    db.session.commit()
+    if not stored:
+        return jsonify({"success": False, "error": f"Chunk {chunk_index} was already received."}), 409
+    UPLOAD_CHUNK_BYTES.inc(chunk_length)
+
+    publish_event(user.id, 'upload', {
+        'upload_id': upload_id,
+        'file_name': file_name,
+        'status': 'uploading',
+        'chunks': chunk_index + 1,
+        'total_chunks': total_chunks
+    })
+
     # -------------------------------------------------------
     # 4) If this was the last chunk, assemble the file
     # -------------------------------------------------------
     if chunk_index + 1 == total_chunks:
-        with open(tracking_file, 'r') as tf:
-            tracking_data = json.load(tf)
-        # confirm we have all the chunks
-        if len(tracking_data['uploaded_chunks']) < total_chunks:
-            missing = set(range(total_chunks)) - set(tracking_data['uploaded_chunks'])
-            return jsonify({
-                "success": False,
-                "error": f"Missing chunks: {missing}"
-            }), 400
-
-        # Combine chunks
-        target_folder = os.path.join(user_folder, directory_path) if directory_path else user_folder
-        os.makedirs(target_folder, exist_ok=True)
-        final_file_path = os.path.join(target_folder, file_name)
+        publish_event(user.id, 'upload', {'upload_id': upload_id, 'file_name': file_name, 'status': 'assembling'})
 
+        session_id, blob_key, reserved = session.id, session.blob_key, session.file_size
+        assembly_started = time.perf_counter()
         try:
-            with open(final_file_path, 'wb') as final_file:
-                for i in range(total_chunks):
-                    with open(os.path.join(temp_dir, f'chunk_{i}'), 'rb') as cf:
-                        shutil.copyfileobj(cf, final_file)
-
-            # Clean up
-            shutil.rmtree(temp_dir)
-
-            # Update user used_space
-            final_size = os.path.getsize(final_file_path)
-            user.used_space += final_size
-            db.session.commit()
+            final_size = storage.complete_multipart(blob_key, session.multipart_id, parts)
 
             # Create new File record in DB
             new_file = File(
                 filename=file_name,
-                filepath=final_file_path,
+                filepath=blob_key,
                 filesize=final_size,
                 user_id=user.id,
                 directory_id=directory_id
             )
             db.session.add(new_file)
-
-            try:
-                db.session.commit()
-                log_info(user, "Upload chunk", f"{file_name} ({upload_id}) - File assembled")
-            except Exception:
-                # If there's a race condition and another record got in first,
-                # handle the unique constraint error (already existing file).
-                # Example:
-                # db.session.rollback()
-                # return jsonify({ "success": False, "error": "...some message..." }), 409
-                raise
-
-            return jsonify({"success": True, "message": "File upload completed successfully."}), 200
+            adjust_rollups(user.id, directory_path, final_size, 1)
+            db.session.flush()
+            record_change(user.id, 'create', 'file', new_file.id,
+                          name=file_name, path=f"{directory_path}/{file_name}" if directory_path else file_name,
+                          parent_id=directory_id)
+            db.session.execute(db.delete(UploadSession).where(UploadSession.id == session_id))
+            # The reservation becomes used space in the same transaction that creates the file
+            settle_reservation(user.id, reserved, final_size)
+            db.session.commit()
+            UPLOAD_ASSEMBLY_SECONDS.observe(time.perf_counter() - assembly_started, result='ok')
+            log_info(user, "Upload chunk", f"{file_name} ({upload_id}) - File assembled")
         except Exception as e:
+            db.session.rollback()
+            UPLOAD_ASSEMBLY_SECONDS.observe(time.perf_counter() - assembly_started, result='failed')
+            try:
+                discard_upload(db.session.get(UploadSession, session_id))
+                storage.delete(blob_key)
+            except Exception as cleanup_error:
+                db.session.rollback()
+                log_error(user, "Upload chunk", f"{file_name} ({upload_id}) - Failed to discard upload: {cleanup_error}")
+            publish_quota(user)
+            publish_event(user.id, 'upload', {'upload_id': upload_id, 'file_name': file_name, 'status': 'failed'})
             return jsonify({"success": False, "error": f"Failed to assemble file: {e}"}), 500
 
+        publish_quota(user)
+        publish_event(user.id, 'upload', {'upload_id': upload_id, 'file_name': file_name, 'status': 'complete'})
+        return jsonify({"success": True, "message": "File upload completed successfully."}), 200
+
     # For intermediate chunks
     return jsonify({
         "success": True,
@@ -205,17 +252,79 @@ def cancel_upload():
         log_warning(user, "Cancel upload", "Missing upload_id")
         return jsonify({"success": False, "error": "Missing upload_id."}), 400
 
-    user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user.id))
-    temp_dir = os.path.join(user_folder, f'{upload_id}_temp')
-
-    if os.path.exists(temp_dir):
+    session = UploadSession.query.filter_by(user_id=user.id, upload_id=upload_id).first()
+    if session:
         try:
-            shutil.rmtree(temp_dir)
-            log_info(user, "Cancel upload", f"{upload_id} - Removed temp files")
+            discard_upload(session)
+            publish_quota(user)
+            log_info(user, "Cancel upload", f"{upload_id} - Removed uploaded parts")
             return jsonify({"success": True, "message": "Upload cancelled and temporary files removed."}), 200
         except Exception as e:
-            log_error(user, "Cancel upload", f"{upload_id} - Failed to remove temp files: {e}")
+            db.session.rollback()
+            log_error(user, "Cancel upload", f"{upload_id} - Failed to remove uploaded parts: {e}")
             return jsonify({"success": False, "error": "Failed to remove temporary files."}), 500
     else:
-        log_warning(user, "Cancel upload", f"{upload_id} - Temp directory not found")
+        log_warning(user, "Cancel upload", f"{upload_id} - Upload session not found")
         return jsonify({"success": False, "error": "Upload session not found."}), 404
+
+
+def discard_upload(session, expired_before=None):
+    """
+    Delete `session`, release its reservation and abort its multipart upload. With `expired_before`,
+    a session a chunk kept alive after that moment is left alone.
+    Returns the number of bytes that had been received, or None if the session was not deleted.
+    """
+    if session is None:
+        return None
+    session_id, user_id, reserved, received = session.id, session.user_id, session.file_size, session.received_bytes
+    blob_key, multipart_id = session.blob_key, session.multipart_id
+
+    stmt = db.delete(UploadSession).where(UploadSession.id == session_id)
+    if expired_before is not None:
+        stmt = stmt.where(UploadSession.expires_at <= expired_before)
+    # Only the request that actually deletes the session releases the reservation and aborts the upload
+    if not db.session.execute(stmt).rowcount:
+        db.session.rollback()
+        return None
+    release_reservation(user_id, reserved)
+    db.session.commit()
+
+    current_app.storage.abort_multipart(blob_key, multipart_id)
+    return received
+
+
+def expire_upload_sessions(batch_size=100):
+    """
+    Discard the sessions whose deadline passed, found through the index on expires_at.
+    Returns (sessions expired, bytes reclaimed).
+    """
+    now = datetime.utcnow()
+    sessions = UploadSession.query.filter(
+        UploadSession.expires_at <= now
+    ).order_by(UploadSession.expires_at).limit(batch_size).all()
+
+    expired = reclaimed = 0
+    user_ids = set()
+    for session in sessions:
+        upload = f'{session.upload_id} of user {session.user_id}'
+        user_id = session.user_id
+        try:
+            received = discard_upload(session, expired_before=now)
+        except Exception as e:
+            db.session.rollback()
+            log_error(None, "Upload expiry", f'Failed to discard upload {upload}: {e}')
+            continue
+        if received is not None:
+            expired += 1
+            reclaimed += received
+            user_ids.add(user_id)
+
+    for user_id in user_ids:
+        publish_quota(db.session.get(User, user_id))
+    return expired, reclaimed
+
+
+def next_upload_deadline():
+    deadline = db.session.query(db.func.min(UploadSession.expires_at)).scalar()
+    db.session.rollback()
+    return deadline
@@ -0,0 +1,369 @@
+import os
+import time
+import uuid
+
+from flask import request, g, jsonify, current_app
+from werkzeug.utils import secure_filename
+
+from backend.auth.decorators import login_required
+from backend.storage.blobs import is_blob_key, new_blob_key
+from backend.core.changes import record_change
+from backend.core.events import publish_event
+from backend.core.quota import charge_space, publish_quota
+from backend.core.rollups import adjust_rollups
+from backend.core.tree import subtree_filter
+from backend.core.view import files_bp
+from backend.helpers import log_info, log_error
+from backend.models import db, File, Directory
+from backend.share.share_cache import invalidate_file_shares, invalidate_directory_shares
+
+def user_folder(user_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], str(user_id))
+
+
+def folder_of(user_id, directory_path):
+    return os.path.join(user_folder(user_id), directory_path) if directory_path else user_folder(user_id)
+
+
+def get_target_directory(user, target_id):
+    """
+    Resolve the destination of a move or copy. Returns (found, directory); None is the root.
+    """
+    if target_id is None:
+        return True, None
+    target = Directory.query.filter_by(id=target_id, user_id=user.id).first()
+    return target is not None, target
+
+
+def name_taken(user, parent_id, name, ignore=None):
+    """
+    True if a file or directory called `name` already exists in the directory `parent_id`.
+    """
+    # Both count, a file and a folder can't share a name on disk
+    hits = [('file', file_id) for (file_id,) in db.session.query(File.id).filter(
+        File.user_id == user.id, File.directory_id == parent_id, File.filename == name
+    )]
+    hits += [('directory', dir_id) for (dir_id,) in db.session.query(Directory.id).filter(
+        Directory.user_id == user.id, Directory.parent_dir_id == parent_id, Directory.name == name
+    )]
+    return any(hit != ignore for hit in hits)
+
+
+def move_file(user, file_obj, target, new_name):
+    """
+    Point the file at another directory and/or name. Blobs stay where they are, only files of the
+    legacy layout are renamed on disk: returns their (old, new) paths, the caller commits
+    and undoes the rename if that fails. Returns None when no data has to move.
+    """
+    old_dir_path = file_obj.directory.path if file_obj.directory else None
+    new_dir_path = target.path if target else None
+
+    if old_dir_path != new_dir_path:
+        adjust_rollups(user.id, old_dir_path, -file_obj.filesize, -1)
+        adjust_rollups(user.id, new_dir_path, file_obj.filesize, 1)
+
+    rename = None
+    if not is_blob_key(file_obj.filepath):
+        rename = (file_obj.filepath, os.path.join(folder_of(user.id, new_dir_path), new_name))
+        file_obj.filepath = rename[1]
+    file_obj.directory_id = target.id if target else None
+    file_obj.filename = new_name
+    record_change(user.id, 'move', 'file', file_obj.id, name=new_name,
+                  path=f"{new_dir_path}/{new_name}" if new_dir_path else new_name, parent_id=file_obj.directory_id)
+    return rename
+
+
+def move_directory(user, directory, target, new_name):
+    """
+    Move and/or rename a directory. The paths of the whole subtree are rewritten with one UPDATE.
+    Files of the legacy layout below it get their filepath rewritten the same way and move with
+    a single rename of the folder: returns the (old, new) folders, the caller commits and undoes
+    the rename if that fails. Blobs don't move.
+    """
+    old_path = directory.path
+    new_path = f"{target.path}/{new_name}" if target else new_name
+    old_folder = folder_of(user.id, old_path)
+    new_folder = folder_of(user.id, new_path)
+    subtree_ids = db.session.query(Directory.id).filter(subtree_filter(user.id, directory.id, old_path))
+
+    adjust_rollups(user.id, old_path, -directory.total_size, -directory.total_files, include_self=False)
+
+    db.session.execute(
+        db.update(File).where(
+            File.user_id == user.id,
+            File.directory_id.in_(subtree_ids),
+            File.filepath.startswith(f"{old_folder}{os.sep}", autoescape=True)
+        ).values(
+            filepath=db.literal(new_folder) + db.func.substr(File.filepath, len(old_folder) + 1)
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.update(Directory).where(
+            Directory.id.in_([dir_id for (dir_id,) in subtree_ids])
+        ).values(
+            path=db.literal(new_path) + db.func.substr(Directory.path, len(old_path) + 1)
+        ).execution_options(synchronize_session=False)
+    )
+    directory.name = new_name
+    directory.parent_dir_id = target.id if target else None
+    directory.path = new_path
+
+    adjust_rollups(user.id, new_path, directory.total_size, directory.total_files, include_self=False)
+    record_change(user.id, 'move', 'directory', directory.id, name=new_name, path=new_path,
+                  parent_id=directory.parent_dir_id)
+    return old_folder, new_folder
+
+
+def commit_with_renames(renames):
+    """
+    Rename on disk, then commit. If anything fails, the renames done so far are reverted.
+    """
+    done = []
+    try:
+        for old, new in filter(None, renames):
+            if os.path.exists(old):
+                os.makedirs(os.path.dirname(new), exist_ok=True)
+                os.rename(old, new)
+                done.append((old, new))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for old, new in reversed(done):
+            os.rename(new, old)
+        raise
+
+
+def invalidate_moved_shares(user, file_ids, directories):
+    # Cached share resolutions carry file paths and directory paths, both change on a move
+    invalidate_file_shares(file_ids)
+    for directory in directories:
+        subtree_ids = db.session.query(Directory.id).filter(subtree_filter(user.id, directory.id, directory.path))
+        invalidate_directory_shares(subtree_ids)
+        invalidate_file_shares(db.session.query(File.id).filter(File.directory_id.in_(subtree_ids)))
+
+
+@files_bp.route('/rename_file/<int:file_id>', methods=['POST'])
+@login_required
+def rename_file(file_id):
+    user = g.user
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+
+    file_obj = File.query.filter_by(id=file_id, user_id=user.id).first()
+    if not file_obj:
+        return jsonify({"success": False, "error": "File not found"}), 404
+    if not name or name != secure_filename(name):
+        return jsonify({"success": False, "error": "Invalid file name"}), 400
+    if name_taken(user, file_obj.directory_id, name, ignore=('file', file_obj.id)):
+        return jsonify({"success": False, "error": "An item with this name already exists here."}), 409
+
+    renames = [move_file(user, file_obj, file_obj.directory, name)]
+    try:
+        commit_with_renames(renames)
+    except OSError as e:
+        log_error(user, "Rename file", f"{file_id}: {e}")
+        return jsonify({"success": False, "error": "Failed to rename the file."}), 500
+    invalidate_file_shares([file_id])
+
+    log_info(user, "Rename file", f"{file_id} renamed to {name}")
+    return jsonify({"success": True, "message": "File renamed"}), 200
+
+
+@files_bp.route('/rename_directory/<int:directory_id>', methods=['POST'])
+@login_required
+def rename_directory(directory_id):
+    user = g.user
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+
+    directory = Directory.query.filter_by(id=directory_id, user_id=user.id).first()
+    if not directory:
+        return jsonify({"success": False, "error": "Directory not found"}), 404
+    if not name or name != secure_filename(name):
+        return jsonify({"success": False, "error": "Invalid directory name"}), 400
+    if name_taken(user, directory.parent_dir_id, name, ignore=('directory', directory.id)):
+        return jsonify({"success": False, "error": "An item with this name already exists here."}), 409
+
+    renames = [move_directory(user, directory, directory.parent_dir, name)]
+    try:
+        commit_with_renames(renames)
+    except OSError as e:
+        log_error(user, "Rename directory", f"{directory_id}: {e}")
+        return jsonify({"success": False, "error": "Failed to rename the directory."}), 500
+    invalidate_moved_shares(user, [], [directory])
+
+    log_info(user, "Rename directory", f"{directory_id} renamed to {name}")
+    return jsonify({"success": True, "message": "Directory renamed"}), 200
+
+
+def load_selection(user, data):
+    """
+    Files and directories of a move or copy request plus its target, or an error response.
+    """
+    file_ids = data.get('file_ids', [])
+    dir_ids = data.get('dir_ids', [])
+    if not isinstance(file_ids, list) or not isinstance(dir_ids, list):
+        return None, (jsonify({"success": False, "error": "file_ids and dir_ids should be lists."}), 400)
+
+    found, target = get_target_directory(user, data.get('target_dir_id'))
+    if not found:
+        return None, (jsonify({"success": False, "error": "Invalid target directory"}), 400)
+
+    files = File.query.options(db.joinedload(File.directory)).filter(
+        File.id.in_(file_ids), File.user_id == user.id
+    ).all()
+    directories = Directory.query.filter(Directory.id.in_(dir_ids), Directory.user_id == user.id).all()
+    if len(files) != len(file_ids):
+        return None, (jsonify({"success": False, "error": "Some file_ids are invalid or not owned by user."}), 400)
+    if len(directories) != len(dir_ids):
+        return None, (jsonify({"success": False, "error": "Some dir_ids are invalid or not owned by user."}), 400)
+
+    if target:
+        for d in directories:
+            if target.path == d.path or target.path.startswith(f"{d.path}/"):
+                return None, (jsonify({"success": False, "error": f"Can't put {d.name} inside itself."}), 400)
+
+    names = [f.filename for f in files] + [d.name for d in directories]
+    if len(set(names)) != len(names):
+        return None, (jsonify({"success": False, "error": "The selection contains items with the same name."}), 409)
+    return (files, directories, target), None
+
+
+@files_bp.route('/move_items', methods=['POST'])
+@login_required
+def move_items():
+    user = g.user
+    selection, error = load_selection(user, request.get_json(silent=True) or {})
+    if error:
+        return error
+    files, directories, target = selection
+    target_id = target.id if target else None
+
+    files = [f for f in files if f.directory_id != target_id]
+    directories = [d for d in directories if d.parent_dir_id != target_id]
+    for name, kind, item_id in [(f.filename, 'file', f.id) for f in files] + [(d.name, 'directory', d.id) for d in directories]:
+        if name_taken(user, target_id, name, ignore=(kind, item_id)):
+            return jsonify({"success": False, "error": f"An item named {name} already exists in the target."}), 409
+
+    # Deepest first, so a selected directory inside another selected one still has its own path
+    directories.sort(key=lambda d: d.path.count('/'), reverse=True)
+    renames = [move_file(user, f, target, f.filename) for f in files]
+    renames += [move_directory(user, d, target, d.name) for d in directories]
+    try:
+        commit_with_renames(renames)
+    except OSError as e:
+        log_error(user, "Move items", str(e))
+        return jsonify({"success": False, "error": "Failed to move the items."}), 500
+    invalidate_moved_shares(user, [f.id for f in files], directories)
+
+    log_info(user, "Move items", f"Moved {len(files)} files and {len(directories)} directories to {target_id}")
+    return jsonify({
+        "success": True,
+        "message": f"Moved {len(files)} files and {len(directories)} directories."
+    }), 200
+
+
+@files_bp.route('/copy_items', methods=['POST'])
+@login_required
+def copy_items():
+    user = g.user
+    selection, error = load_selection(user, request.get_json(silent=True) or {})
+    if error:
+        return error
+    files, directories, target = selection
+    target_id = target.id if target else None
+    target_path = target.path if target else None
+
+    for name in [f.filename for f in files] + [d.name for d in directories]:
+        if name_taken(user, target_id, name):
+            return jsonify({"success": False, "error": f"An item named {name} already exists in the target."}), 409
+
+    # Everything below the selected directories, in two queries
+    subtrees = {
+        d.id: Directory.query.filter(subtree_filter(user.id, d.id, d.path)).order_by(Directory.path).all()
+        for d in directories
+    }
+    all_dir_ids = [sub.id for subtree in subtrees.values() for sub in subtree]
+    subtree_files = File.query.filter(File.user_id == user.id, File.directory_id.in_(all_dir_ids)).all() if all_dir_ids else []
+
+    total_size = sum(f.filesize for f in files) + sum(f.filesize for f in subtree_files)
+    # Fail fast here, the authoritative check is the atomic charge before the commit
+    if user.quota and user.used_space + user.reserved_space + total_size > user.quota:
+        return jsonify({"success": False, "error": "Not enough storage space for the copy."}), 400
+
+    # Copying the blobs can take a while, the user's streams follow it as a job
+    job = {'job_id': uuid.uuid4().hex, 'kind': 'copy', 'status': 'running', 'done': 0,
+           'total': len(files) + len(subtree_files)}
+    publish_event(user.id, 'job', job)
+    reported_at = time.monotonic()
+
+    created_keys = []
+    copied = []  # (source File, destination directory id)
+    try:
+        for d in directories:
+            new_root_path = f"{target_path}/{d.name}" if target_path else d.name
+            new_ids = {}
+            # Sorted by path, so every parent is created before its children
+            for sub in subtrees[d.id]:
+                new_path = new_root_path + sub.path[len(d.path):]
+                parent_id = target_id if sub.id == d.id else new_ids[sub.parent_dir_id]
+                copy = Directory(name=sub.name, user_id=user.id, parent_dir_id=parent_id, path=new_path,
+                                 total_size=sub.total_size, total_files=sub.total_files)
+                db.session.add(copy)
+                db.session.flush()
+                new_ids[sub.id] = copy.id
+                if sub.id == d.id:
+                    adjust_rollups(user.id, new_path, d.total_size, d.total_files, include_self=False)
+                    record_change(user.id, 'create', 'directory', copy.id, name=copy.name, path=new_path,
+                                  parent_id=parent_id)
+            copied += [(f, new_ids[f.directory_id]) for f in subtree_files if f.directory_id in new_ids]
+
+        copied += [(f, target_id) for f in files]
+        new_files = []
+        for source, dir_id in copied:
+            key = new_blob_key()
+            current_app.storage.copy(source.filepath, key)
+            created_keys.append(key)
+            new_files.append(File(filename=source.filename, filepath=key, filesize=source.filesize,
+                                  content_hash=source.content_hash,
+                                  user_id=user.id, directory_id=dir_id))
+            if time.monotonic() - reported_at >= 1:
+                publish_event(user.id, 'job', dict(job, done=len(created_keys)))
+                reported_at = time.monotonic()
+        db.session.add_all(new_files)
+        db.session.flush()
+
+        loose_files = new_files[len(new_files) - len(files):]
+        adjust_rollups(user.id, target_path, sum(f.filesize for f in loose_files), len(loose_files))
+        for f in loose_files:
+            record_change(user.id, 'create', 'file', f.id, name=f.filename,
+                          path=f"{target_path}/{f.filename}" if target_path else f.filename, parent_id=target_id)
+        charged = charge_space(user.id, total_size)
+        if charged:
+            db.session.commit()
+    except Exception as e:
+        # OSError from the local disk, ClientError from S3
+        log_error(user, "Copy items", str(e))
+        charged = None
+
+    if not charged:
+        db.session.rollback()
+        for key in created_keys:
+            try:
+                current_app.storage.delete(key)
+            except Exception:
+                pass
+        publish_event(user.id, 'job', dict(job, status='failed'))
+        if charged is None:
+            return jsonify({"success": False, "error": "Failed to copy the items."}), 500
+        # Other uploads or copies used up the space meanwhile
+        return jsonify({"success": False, "error": "Not enough storage space for the copy."}), 400
+
+    publish_quota(user)
+    publish_event(user.id, 'job', dict(job, status='complete', done=job['total']))
+
+    log_info(user, "Copy items", f"Copied {len(files)} files and {len(directories)} directories to {target_id}")
+    return jsonify({
+        "success": True,
+        "message": f"Copied {len(files)} files and {len(directories)} directories."
+    }), 201
@@ -0,0 +1,123 @@
+import click
+from flask import g, jsonify, request
+
+from backend.auth.decorators import admin_required
+from backend.core.events import publish_event
+from backend.core.view import files_bp
+from backend.helpers import log_info
+from backend.models import db, User, File, UploadSession
+
+# used_space and reserved_space are never read, changed in Python and written back: concurrent uploads
+# and deletes of the same user would overwrite each other. Every change is a single UPDATE with an
+# increment, so it is atomic without holding a lock beyond the statement's own row lock. Callers issue
+# it as the last statement before their commit to keep that row lock short.
+
+
+def fits_quota(nbytes):
+    # A quota of 0 means unlimited
+    return db.or_(
+        User.quota.is_(None),
+        User.quota == 0,
+        User.used_space + User.reserved_space + nbytes <= User.quota
+    )
+
+
+def reserve_space(user_id, nbytes):
+    """
+    Reserve `nbytes` for an upload if they fit the quota next to the used and already reserved space.
+    """
+    return db.session.execute(
+        db.update(User).where(User.id == user_id, fits_quota(nbytes)).values(
+            reserved_space=User.reserved_space + nbytes
+        )
+    ).rowcount == 1
+
+
+def release_reservation(user_id, nbytes):
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(reserved_space=User.reserved_space - nbytes)
+    )
+
+
+def settle_reservation(user_id, reserved, nbytes):
+    """
+    Turn the reservation of a completed upload into used space of its actual size.
+    """
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(
+            used_space=User.used_space + nbytes,
+            reserved_space=User.reserved_space - reserved
+        )
+    )
+
+
+def charge_space(user_id, nbytes):
+    """
+    Add `nbytes` to the used space if they fit the quota, e.g. for a copy.
+    """
+    return db.session.execute(
+        db.update(User).where(User.id == user_id, fits_quota(nbytes)).values(
+            used_space=User.used_space + nbytes
+        )
+    ).rowcount == 1
+
+
+def free_space(user_id, nbytes):
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(used_space=User.used_space - nbytes)
+    )
+
+
+def publish_quota(user):
+    """
+    Send the committed used and reserved space of `user` to their event streams.
+    """
+    db.session.refresh(user)
+    publish_event(user.id, 'quota', {
+        'used_space': user.used_space,
+        'reserved_space': user.reserved_space,
+        'quota': user.quota
+    })
+
+
+def recompute_quota(user_id=None):
+    """
+    Set used_space and reserved_space from the ground truth: the sizes of the user's files and
+    of their upload sessions. One statement per call, so concurrent changes are never half applied.
+    Returns the number of users whose values were wrong.
+    """
+    used = db.select(db.func.coalesce(db.func.sum(File.filesize), 0)).where(
+        File.user_id == User.id
+    ).scalar_subquery()
+    reserved = db.select(db.func.coalesce(db.func.sum(UploadSession.file_size), 0)).where(
+        UploadSession.user_id == User.id
+    ).scalar_subquery()
+
+    stmt = db.update(User).where(
+        db.or_(User.used_space.is_(None), User.used_space != used, User.reserved_space != reserved)
+    ).values(used_space=used, reserved_space=reserved)
+    if user_id is not None:
+        stmt = stmt.where(User.id == user_id)
+    fixed = db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    return fixed
+
+
+@files_bp.route('/quota/recompute', methods=['POST'])
+@admin_required
+def recompute_quota_endpoint():
+    """
+    Repair used and reserved space. Body can have: { "user_id": 1 } to limit it to one user.
+    """
+    data = request.get_json(silent=True) or {}
+    fixed = recompute_quota(data.get('user_id'))
+    log_info(g.user, "Quota", f"Recomputed quota usage, {fixed} users corrected.")
+    return jsonify({"success": True, "corrected": fixed}), 200
+
+
+@files_bp.cli.command('recompute-quota')
+@click.option('--user-id', type=int, default=None, help='Only repair the usage of this user.')
+def recompute_quota_command(user_id):
+    """Recompute used and reserved space from the File and UploadSession tables."""
+    fixed = recompute_quota(user_id)
+    click.echo(f'Recomputed quota usage, {fixed} users corrected.')
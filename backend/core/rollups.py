@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+import click
+from flask import request, g, jsonify
+
+from backend.auth.decorators import admin_required
+from backend.core.tree import ancestor_paths
+from backend.core.view import files_bp
+from backend.helpers import log_info
+from backend.models import db, File, Directory
+
+
+def adjust_rollups(user_id, path, size_delta, files_delta, include_self=True):
+    """
+    Add deltas to the recursive size and file count of the directory at `path`
+    and all of its ancestors, as a single atomic UPDATE.
+    Call it in the same transaction as the change it accounts for.
+    """
+    if not path or (size_delta == 0 and files_delta == 0):
+        return
+    paths = ancestor_paths(path)
+    if not include_self:
+        paths = paths[:-1]
+    if not paths:
+        return
+
+    db.session.execute(
+        db.update(Directory).where(
+            Directory.user_id == user_id,
+            Directory.path.in_(paths)
+        ).values(
+            total_size=Directory.total_size + size_delta,
+            total_files=Directory.total_files + files_delta
+        )
+    )
+
+
+def recompute_rollups(user_id=None):
+    """
+    Rebuild the rollups of every directory (of one user, or of everyone) from the File table.
+    Returns the number of directories written.
+    """
+    directories = db.session.query(Directory.id, Directory.user_id, Directory.path)
+    direct = db.session.query(
+        File.directory_id, db.func.count(File.id), db.func.coalesce(db.func.sum(File.filesize), 0)
+    ).filter(File.directory_id.isnot(None)).group_by(File.directory_id)
+    if user_id is not None:
+        directories = directories.filter(Directory.user_id == user_id)
+        direct = direct.filter(File.user_id == user_id)
+
+    directories = directories.all()
+    paths_by_id = {d.id: (d.user_id, d.path) for d in directories}
+
+    totals = defaultdict(lambda: [0, 0])  # (user_id, path) -> [size, files]
+    for directory_id, file_count, size in direct:
+        if directory_id not in paths_by_id:
+            continue
+        owner_id, path = paths_by_id[directory_id]
+        for ancestor in ancestor_paths(path):
+            totals[(owner_id, ancestor)][0] += size
+            totals[(owner_id, ancestor)][1] += file_count
+
+    updates = []
+    for d in directories:
+        size, file_count = totals.get((d.user_id, d.path), (0, 0))
+        updates.append({'b_id': d.id, 'b_size': size, 'b_files': file_count})
+
+    if updates:
+        table = Directory.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('b_id')).values(
+                total_size=db.bindparam('b_size'),
+                total_files=db.bindparam('b_files')
+            ),
+            updates
+        )
+    db.session.commit()
+    return len(updates)
+
+
+@files_bp.route('/rollups/recompute', methods=['POST'])
+@admin_required
+def recompute_rollups_endpoint():
+    """
+    Repair directory sizes and file counts. Body can have: { "user_id": 1 } to limit it to one user.
+    """
+    data = request.get_json(silent=True) or {}
+    count = recompute_rollups(data.get('user_id'))
+    log_info(g.user, "Rollups", f"Recomputed rollups of {count} directories.")
+    return jsonify({"success": True, "directories": count}), 200
+
+
+@files_bp.cli.command('recompute-rollups')
+@click.option('--user-id', type=int, default=None, help='Only repair the directories of this user.')
+def recompute_rollups_command(user_id):
+    """Recompute directory sizes and file counts from the File table."""
+    count = recompute_rollups(user_id)
+    click.echo(f'Recomputed rollups of {count} directories.')
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import re
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask import current_app, jsonify, request
+
+from backend.auth.decorators import admin_required
+from backend.core.view import files_bp
+from backend.models import db, File, User, Checkpoint, PendingBlobDelete, ScrubFinding
+from backend.storage.blobs import COLD_PREFIX
+
+SCRUB_CHECKPOINT = 'storage_scrub'
+SCRUB_PHASES = ('files', 'blobs', 'quota')
+
+# Only keys of this shape are considered orphans, anything else below the storage root is left alone
+BLOB_KEY_RE = re.compile(r'^(' + re.escape(COLD_PREFIX) + r')?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}$')
+
+
+class Throttle:
+    """
+    Keep the bytes read by the scrubber below `rate` bytes per second, 0 means unlimited.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        self.consumed += nbytes
+        ahead = self.consumed / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+        elif ahead < -1:
+            # Idle time isn't saved up for a burst later
+            self.started, self.consumed = time.monotonic(), 0
+
+
+def load_scrub_state():
+    checkpoint = db.session.get(Checkpoint, SCRUB_CHECKPOINT)
+    state = json.loads(checkpoint.value) if checkpoint and checkpoint.value else {}
+    state.setdefault('phase', SCRUB_PHASES[0])
+    state.setdefault('position', None)
+    state.setdefault('pass_started_at', None)
+    state.setdefault('last_pass_completed_at', None)
+    return state
+
+
+def save_scrub_state(state):
+    checkpoint = db.session.get(Checkpoint, SCRUB_CHECKPOINT) or Checkpoint(name=SCRUB_CHECKPOINT)
+    checkpoint.value = json.dumps(state)
+    db.session.add(checkpoint)
+
+
+def report(kind, file_id=None, user_id=None, path=None, details=None, action=None):
+    """
+    Record a finding, or refresh the open finding about the same object seen in an earlier pass.
+    """
+    finding = ScrubFinding.query.filter_by(
+        kind=kind, file_id=file_id, user_id=user_id, path=path, resolved=False
+    ).first()
+    now = datetime.utcnow()
+    if finding is None:
+        finding = ScrubFinding(kind=kind, file_id=file_id, user_id=user_id, path=path, first_seen_at=now)
+        db.session.add(finding)
+    finding.details = details
+    finding.action = action
+    finding.last_seen_at = now
+    # Findings the scrubber fixed itself are closed right away
+    finding.resolved = action is not None
+    return finding
+
+
+def hash_blob(key, throttle):
+    digest = hashlib.sha256()
+    for chunk in current_app.storage.open(key):
+        digest.update(chunk)
+        throttle.consume(len(chunk))
+    return digest.hexdigest()
+
+
+def scrub_files(position, batch_size, throttle, verify_hashes):
+    """
+    Check a batch of File rows against the storage: missing blobs, size mismatches and,
+    when hashes are verified, corruption. A file without a hash gets one recorded.
+    Returns the new position, or None when the phase is done.
+    """
+    rows = db.session.query(File.id, File.user_id, File.filepath, File.filesize, File.content_hash).filter(
+        File.id > (position or 0)
+    ).order_by(File.id).limit(batch_size).all()
+    # Don't hold a transaction open while reading blobs
+    db.session.rollback()
+    if not rows:
+        return None
+
+    storage = current_app.storage
+    healthy, hashes = [], []
+    for row in rows:
+        blob = storage.stat(row.filepath)
+        if blob is None:
+            report('missing_file', file_id=row.id, user_id=row.user_id, path=row.filepath)
+            continue
+        if blob.size != row.filesize:
+            report('size_mismatch', file_id=row.id, user_id=row.user_id, path=row.filepath,
+                   details=f'{row.filesize} bytes expected, {blob.size} stored')
+            continue
+        if verify_hashes:
+            try:
+                content_hash = hash_blob(row.filepath, throttle)
+            except FileNotFoundError:
+                continue  # deleted or moved meanwhile, looked at again in the next pass
+            if row.content_hash is None:
+                hashes.append({'b_id': row.id, 'b_old': row.filepath, 'b_hash': content_hash})
+            elif content_hash != row.content_hash:
+                report('corrupt', file_id=row.id, user_id=row.user_id, path=row.filepath,
+                       details=f'sha256 {content_hash}, {row.content_hash} expected')
+                continue
+        healthy.append(row.id)
+
+    if hashes:
+        # Only if the row still points at the blob that was hashed
+        table = File.__table__
+        db.session.execute(
+            table.update().where(
+                table.c.id == db.bindparam('b_id'), table.c.filepath == db.bindparam('b_old')
+            ).values(content_hash=db.bindparam('b_hash')),
+            hashes
+        )
+    if healthy:
+        checked = ['missing_file', 'size_mismatch'] + (['corrupt'] if verify_hashes else [])
+        db.session.execute(
+            db.update(ScrubFinding).where(
+                ScrubFinding.file_id.in_(healthy), ScrubFinding.kind.in_(checked), ScrubFinding.resolved.is_(False)
+            ).values(resolved=True)
+        )
+    return rows[-1].id
+
+
+def scrub_blobs(position, batch_size, orphan_min_age):
+    """
+    Check a batch of stored blobs against the database. Blobs no row refers to are queued for the
+    blob reclaimer, unless they are younger than `orphan_min_age` seconds and may belong to an
+    upload or copy that is about to commit. Returns the new position, or None when the phase is done.
+    """
+    storage = current_app.storage
+    keys = [key for key in islice(storage.iter_keys(position), batch_size)]
+    if not keys:
+        return None
+
+    candidates = [key for key in keys if BLOB_KEY_RE.match(key)]
+    referenced = {
+        path for (path,) in db.session.query(File.filepath).filter(File.filepath.in_(candidates))
+    } | {
+        path for (path,) in db.session.query(PendingBlobDelete.path).filter(PendingBlobDelete.path.in_(candidates))
+    } if candidates else set()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=orphan_min_age)
+    for key in candidates:
+        if key in referenced:
+            continue
+        blob = storage.stat(key)
+        if blob is None or blob.modified > cutoff:
+            continue
+        db.session.add(PendingBlobDelete(path=key, kind='file'))
+        report('orphan_blob', path=key, details=f'{blob.size} bytes', action='queued_delete')
+    return keys[-1]
+
+
+def scrub_quota():
+    """
+    Report users whose used_space differs from the sizes of their files.
+    """
+    sizes = db.session.query(
+        File.user_id, db.func.sum(File.filesize).label('size')
+    ).group_by(File.user_id).subquery()
+    rows = db.session.query(User.id, User.used_space, db.func.coalesce(sizes.c.size, 0)).outerjoin(
+        sizes, sizes.c.user_id == User.id
+    ).filter(User.used_space != db.func.coalesce(sizes.c.size, 0)).all()
+
+    for user_id, used_space, size in rows:
+        report('quota_drift', user_id=user_id, details=f'used_space {used_space}, files {int(size)}')
+    db.session.execute(
+        db.update(ScrubFinding).where(
+            ScrubFinding.kind == 'quota_drift',
+            ScrubFinding.resolved.is_(False),
+            ScrubFinding.user_id.notin_([user_id for user_id, _, _ in rows])
+        ).values(resolved=True)
+    )
+
+
+def scrub_step(config, throttle):
+    """
+    Scrub one batch of the current phase and checkpoint the position.
+    Returns True when this step completed a whole pass.
+    """
+    state = load_scrub_state()
+    if state['pass_started_at'] is None:
+        state['pass_started_at'] = datetime.utcnow().isoformat()
+
+    phase = state['phase']
+    if phase == 'files':
+        position = scrub_files(state['position'], config['SCRUB_BATCH_SIZE'], throttle, config['SCRUB_VERIFY_HASHES'])
+    elif phase == 'blobs':
+        position = scrub_blobs(state['position'], config['SCRUB_BATCH_SIZE'], config['SCRUB_ORPHAN_MIN_AGE'])
+    else:
+        position = scrub_quota()
+
+    completed = False
+    if position is None:
+        next_phase = SCRUB_PHASES.index(phase) + 1
+        if next_phase == len(SCRUB_PHASES):
+            state['last_pass_completed_at'] = datetime.utcnow().isoformat()
+            state['pass_started_at'] = None
+            next_phase = 0
+            completed = True
+        state['phase'] = SCRUB_PHASES[next_phase]
+    state['position'] = position
+    save_scrub_state(state)
+    db.session.commit()
+    return completed
+
+
+def scrub_pass(config, echo=None):
+    """
+    Run the scrubber until the current pass is complete.
+    """
+    throttle = Throttle(config['SCRUB_BYTES_PER_SECOND'])
+    while not scrub_step(config, throttle):
+        if echo:
+            state = load_scrub_state()
+            echo(f"Scrubbing {state['phase']} after {state['position']}")
+        time.sleep(config['SCRUB_PAUSE'])
+
+
+@files_bp.route('/scrub', methods=['GET'])
+@admin_required
+def scrub_status():
+    """
+    Progress of the storage scrubber and its open findings. ?resolved=1 lists the closed ones instead.
+    """
+    resolved = request.args.get('resolved', default=0, type=int) == 1
+    limit = request.args.get('limit', default=100, type=int)
+
+    counts = dict(
+        db.session.query(ScrubFinding.kind, db.func.count(ScrubFinding.id))
+        .filter(ScrubFinding.resolved.is_(resolved)).group_by(ScrubFinding.kind)
+    )
+    findings = ScrubFinding.query.filter(ScrubFinding.resolved.is_(resolved)).order_by(
+        ScrubFinding.last_seen_at.desc()
+    ).limit(max(1, min(limit, 1000))).all()
+
+    return jsonify({
+        'state': load_scrub_state(),
+        'counts': counts,
+        'findings': [{
+            'id': f.id,
+            'kind': f.kind,
+            'file_id': f.file_id,
+            'user_id': f.user_id,
+            'path': f.path,
+            'details': f.details,
+            'action': f.action,
+            'first_seen_at': f.first_seen_at.isoformat(),
+            'last_seen_at': f.last_seen_at.isoformat()
+        } for f in findings]
+    }), 200
+
+
+@files_bp.cli.command('scrub')
+@click.option('--no-hashes', is_flag=True, help='Only check existence and sizes, don\'t read file contents.')
+def scrub_command(no_hashes):
+    """Run the storage scrubber until the current pass is complete."""
+    config = dict(current_app.config)
+    if no_hashes:
+        config['SCRUB_VERIFY_HASHES'] = False
+    scrub_pass(config, echo=click.echo)
+    counts = dict(
+        db.session.query(ScrubFinding.kind, db.func.count(ScrubFinding.id))
+        .filter(ScrubFinding.resolved.is_(False)).group_by(ScrubFinding.kind)
+    )
+    click.echo(f'Scrub pass complete, open findings: {counts or "none"}')
@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from flask import request, g, jsonify
+
+from backend.auth.decorators import login_required
+from backend.core.pagination import encode_cursor, decode_cursor, get_page_size
+from backend.core.versioning import listing_etag
+from backend.core.view import files_bp, cached_listing
+from backend.helpers import log_warning
+from backend.models import db, File, Directory
+
+# Trigram indexes let PostgreSQL answer substring, prefix and suffix (extension) LIKE
+# filters from the index instead of scanning every file of the user.
+POSTGRES_SEARCH_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_file_filename_trgm ON file USING gin (filename gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_directory_path_trgm ON directory USING gin (path gin_trgm_ops)",
+]
+
+
+def ensure_search_indexes():
+    """
+    Create the search indexes if the database supports them. Must run inside an app context.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    try:
+        for statement in POSTGRES_SEARCH_INDEXES:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log_warning(None, "Search", f"Could not create trigram indexes, search falls back to scans: {e}")
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+@files_bp.route('/search', methods=['GET'])
+@login_required
+def search():
+    """
+    Search the user's files across the whole tree.
+
+    Query parameters (all optional, combined with AND):
+        q: text to look for in the filename, case-insensitive
+        match: 'substring' (default) or 'prefix'
+        path: text to look for in the path of the containing directory
+        ext: comma-separated extensions, e.g. ext=mp4,mkv
+        min_size, max_size: size range in bytes
+        after, before: upload time range as ISO 8601 dates
+        limit, cursor: pagination, results are ordered by filename
+    """
+    user = g.user
+    q = request.args.get('q', '').strip()
+    match = request.args.get('match', 'substring')
+    path = request.args.get('path', '').strip()
+    extensions = [e.strip().lstrip('.').lower() for e in request.args.get('ext', '').split(',') if e.strip()]
+    min_size = request.args.get('min_size', type=int)
+    max_size = request.args.get('max_size', type=int)
+    cursor = request.args.get('cursor')
+    limit = get_page_size()
+
+    if match not in ('substring', 'prefix'):
+        return jsonify({'error': 'match must be substring or prefix'}), 400
+
+    try:
+        after = datetime.fromisoformat(request.args['after']) if request.args.get('after') else None
+        before = datetime.fromisoformat(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        return jsonify({'error': 'after and before must be ISO 8601 dates'}), 400
+
+    last = None
+    if cursor:
+        last = decode_cursor(cursor)
+        if not last or len(last) != 2:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    def build():
+        query = db.session.query(
+            File.id, File.filename, File.filesize, File.upload_time, File.directory_id, Directory.path
+        ).outerjoin(Directory, File.directory_id == Directory.id).filter(File.user_id == user.id)
+
+        if q:
+            pattern = f"{escape_like(q)}%" if match == 'prefix' else f"%{escape_like(q)}%"
+            query = query.filter(File.filename.ilike(pattern, escape='\\'))
+        if path:
+            query = query.filter(Directory.path.ilike(f"%{escape_like(path)}%", escape='\\'))
+        if extensions:
+            query = query.filter(db.or_(*[
+                File.filename.ilike(f"%.{escape_like(ext)}", escape='\\') for ext in extensions
+            ]))
+        if min_size is not None:
+            query = query.filter(File.filesize >= min_size)
+        if max_size is not None:
+            query = query.filter(File.filesize <= max_size)
+        if after is not None:
+            query = query.filter(File.upload_time >= after)
+        if before is not None:
+            query = query.filter(File.upload_time < before)
+        if last:
+            query = query.filter(db.tuple_(File.filename, File.id) > db.tuple_(*last))
+
+        rows = query.order_by(File.filename, File.id).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1].filename, rows[-1].id])
+
+        return {
+            'results': [
+                {
+                    'id': row.id,
+                    'filename': row.filename,
+                    'path': f"{row.path}/{row.filename}" if row.path else row.filename,
+                    'directory_id': row.directory_id,
+                    'size': row.filesize,
+                    'upload_time': row.upload_time.isoformat() if row.upload_time else None
+                }
+                for row in rows
+            ],
+            'next_cursor': next_cursor
+        }
+
+    etag = listing_etag(user, 'search', request.query_string)
+    return cached_listing(etag, build)
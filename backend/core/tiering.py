@@ -0,0 +1,188 @@
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify
+
+from backend.auth.decorators import admin_required
+from backend.core.view import files_bp
+from backend.helpers import log_error, log_warning
+from backend.models import db, File, PendingBlobDelete
+from backend.share.share_cache import invalidate_file_shares
+from backend.storage.blobs import COLD_PREFIX, new_blob_key
+from backend.storage.tiered import TieredStorage
+
+
+@files_bp.record
+def on_load(state):
+    app = state.app
+    app.file_access = FileAccessTracker()
+
+
+class FileAccessTracker:
+    """
+    Collects file reads in memory and writes read_count and last_read_at in batches,
+    so downloads never pay for a synchronous UPDATE. Counters are per worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # file_id -> [reads, last_read_at]
+
+    def record_read(self, file_id):
+        with self._lock:
+            counters = self._pending.setdefault(file_id, [0, None])
+            counters[0] += 1
+            counters[1] = datetime.utcnow()
+
+    def flush(self):
+        """
+        Write all pending counters in one batch and return the ids of the files that were read.
+        Must run inside an app context. On failure the batch is merged back and retried on the next flush.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return []
+
+        try:
+            table = File.__table__
+            last_read = db.case(
+                (db.or_(table.c.last_read_at.is_(None), table.c.last_read_at < db.bindparam('b_last')),
+                 db.bindparam('b_last')),
+                else_=table.c.last_read_at
+            )
+            db.session.execute(
+                table.update().where(table.c.id == db.bindparam('b_id')).values(
+                    read_count=table.c.read_count + db.bindparam('b_reads'),
+                    last_read_at=last_read
+                ),
+                [{'b_id': file_id, 'b_reads': reads, 'b_last': last} for file_id, (reads, last) in batch.items()]
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._merge_back(batch)
+            log_error(None, "File access", f"Failed to flush {len(batch)} read counters: {e}")
+            return []
+        return list(batch)
+
+    def _merge_back(self, batch):
+        with self._lock:
+            for file_id, (reads, last) in batch.items():
+                counters = self._pending.setdefault(file_id, [0, None])
+                counters[0] += reads
+                if last and (counters[1] is None or last > counters[1]):
+                    counters[1] = last
+
+
+def tiering_enabled():
+    return isinstance(current_app.storage.backend, TieredStorage)
+
+
+def move_files_to_tier(rows, cold):
+    """
+    Copy the blobs of `rows` (file id, filepath) to the cold or the hot tier and switch the rows over
+    with a compare-and-set on the old filepath, like `flask files migrate-blobs`. The old blob is queued
+    in PendingBlobDelete, downloads that already resolved it can finish. Returns the number of files moved.
+    """
+    storage = current_app.storage
+    copies = []  # (file id, old key, new key)
+    for file_id, old_key in rows:
+        key = new_blob_key()
+        if cold:
+            key = COLD_PREFIX + key
+        try:
+            storage.copy(old_key, key)
+        except Exception as e:
+            log_warning(None, "Tiering", f"Failed to move file {file_id} ({old_key}): {e}")
+            try:
+                storage.delete(key)  # partial copy
+            except Exception:
+                pass
+            continue
+        copies.append((file_id, old_key, key))
+
+    # All rows are switched in one short transaction after the copies, so none stays locked while blobs are copied
+    moved = 0
+    stale = []
+    for file_id, old_key, key in copies:
+        switched = db.session.execute(
+            db.update(File).where(File.id == file_id, File.filepath == old_key).values(filepath=key)
+        ).rowcount
+        if switched:
+            db.session.add(PendingBlobDelete(path=old_key, kind='file'))
+            moved += 1
+        else:
+            stale.append(key)  # moved to the other tier, copied over or deleted meanwhile
+    db.session.commit()
+
+    for key in stale:
+        storage.delete(key)
+    # Cached share resolutions still point at the old keys
+    invalidate_file_shares([file_id for file_id, _ in rows])
+    return moved
+
+
+def promote_files(file_ids):
+    """
+    Bring the cold files among `file_ids` back to the hot tier.
+    """
+    rows = db.session.query(File.id, File.filepath).filter(
+        File.id.in_(file_ids),
+        File.filepath.startswith(COLD_PREFIX)
+    ).all()
+    return move_files_to_tier(rows, cold=False) if rows else 0
+
+
+def demote_cold_files(cold_after_days, min_size, batch_size=100, max_batches=None):
+    """
+    Move files not read for `cold_after_days` and of at least `min_size` bytes to the cold tier,
+    one batch per transaction. Files of the legacy layout are left to `flask files migrate-blobs`.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=cold_after_days)
+    last_id = moved = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        rows = db.session.query(File.id, File.filepath).filter(
+            File.id > last_id,
+            ~File.filepath.startswith('/'),
+            ~File.filepath.startswith(COLD_PREFIX),
+            File.filesize >= min_size,
+            db.func.coalesce(File.last_read_at, File.upload_time) < cutoff
+        ).order_by(File.id).limit(batch_size).all()
+        if not rows:
+            break
+        moved += move_files_to_tier(rows, cold=True)
+        last_id = rows[-1][0]
+        batches += 1
+
+    return moved
+
+
+@files_bp.route('/tiers', methods=['GET'])
+@admin_required
+def tier_occupancy():
+    """
+    Files and bytes on each storage tier, 'legacy' are files not yet migrated to blobs.
+    """
+    tier = db.case(
+        (File.filepath.startswith('/'), 'legacy'),
+        (File.filepath.startswith(COLD_PREFIX), 'cold'),
+        else_='hot'
+    ).label('tier')
+    rows = db.session.query(tier, db.func.count(File.id), db.func.coalesce(db.func.sum(File.filesize), 0)).group_by(tier)
+
+    tiers = {name: {'files': 0, 'bytes': 0} for name in ('hot', 'cold', 'legacy')}
+    for name, files, size in rows:
+        tiers[name] = {'files': files, 'bytes': int(size)}
+
+    config = current_app.config
+    return jsonify({
+        'tiering_enabled': tiering_enabled(),
+        'tiers': tiers,
+        'policy': {
+            'cold_after_days': config['TIERING_COLD_AFTER_DAYS'],
+            'min_size': config['TIERING_MIN_SIZE'],
+            'interval': config['TIERING_INTERVAL']
+        }
+    }), 200
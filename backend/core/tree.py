@@ -0,0 +1,50 @@
+from backend.models import db, Directory
+
+
+def subtree_filter(user_id, directory_id, path):
+    """
+    Filter matching a directory and every directory below it, using the materialized `Directory.path`.
+    """
+    return db.and_(
+        Directory.user_id == user_id,
+        db.or_(
+            Directory.id == directory_id,
+            Directory.path.startswith(f"{path}/", autoescape=True)
+        )
+    )
+
+
+def relative_path(directory_path, root_path):
+    """
+    Path of a directory relative to the root of a subtree ('' for the root itself).
+    """
+    if directory_path == root_path:
+        return ''
+    return directory_path[len(root_path) + 1:]
+
+
+def ancestor_paths(path):
+    """
+    Materialized paths of every directory from the root down to `path` (inclusive).
+    """
+    parts = path.split('/')
+    return ['/'.join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+
+
+def get_ancestors(directory, include_self=True):
+    """
+    Directories from the root down to `directory`, resolved in a single query
+    on the materialized path instead of walking `parent_dir` one level at a time.
+    """
+    paths = ancestor_paths(directory.path)
+    if not include_self:
+        paths = paths[:-1]
+    if not paths:
+        return []
+
+    ancestors = Directory.query.filter(
+        Directory.user_id == directory.user_id,
+        Directory.path.in_(paths)
+    ).all()
+    ancestors.sort(key=lambda d: d.path.count('/'))
+    return ancestors
@@ -0,0 +1,56 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from backend.models import db, User
+
+
+def bump_tree_version(user_id):
+    """
+    Mark every listing of the user as changed.
+    Call it before committing the change, so the new version lands in the same transaction.
+    """
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(tree_version=User.tree_version + 1)
+    )
+
+
+def listing_etag(user, *parts):
+    """
+    ETag of a rendered listing: the user's tree version plus whatever selects the listing.
+    """
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return f"{user.id}-{user.tree_version}-{digest}"
+
+
+class ListingCache:
+    """
+    Byte-bounded LRU of rendered listing bodies, keyed by ETag.
+    Entries of an old tree version are never requested again and simply age out.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # etag -> body
+        self._bytes = 0
+
+    def get(self, etag):
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+            return body
+
+    def set(self, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[etag] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
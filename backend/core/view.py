@@ -1,66 +1,197 @@
+from datetime import datetime
 from typing import Optional
-from flask import Blueprint, request, g, jsonify
+from flask import Blueprint, request, g, jsonify, current_app
 from backend.auth.decorators import login_required
-from backend.models import File, Directory, Share
-from backend.user import userData
+from backend.core.pagination import encode_cursor, decode_cursor, get_page_size
+from backend.core.tree import get_ancestors
+from backend.core.versioning import ListingCache, listing_etag
+from backend.models import db, File, Directory, Share
+from backend.storage import create_storage
 
 files_bp = Blueprint('files', __name__)
+
+FILE_SORT_COLUMNS = {
+    'name': File.filename,
+    'size': File.filesize,
+    'upload_time': File.upload_time,
+}
+
+
+@files_bp.record
+def on_load(state):
+    app = state.app
+    app.listing_cache = ListingCache(app.config['LISTING_CACHE_MAX_BYTES'])
+    app.storage = create_storage(app.config)
+
+
+def cached_listing(etag, build):
+    """
+    Serve a listing through ETag revalidation and the listing cache.
+    `build` is only called when neither the client nor the cache has this version.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        body = current_app.listing_cache.get(etag)
+        if body is None:
+            body = current_app.json.dumps(build()).encode()
+            current_app.listing_cache.set(etag, body)
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @files_bp.route('/files', methods=['GET'])
 @login_required
 def files():
+    """
+    List a directory. Files are returned in pages of `limit` items, sorted by
+    `sort` (name, size or upload_time) in `order` (asc or desc); pass the returned
+    `next_cursor` as ?cursor= to get the next page. Directories come with the first page.
+    Responses carry an ETag derived from the user's tree version, so If-None-Match
+    revalidation is answered with a 304 without touching the listing tables.
+    """
     user = g.user
     dir_id: Optional[int] = request.args.get('dir_id', default=None, type=int)
+    sort = request.args.get('sort', default='name')
+    order = request.args.get('order', default='asc')
+    cursor = request.args.get('cursor')
+    limit = get_page_size(default=current_app.config['FILES_PAGE_SIZE'])
+
+    if sort not in FILE_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort parameters'}), 400
+
+    last = None
+    if cursor:
+        last = decode_cursor(cursor)
+        if not last or len(last) != 4 or last[:2] != [sort, order]:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if sort == 'upload_time':
+            try:
+                last[2] = datetime.fromisoformat(last[2])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+    etag = listing_etag(user, 'files', dir_id, sort, order, cursor, limit)
+    return cached_listing(etag, lambda: render_files(user, dir_id, sort, order, last, limit))
+
+
+def render_files(user, dir_id, sort, order, last, limit):
+    sort_column = FILE_SORT_COLUMNS[sort]
+
+    # Files with their share key in a single query
+    query = db.session.query(
+        File.id, File.filename, File.filesize, File.upload_time, Share.share_key
+    ).outerjoin(Share, db.and_(
+        Share.owner_id == File.user_id,
+        Share.object_type == 'file',
+        Share.object_id == File.id
+    )).filter(File.user_id == user.id, File.directory_id == dir_id)  # == None renders IS NULL for the root
 
-    if dir_id is None:
-        # Root-level files and directories
-        files = File.query.filter_by(user_id=user.id, directory_id=None).all()
-        directories = Directory.query.filter_by(user_id=user.id, parent_dir_id=None).all()
+    if last:
+        keyset = db.tuple_(sort_column, File.id)
+        query = query.filter(keyset > db.tuple_(last[2], last[3]) if order == 'asc'
+                             else keyset < db.tuple_(last[2], last[3]))
+
+    if order == 'asc':
+        query = query.order_by(sort_column.asc(), File.id.asc())
     else:
-        # Files and directories in a specific directory
-        files = File.query.filter_by(user_id=user.id, directory_id=dir_id).all()
-        directories = Directory.query.filter_by(user_id=user.id, parent_dir_id=dir_id).all()
-
-    files_data = []
-    for file in files:
-        share_key = get_share_key_for_file(file)
-        files_data.append({
-            'id': file.id,
-            'filename': file.filename,
-            'size': file.filesize,
-            'share_key': share_key
-        })
-
-    dirs_data = [
+        query = query.order_by(sort_column.desc(), File.id.desc())
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_value = getattr(rows[-1], sort_column.key)
+        if sort == 'upload_time':
+            last_value = last_value.isoformat()
+        next_cursor = encode_cursor([sort, order, last_value, rows[-1].id])
+
+    files_data = [
         {
-            'id': directory.id,
-            'name': directory.name,
+            'id': row.id,
+            'filename': row.filename,
+            'size': row.filesize,
+            'upload_time': row.upload_time.isoformat() if row.upload_time else None,
+            'share_key': row.share_key
         }
-        for directory in directories
+        for row in rows
     ]
 
-    breadcrumbs = []
-    current_dir = Directory.query.get(dir_id) if dir_id else None
-    while current_dir:
-        breadcrumbs.insert(0, {'id': current_dir.id, 'name': current_dir.name})
-        current_dir = current_dir.parent_dir
-
-    breadcrumbs.insert(0, {'id': None, 'name': 'Root'})  # Add Root as the starting point
+    # Directories are only sent with the first page
+    dirs_data = []
+    if not last:
+        directories = db.session.query(
+            Directory.id, Directory.name, Directory.total_size, Directory.total_files, Share.share_key
+        ).outerjoin(Share, db.and_(
+            Share.owner_id == Directory.user_id,
+            Share.object_type == 'directory',
+            Share.object_id == Directory.id
+        )).filter(Directory.user_id == user.id, Directory.parent_dir_id == dir_id).order_by(Directory.name).all()
+        dirs_data = [
+            {
+                'id': directory.id,
+                'name': directory.name,
+                'size': directory.total_size,
+                'file_count': directory.total_files,
+                'share_key': directory.share_key
+            }
+            for directory in directories
+        ]
 
-    # Include user's storage information
-    user_data = userData(user)
+    breadcrumbs = [{'id': None, 'name': 'Root'}]  # Add Root as the starting point
+    current_dir = Directory.query.filter_by(id=dir_id, user_id=user.id).first() if dir_id else None
+    if current_dir:
+        breadcrumbs += [{'id': d.id, 'name': d.name} for d in get_ancestors(current_dir)]
 
-    return jsonify({
+    # The user's storage information is not part of the listing, it changes without the tree version
+    # and comes from /user and the quota events
+    return {
         'files': files_data,
         'directories': dirs_data,
-        'user': user_data,
-        'breadcrumbs': breadcrumbs
-    }), 200
-
-def get_share_key_for_file(file_obj):
-    share = Share.query.filter_by(
-        owner_id=file_obj.user_id,
-        object_type='file',
-        object_id=file_obj.id
-    ).first()
-    return share.share_key if share else None
+        'breadcrumbs': breadcrumbs,
+        'next_cursor': next_cursor
+    }
+
+
+@files_bp.route('/tree', methods=['GET'])
+@login_required
+def tree():
+    """
+    The user's whole directory tree as a compact adjacency list, built from one query.
+    Rows are [id, parent_id, name] or, with ?counts=1, [id, parent_id, name, file_count, size]
+    where the counts cover the files directly inside each directory.
+    Send the returned ETag as If-None-Match to revalidate without downloading the tree again.
+    """
+    user = g.user
+    with_counts = request.args.get('counts', default=0, type=int) == 1
+
+    etag = listing_etag(user, 'tree', with_counts)
+    return cached_listing(etag, lambda: render_tree(user, with_counts))
+
+
+def render_tree(user, with_counts):
+    if with_counts:
+        counts = db.session.query(
+            File.directory_id.label('directory_id'),
+            db.func.count(File.id).label('file_count'),
+            db.func.sum(File.filesize).label('size')
+        ).filter(File.user_id == user.id).group_by(File.directory_id).subquery()
+
+        rows = db.session.query(
+            Directory.id, Directory.parent_dir_id, Directory.name, counts.c.file_count, counts.c.size
+        ).outerjoin(counts, counts.c.directory_id == Directory.id).filter(
+            Directory.user_id == user.id
+        ).order_by(Directory.id).all()
+        fields = ['id', 'parent_id', 'name', 'file_count', 'size']
+        # sum() comes back as a Decimal on PostgreSQL, which would be sent as a string
+        directories = [[row.id, row.parent_dir_id, row.name, row.file_count or 0, int(row.size or 0)] for row in rows]
+    else:
+        rows = db.session.query(Directory.id, Directory.parent_dir_id, Directory.name).filter(
+            Directory.user_id == user.id
+        ).order_by(Directory.id).all()
+        fields = ['id', 'parent_id', 'name']
+        directories = [[row.id, row.parent_dir_id, row.name] for row in rows]
 
+    return {'fields': fields, 'directories': directories}
@@ -0,0 +1,277 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+from flask import g
+
+# Counters and histograms of this worker, written to METRICS_DIR so the worker answering /metrics
+# can add up all workers of the host. Label values are stored as the JSON list of their values.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ARCHIVE_FILE = 'archive.json'  # totals of the workers that exited
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = json.dumps([str(labels[name]) for name in self.labelnames])
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = json.dumps([str(labels[name]) for name in self.labelnames])
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            # Per-bucket counts, the last one is +Inf, followed by the sum
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[index] += 1
+            values[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(values) for key, values in self._values.items()}
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help, labelnames=()):
+        return self.metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def render(self, snapshot):
+        """
+        The Prometheus text exposition format of `snapshot`.
+        """
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(snapshot.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, json.loads(key)))
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + [("le", _number(bound))])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def merge(total, snapshot):
+    """
+    Add `snapshot` into `total`, value by value.
+    """
+    for name, series in snapshot.items():
+        merged = total.setdefault(name, {})
+        for key, value in series.items():
+            if key not in merged:
+                merged[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                if len(value) == len(merged[key]):  # buckets changed between releases otherwise
+                    merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return total
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write(path, snapshot):
+    # Readers see the old or the new file, never half of it
+    temp = f'{path}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temp, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsStore:
+    """
+    One file per worker in `directory`, rewritten with the worker's totals on every flush.
+    Files of workers that exited are folded into an archive, so counters never go backwards.
+    """
+
+    def __init__(self, registry, directory):
+        self.registry = registry
+        self.directory = directory
+        self.pid = None  # of the process that owns the file, set by its first flush
+
+    def _lock(self):
+        lock = open(os.path.join(self.directory, '.lock'), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _archive(self, paths):
+        # Called with the lock held
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        archive = _read(archive_path)
+        for path in paths:
+            merge(archive, _read(path))
+            os.remove(path)
+        _write(archive_path, archive)
+        return archive
+
+    def flush(self):
+        if self.pid != os.getpid():
+            # First flush of this process, possibly forked from the one that loaded the app.
+            # A file under its pid was left by an exited worker that had the same pid.
+            self.pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{self.pid}.json')
+            if os.path.exists(path):
+                with self._lock():
+                    self._archive([path])
+        _write(os.path.join(self.directory, f'{self.pid}.json'), self.registry.snapshot())
+
+    def collect(self):
+        """
+        Totals of every worker of this host, this one included with its current values.
+        """
+        self.flush()
+        total, exited = {}, []
+        with self._lock():
+            for entry in os.scandir(self.directory):
+                pid, ext = os.path.splitext(entry.name)
+                if ext != '.json' or not pid.isdigit():
+                    continue
+                if int(pid) != self.pid and not _alive(int(pid)):
+                    exited.append(entry.path)
+                else:
+                    merge(total, _read(entry.path))
+            archive = self._archive(exited) if exited else _read(os.path.join(self.directory, ARCHIVE_FILE))
+        return merge(total, archive)
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'ptb_http_request_duration_seconds', 'Time until the view returned its response.', ('endpoint', 'method', 'status'))
+DB_QUERY_SECONDS = registry.histogram(
+    'ptb_db_query_duration_seconds', 'Time spent executing SQL statements.', ('statement',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+AUTH_SECONDS = registry.histogram(
+    'ptb_auth_duration_seconds', 'Time to check the access token and load the user.', ('decorator', 'result'),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+UPLOAD_CHUNK_BYTES = registry.counter(
+    'ptb_upload_chunk_bytes_total', 'Bytes of upload chunks stored.')
+UPLOAD_PART_SECONDS = registry.histogram(
+    'ptb_upload_part_duration_seconds', 'Time to store one upload chunk in the storage backend.')
+UPLOAD_ASSEMBLY_SECONDS = registry.histogram(
+    'ptb_upload_assembly_duration_seconds', 'Time to assemble the parts of an upload and create its file.', ('result',))
+DOWNLOAD_BYTES = registry.counter(
+    'ptb_download_bytes_total', 'Bytes of response bodies sent by downloads.', ('route',))
+DOWNLOAD_FIRST_BYTE_SECONDS = registry.histogram(
+    'ptb_download_first_byte_seconds', 'Time from the start of a download request to its first body chunk.', ('route',))
+ARCHIVE_BUILD_SECONDS = registry.histogram(
+    'ptb_archive_build_duration_seconds', 'Time to stream a whole ZIP archive of selected items.')
+
+
+def measure_stream(chunks, route, duration=None):
+    """
+    Pass through a response body, recording its time to first byte and the bytes it sent.
+    Times count from the start of the request; `duration` is a histogram for the whole body.
+    """
+    return _measured(chunks, route, g.get('metrics_started') or time.perf_counter(), duration)
+
+
+def _measured(chunks, route, started, duration):
+    sent = 0
+    first = True
+    try:
+        for chunk in chunks:
+            if first:
+                DOWNLOAD_FIRST_BYTE_SECONDS.observe(time.perf_counter() - started, route=route)
+                first = False
+            sent += len(chunk)
+            yield chunk
+        if duration is not None:
+            duration.observe(time.perf_counter() - started)
+    finally:
+        DOWNLOAD_BYTES.inc(sent, route=route)
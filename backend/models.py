@@ -10,8 +10,10 @@ class User(db.Model):
     username = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120))
     quota = db.Column(db.BigInteger, default=0)
-    used_space = db.Column(db.BigInteger, default=0)
+    used_space = db.Column(db.BigInteger, default=0)  # only changed with atomic increments, see backend/core/quota.py
+    reserved_space = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # held by uploads in progress
     is_admin = db.Column(db.Boolean, default=False)
+    tree_version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # bumped on every change
 
 
 class Directory(db.Model):
@@ -20,6 +22,9 @@ class Directory(db.Model):
     parent_dir_id = db.Column(db.Integer, db.ForeignKey('directory.id'), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     path = db.Column(db.String(1024), nullable=False, index=True)
+    # Recursive totals of the whole subtree, maintained incrementally (see backend/core/rollups.py)
+    total_size = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    total_files = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     child_dirs = db.relationship(
         'Directory',
@@ -41,12 +46,19 @@ class File(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     filepath = db.Column(db.String(500), nullable=False)
     filesize = db.Column(db.BigInteger, nullable=False)
-    upload_time = db.Column(db.DateTime, default=datetime.utcnow())
+    upload_time = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     directory_id = db.Column(db.Integer, db.ForeignKey('directory.id'), nullable=True)
+    # Written in batches by the FileAccessTracker, used by the tiering job
+    last_read_at = db.Column(db.DateTime, nullable=True)
+    read_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256, recorded and verified by the scrubber
 
     __table_args__ = (
         db.UniqueConstraint('user_id', 'directory_id', 'filename', name='uq_file_in_directory'),
+        # Keyset pagination of directory listings sorted by size or upload time
+        db.Index('ix_file_directory_size', 'user_id', 'directory_id', 'filesize', 'id'),
+        db.Index('ix_file_directory_upload_time', 'user_id', 'directory_id', 'upload_time', 'id'),
     )
 
     def __repr__(self):
@@ -63,6 +75,11 @@ class Share(db.Model):
     password = db.Column(db.String(255), nullable=True)
     expiration_time = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    stats = db.relationship('ShareStats', backref='share', uselist=False, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_share_object', 'object_type', 'object_id'),
+    )
 
     @property
     def is_expired(self):
@@ -70,3 +87,99 @@ class Share(db.Model):
             return datetime.utcnow() > self.expiration_time
         return False
 
+
+# Access counters of a share, written in batches by the share stats collector
+class ShareStats(db.Model):
+    share_id = db.Column(db.Integer, db.ForeignKey('share.id'), primary_key=True)
+    hits = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_served = db.Column(db.BigInteger, nullable=False, default=0)
+    last_accessed_at = db.Column(db.DateTime, nullable=True)
+
+
+# A chunked upload in progress, its declared size is reserved against the quota until it completes or is abandoned
+class UploadSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.String(100), nullable=False)  # chosen by the client
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    directory_id = db.Column(db.Integer, nullable=True)  # no foreign key, deleting the directory mustn't wait for its uploads
+    file_name = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    blob_key = db.Column(db.String(100), nullable=False)
+    multipart_id = db.Column(db.String(255), nullable=False)
+    parts = db.Column(db.Text, nullable=False, default='[]')  # JSON list of the part descriptors of the storage
+    uploaded_chunks = db.Column(db.Integer, nullable=False, default=0)  # also the index of the next expected chunk
+    received_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # pushed back by every chunk
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'upload_id', name='uq_upload_session'),
+    )
+
+
+# Append-only log of tree changes per user, the id doubles as the sync sequence number
+class ChangeLog(db.Model):
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event = db.Column(db.String(10), nullable=False)  # 'create', 'delete', 'move', 'share' or 'unshare'
+    object_type = db.Column(db.String(10), nullable=False)  # 'file' or 'directory'
+    object_id = db.Column(db.Integer, nullable=False)
+    parent_id = db.Column(db.Integer, nullable=True)  # directory containing the object, None for root
+    name = db.Column(db.String(255), nullable=True)
+    path = db.Column(db.String(1024), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_change_log_user_seq', 'user_id', 'id'),
+        db.Index('ix_change_log_object', 'user_id', 'object_type', 'object_id'),
+    )
+
+
+# Small named values that have to survive restarts, e.g. watermarks and job progress
+class Checkpoint(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Files and folders on disk whose rows were already deleted, removed in batches by the blob reclaimer
+class PendingBlobDelete(db.Model):
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    path = db.Column(db.String(1024), nullable=False)
+    kind = db.Column(db.String(10), nullable=False, default='file')  # 'file' or 'dir'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Inconsistencies between the database and the stored blobs, found by the storage scrubber
+class ScrubFinding(db.Model):
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'missing_file', 'size_mismatch', 'corrupt', 'orphan_blob' or 'quota_drift'
+    file_id = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    path = db.Column(db.String(1024), nullable=True)
+    details = db.Column(db.String(500), nullable=True)
+    action = db.Column(db.String(20), nullable=True)  # what the scrubber did about it, e.g. 'queued_delete'
+    resolved = db.Column(db.Boolean, nullable=False, default=False)
+    first_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_scrub_finding_open', 'resolved', 'kind'),
+    )
+
+
+# Requests captured by the on-demand profiler, trimmed to PROFILING_MAX_PROFILES
+class RequestProfile(db.Model):
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(1024), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.Integer, nullable=False)
+    duration = db.Column(db.Float, nullable=False)  # seconds until the view returned
+    timings = db.Column(db.Text, nullable=False)  # JSON, the Server-Timing breakdown in seconds
+    summary = db.Column(db.Text, nullable=True)  # pstats report of the slowest functions
+    stats = db.Column(db.LargeBinary, nullable=True)  # pstats dump, as written by cProfile.Profile.dump_stats
@@ -0,0 +1,56 @@
+import time
+from collections import defaultdict
+
+from flask import g, has_app_context
+from flask.json.provider import DefaultJSONProvider
+
+# Server-Timing breakdown of a profiled request: seconds spent per part, kept in g.server_timing.
+# Requests that aren't profiled have no breakdown and skip the bookkeeping.
+
+TIMING_PARTS = (
+    ('auth', 'access token and user'),
+    ('db', 'SQL statements'),
+    ('fs', 'storage backend'),
+    ('serialize', 'JSON encoding'),
+)
+
+
+def start_timings():
+    g.server_timing = defaultdict(float)
+    return g.server_timing
+
+
+def current_timings():
+    return g.get('server_timing') if has_app_context() else None
+
+
+def add_timing(part, seconds):
+    timings = current_timings()
+    if timings is not None:
+        timings[part] += seconds
+
+
+def server_timing_header(timings, total):
+    """
+    The Server-Timing value of `timings`, in milliseconds. 'app' is the rest of `total`.
+    """
+    entries = [f'{part};desc="{desc}";dur={timings[part] * 1000:.1f}' for part, desc in TIMING_PARTS]
+    rest = total - sum(timings[part] for part, _ in TIMING_PARTS)
+    entries.append(f'app;desc="everything else";dur={max(rest, 0) * 1000:.1f}')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Counts the time jsonify spends encoding into the breakdown.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if current_timings() is None:
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_timing('serialize', time.perf_counter() - started)
@@ -1,2 +1,11 @@
 from backend.servicies.upload_clean_up import *
-from backend.servicies.server_info import *
\ No newline at end of file
+from backend.servicies.host_metrics import *
+from backend.servicies.server_info import *
+from backend.servicies.change_log_compaction import *
+from backend.servicies.blob_reclaim import *
+from backend.servicies.storage_tiering import *
+from backend.servicies.storage_scrub import *
+from backend.servicies.share_stats_flush import *
+from backend.servicies.metrics import *
+from backend.servicies.profiling import *
+from backend.servicies.jobs import *
@@ -0,0 +1,14 @@
+from flask import current_app
+
+from backend.core.bulk_delete import reclaim_pending_blobs
+from backend.helpers import log_info
+from backend.servicies.scheduler import job
+
+
+@job('blob_reclaim', interval='BLOB_RECLAIM_INTERVAL')
+def reclaim_blobs_periodically():
+    # Entries become due BLOB_RECLAIM_DELAY after the delete, the interval picks them up and retries failures
+    config = current_app.config
+    processed = reclaim_pending_blobs(config['BLOB_RECLAIM_BATCH_SIZE'], config['BLOB_RECLAIM_DELAY'])
+    if processed:
+        log_info(None, "BlobReclaim", f"Processed {processed} pending deletes")
@@ -0,0 +1,10 @@
+from backend.core.changes import compact_change_log
+from backend.helpers import log_info
+from backend.servicies.scheduler import job
+
+
+@job('change_log_compaction', interval='CHANGE_LOG_COMPACT_INTERVAL')
+def compact_change_log_periodically():
+    compacted, pruned = compact_change_log()
+    if compacted or pruned:
+        log_info(None, "ChangeLogCompaction", f"Compacted {compacted} and pruned {pruned} entries")
@@ -0,0 +1,319 @@
+import fcntl
+import os
+import struct
+import time
+from datetime import datetime
+
+import requests
+from flask import current_app
+
+from backend.helpers import log_info, log_warning
+from backend.metrics import HTTP_REQUEST_SECONDS, DOWNLOAD_BYTES
+from backend.models import UploadSession
+from backend.servicies.scheduler import job
+
+# One sample is a fixed record of doubles, rates are per second
+FIELDS = ('timestamp', 'cpu', 'load1', 'load5', 'load15', 'mem', 'mem_used', 'mem_total', 'swap',
+          'disk_read', 'disk_write', 'net_recv', 'net_sent', 'storage',
+          'requests', 'bytes_served', 'active_uploads', 'cpu_count')
+MAX_CPUS = 64  # per-cpu usage kept for this many cpus
+RECORD = struct.Struct(f'<Q{len(FIELDS) + MAX_CPUS}dQ')  # the sequence number before and after the values
+HEADER = struct.Struct('<4sIIIQd')  # magic, version, capacity, record size, samples written, last viewed
+MAGIC = b'PTBM'
+VERSION = 2
+VIEWED_OFFSET = HEADER.size - 8
+
+VIEWER_TIMEOUT = 60  # seconds after the last dashboard request before sampling slows down
+MAX_BACKOFF = 5 * 60  # seconds between attempts while the source fails
+
+
+class PsutilSource:
+    """
+    Reads the host counters with psutil, disk and network rates are taken between two reads.
+    """
+    name = 'psutil'
+
+    def __init__(self, storage_path=None):
+        import psutil  # optional dependency, the glances source is used without it
+
+        self.psutil = psutil
+        self.storage_path = storage_path
+        self.previous = None
+        psutil.cpu_percent(percpu=True)  # the first call only starts the measurement
+
+    def read(self):
+        psutil = self.psutil
+        percpu = psutil.cpu_percent(percpu=True)
+        mem = psutil.virtual_memory()
+        disk = psutil.disk_io_counters()
+        net = psutil.net_io_counters()
+        now = time.monotonic()
+        counters = (now, disk.read_bytes if disk else 0, disk.write_bytes if disk else 0, net.bytes_recv, net.bytes_sent)
+        rates = [0.0] * 4
+        if self.previous is not None:
+            elapsed = now - self.previous[0]
+            rates = [max(new - old, 0) / elapsed for new, old in zip(counters[1:], self.previous[1:])]
+        self.previous = counters
+
+        load = os.getloadavg() if hasattr(os, 'getloadavg') else (0.0, 0.0, 0.0)
+        storage = 0.0
+        if self.storage_path and os.path.isdir(self.storage_path):
+            storage = psutil.disk_usage(self.storage_path).percent
+        return {
+            'cpu': sum(percpu) / len(percpu) if percpu else 0.0,
+            'percpu': percpu,
+            'load1': load[0], 'load5': load[1], 'load15': load[2],
+            'mem': mem.percent, 'mem_used': mem.used, 'mem_total': mem.total,
+            'swap': psutil.swap_memory().percent,
+            'disk_read': rates[0], 'disk_write': rates[1], 'net_recv': rates[2], 'net_sent': rates[3],
+            'storage': storage
+        }
+
+
+def _glances_rate(item, rate_key, counter_key):
+    # Glances 4 reports rates, Glances 3 the bytes since its previous update
+    if rate_key in item:
+        return item[rate_key] or 0.0
+    elapsed = item.get('time_since_update') or 0
+    return item.get(counter_key, 0) / elapsed if elapsed else 0.0
+
+
+class GlancesSource:
+    """
+    Reads the host counters from the REST API of a Glances instance at `url`.
+    """
+    name = 'glances'
+
+    def __init__(self, url, timeout=2):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()  # keeps the connection open between samples
+
+    def read(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        quicklook = data.get('quicklook', {})
+        load = data.get('load', {})
+        mem = data.get('mem', {})
+        diskio = data.get('diskio', [])
+        network = [item for item in data.get('network', []) if item.get('interface_name') != 'lo']
+        return {
+            'cpu': quicklook.get('cpu', 0.0),
+            'percpu': [cpu.get('total', 0.0) for cpu in quicklook.get('percpu', [])],
+            'load1': load.get('min1', 0.0), 'load5': load.get('min5', 0.0), 'load15': load.get('min15', 0.0),
+            'mem': mem.get('percent', 0.0), 'mem_used': mem.get('used', 0), 'mem_total': mem.get('total', 0),
+            'swap': quicklook.get('swap', 0.0),
+            'disk_read': sum(_glances_rate(d, 'read_bytes_rate_per_sec', 'read_bytes') for d in diskio),
+            'disk_write': sum(_glances_rate(d, 'write_bytes_rate_per_sec', 'write_bytes') for d in diskio),
+            'net_recv': sum(_glances_rate(n, 'bytes_recv_rate_per_sec', 'rx') for n in network),
+            'net_sent': sum(_glances_rate(n, 'bytes_sent_rate_per_sec', 'tx') for n in network),
+            'storage': 0.0
+        }
+
+
+def create_source(config):
+    source = config['HOST_METRICS_SOURCE']
+    if source in ('auto', 'psutil'):
+        try:
+            return PsutilSource(config['BLOB_FOLDER'] if config['STORAGE_BACKEND'] == 'local' else None)
+        except ImportError:
+            if source == 'psutil':
+                raise
+    return GlancesSource(config['MONITOR_SERVICE_URL'])
+
+
+class HostMetrics:
+    """
+    A ring buffer of host samples in a file on tmpfs, shared by all workers of the host.
+    The worker holding the flock on the file samples, the others only read. Each record is framed
+    by its sequence number, so a reader detects and skips a record that is being overwritten.
+    Sampling runs every `interval` seconds while the dashboard is open and every `idle_interval` otherwise.
+    """
+
+    def __init__(self, path, capacity, interval, idle_interval, source_factory):
+        self.path = path
+        self.capacity = capacity
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.source_factory = source_factory
+        self.source = None
+        self.fd = None
+        self.written = 0
+        self.failures = 0
+        self.previous_counters = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['HOST_METRICS_FILE'],
+            config['HOST_METRICS_HISTORY'],
+            config['HOST_METRICS_INTERVAL'],
+            config['HOST_METRICS_IDLE_INTERVAL'],
+            lambda: create_source(config)
+        )
+
+    # -- writer --------------------------------------------------------------
+
+    def _acquire(self):
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        header = os.pread(fd, HEADER.size, 0)
+        if len(header) == HEADER.size and HEADER.unpack(header)[:4] == (MAGIC, VERSION, self.capacity, RECORD.size):
+            # Continue the history of the previous sampler
+            self.written = HEADER.unpack(header)[4]
+        else:
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, HEADER.size + self.capacity * RECORD.size)
+            os.pwrite(fd, HEADER.pack(MAGIC, VERSION, self.capacity, RECORD.size, 0, 0.0), 0)
+            self.written = 0
+        self.fd = fd
+        self.source = self.source_factory()
+        log_info(None, "HostMetrics", f"Worker {os.getpid()} samples host metrics with {self.source.name}")
+        return True
+
+    def _write(self, sample):
+        seq = self.written + 1
+        percpu = (list(sample['percpu']) + [0.0] * MAX_CPUS)[:MAX_CPUS]
+        values = [sample['timestamp']] + [float(sample[f]) for f in FIELDS[1:-1]] + [len(sample['percpu'])]
+        record = RECORD.pack(seq, *values, *percpu, seq)
+        offset = HEADER.size + (self.written % self.capacity) * RECORD.size
+        os.pwrite(self.fd, struct.pack('<Q', 0), offset)
+        os.pwrite(self.fd, record[8:], offset + 8)
+        os.pwrite(self.fd, record[:8], offset)
+        self.written = seq
+        os.pwrite(self.fd, struct.pack('<Q', seq), HEADER.size - 16)
+
+    def _app_counters(self):
+        # Requests and download bytes of every worker of the host as of their last metrics flush,
+        # uploads in progress on any host
+        totals = current_app.metrics.collect()
+        counters = (
+            time.monotonic(),
+            sum(sum(values[:-1]) for values in totals.get(HTTP_REQUEST_SECONDS.name, {}).values()),
+            sum(totals.get(DOWNLOAD_BYTES.name, {}).values())
+        )
+        rates = [0.0] * 2
+        if self.previous_counters is not None:
+            elapsed = counters[0] - self.previous_counters[0]
+            rates = [max(new - old, 0) / elapsed for new, old in zip(counters[1:], self.previous_counters[1:])]
+        self.previous_counters = counters
+        return {
+            'requests': rates[0],
+            'bytes_served': rates[1],
+            'active_uploads': UploadSession.query.filter(UploadSession.expires_at > datetime.utcnow()).count()
+        }
+
+    def sample(self):
+        """
+        Take one sample if this worker is the sampler. Returns the seconds until the next one.
+        """
+        if not self._acquire():
+            return self.idle_interval  # another worker samples, try to take over later
+        try:
+            sample = self.source.read()
+            sample.update(self._app_counters())
+        except Exception as e:
+            self.failures += 1
+            delay = min(self.interval * 2 ** self.failures, MAX_BACKOFF)
+            if self.failures == 1:
+                log_warning(None, "HostMetrics", f"Sampling with {self.source.name} failed, retrying in {delay}s: {e}")
+            return delay
+        self.failures = 0
+        sample['timestamp'] = time.time()
+        self._write(sample)
+
+        last_viewed = struct.unpack('<d', os.pread(self.fd, 8, VIEWED_OFFSET))[0]
+        return self.interval if time.time() - last_viewed < VIEWER_TIMEOUT else self.idle_interval
+
+    # -- readers -------------------------------------------------------------
+
+    def read(self, seconds=None, viewed=True):
+        """
+        Samples of the last `seconds`, or the latest one only, oldest first. `viewed` marks the
+        history as looked at, which keeps the sampler at its fast rate.
+        """
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return []
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if len(header) < HEADER.size:
+                return []
+            magic, version, capacity, record_size, written, _ = HEADER.unpack(header)
+            if (magic, version, record_size) != (MAGIC, VERSION, RECORD.size) or not written:
+                return []
+            if viewed:
+                os.pwrite(fd, struct.pack('<d', time.time()), VIEWED_OFFSET)
+
+            count = min(written, capacity)
+            if seconds is None:
+                count = 1
+            elif self.interval:
+                # Only the records that can fall in the window, at the fastest rate
+                count = min(count, int(seconds / self.interval) + 1)
+            first = written - count
+            # One read of the whole range, in at most two pieces where the ring wraps
+            data = b''
+            start = first % capacity
+            while len(data) < count * RECORD.size:
+                chunk = min(count - len(data) // RECORD.size, capacity - start)
+                piece = os.pread(fd, chunk * RECORD.size, HEADER.size + start * RECORD.size)
+                data += piece
+                if len(piece) < chunk * RECORD.size:
+                    break  # file reset by a new sampler
+                start = 0
+        finally:
+            os.close(fd)
+
+        cutoff = time.time() - seconds if seconds is not None else 0
+        samples = []
+        for i in range(len(data) // RECORD.size):
+            record = RECORD.unpack_from(data, i * RECORD.size)
+            if record[0] != first + i + 1 or record[-1] != record[0]:
+                continue  # overwritten while it was read
+            values = dict(zip(FIELDS, record[1:1 + len(FIELDS)]))
+            if values['timestamp'] < cutoff:
+                continue
+            cpu_count = int(values.pop('cpu_count'))
+            values['percpu'] = list(record[1 + len(FIELDS):1 + len(FIELDS) + min(cpu_count, MAX_CPUS)])
+            samples.append(values)
+        return samples
+
+
+def downsample(samples, step):
+    """
+    Average the samples in buckets of `step` seconds, keeping the history small for a long window.
+    """
+    if step <= 0 or not samples:
+        return samples
+    buckets = []
+    for sample in samples:
+        bucket = int(sample['timestamp'] // step)
+        if buckets and buckets[-1][0] == bucket:
+            buckets[-1][1].append(sample)
+        else:
+            buckets.append((bucket, [sample]))
+
+    result = []
+    for _, group in buckets:
+        averaged = {key: sum(s[key] for s in group) / len(group) for key in group[0] if key != 'percpu'}
+        averaged['timestamp'] = group[-1]['timestamp']
+        cpus = min(len(s['percpu']) for s in group)
+        averaged['percpu'] = [sum(s['percpu'][i] for s in group) / len(group) for i in range(cpus)]
+        result.append(averaged)
+    return result
+
+
+@job('host_metrics', interval='HOST_METRICS_INTERVAL', singleton=False, initial_delay=0)
+def sample_host_metrics():
+    # Every worker runs this, only the one holding the lock on the metrics file of its host samples
+    return current_app.host_metrics.sample()
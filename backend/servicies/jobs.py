@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+
+from flask import current_app, jsonify
+
+from backend.auth.decorators import admin_required
+from backend.models import db, Checkpoint
+from backend.servicies.scheduler import JOBS, JobScheduler, job
+from backend.servicies.upload_clean_up import services_bp
+
+JOB_STATUS_CHECKPOINT = 'job_status'
+
+
+# Imported last by the package, after every module registered its jobs.
+# Started by app.py once the schema exists, the first runs of some jobs are right away.
+@services_bp.record
+def on_load(state):
+    app = state.app
+    app.scheduler = JobScheduler.from_config(app, JOBS)
+
+
+@job('job_status', interval='JOBS_STATUS_INTERVAL', initial_delay=0)
+def publish_job_status():
+    # Any worker can answer /jobs, the leader leaves the state of the singleton jobs where all of them see it
+    status = current_app.scheduler.status()
+    status['jobs'] = [j for j in status['jobs'] if j['singleton']]
+    status['updated_at'] = datetime.utcnow().isoformat()
+    checkpoint = db.session.get(Checkpoint, JOB_STATUS_CHECKPOINT) or Checkpoint(name=JOB_STATUS_CHECKPOINT)
+    checkpoint.value = json.dumps(status)
+    db.session.add(checkpoint)
+    db.session.commit()
+
+
+@services_bp.route('/jobs', methods=['GET'])
+@admin_required
+def job_status():
+    """
+    Background jobs as seen by the worker answering, and the singleton jobs as last reported by the leader.
+    """
+    checkpoint = db.session.get(Checkpoint, JOB_STATUS_CHECKPOINT)
+    return jsonify({
+        'worker': current_app.scheduler.status(),
+        'leader': json.loads(checkpoint.value) if checkpoint and checkpoint.value else None
+    }), 200
@@ -0,0 +1,69 @@
+import time
+
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+
+from backend.auth.decorators import admin_required
+from backend.metrics import registry, MetricsStore, HTTP_REQUEST_SECONDS, DB_QUERY_SECONDS
+from backend.models import db
+from backend.profiling import add_timing
+from backend.servicies.scheduler import job
+from backend.servicies.upload_clean_up import services_bp
+
+STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+@services_bp.record
+def on_load(state):
+    app = state.app
+    app.metrics = MetricsStore(registry, app.config['METRICS_DIR'])
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', start_query_timer)
+    event.listen(engine, 'after_cursor_execute', stop_query_timer)
+
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    # Only the verb, statement texts would be an unbounded label
+    verb = statement.lstrip()[:6].upper()
+    DB_QUERY_SECONDS.observe(elapsed, statement=verb if verb in STATEMENTS else 'OTHER')
+    add_timing('db', elapsed)
+
+
+@services_bp.before_app_request
+def start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+
+@services_bp.after_app_request
+def stop_request_timer(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unmatched',
+                                     method=request.method, status=response.status_code)
+    return response
+
+
+@job('metrics_flush', interval='METRICS_FLUSH_INTERVAL', singleton=False)
+def flush_metrics():
+    # Every worker leaves its totals where the worker answering /metrics finds them
+    current_app.metrics.flush()
+
+
+@services_bp.route('/metrics', methods=['GET'])
+@admin_required
+def metrics():
+    """
+    Counters and histograms of all workers of this host in the Prometheus text format.
+    Other workers are included as of their last flush, at most METRICS_FLUSH_INTERVAL old.
+    """
+    body = registry.render(current_app.metrics.collect())
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
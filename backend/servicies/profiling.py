@@ -0,0 +1,239 @@
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import random
+import time
+
+from flask import Response, current_app, g, jsonify, request
+
+from backend.auth.decorators import admin_required
+from backend.auth.jwt_utils import decode_token
+from backend.helpers import log_info, log_error
+from backend.models import db, Checkpoint, RequestProfile
+from backend.profiling import TimedJSONProvider, start_timings, server_timing_header
+from backend.servicies.upload_clean_up import services_bp
+
+PROFILING_CHECKPOINT = 'profiling'
+
+# Settings as last read by this worker, refreshed every PROFILING_REFRESH seconds
+_settings = {'value': None, 'loaded_at': 0.0}
+
+
+@services_bp.record
+def on_load(state):
+    state.app.json = TimedJSONProvider(state.app)
+
+
+def profiling_settings():
+    config = current_app.config
+    if time.monotonic() - _settings['loaded_at'] >= config['PROFILING_REFRESH']:
+        # Also after a failure, so a broken database costs one attempt per refresh and not one per request
+        _settings['loaded_at'] = time.monotonic()
+        # Own connection, so the request's session doesn't start with this row in it
+        with db.engine.connect() as connection:
+            value = connection.execute(
+                db.select(Checkpoint.value).where(Checkpoint.name == PROFILING_CHECKPOINT)
+            ).scalar()
+        _settings['value'] = json.loads(value) if value else None
+    settings = _settings['value']
+    if settings is None or time.time() > settings['until']:
+        return None
+    return settings
+
+
+def save_profiling_settings(settings):
+    checkpoint = db.session.get(Checkpoint, PROFILING_CHECKPOINT) or Checkpoint(name=PROFILING_CHECKPOINT)
+    checkpoint.value = json.dumps(settings) if settings else None
+    db.session.add(checkpoint)
+    db.session.commit()
+    _settings['value'], _settings['loaded_at'] = settings, time.monotonic()
+
+
+def token_user_id():
+    # Only decoded when profiling targets a user, the view checks the token again anyway
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else None
+    payload = decode_token(token) if token else {}
+    return payload.get('user_id')
+
+
+def should_profile(settings):
+    view = current_app.view_functions.get(request.endpoint)
+    if view is not None and view.__module__ == __name__:
+        return False  # the profiles are not what is being looked into
+    if settings.get('endpoint') and request.endpoint != settings['endpoint']:
+        return False
+    if settings.get('path_prefix') and not request.path.startswith(settings['path_prefix']):
+        return False
+    if settings.get('user_id') is not None and token_user_id() != settings['user_id']:
+        return False
+    return random.random() < settings['sample_rate']
+
+
+@services_bp.before_app_request
+def start_profile():
+    try:
+        settings = profiling_settings()
+    except Exception as e:
+        log_error(None, "Profiling", f"Failed to read profiling settings: {e}")
+        return
+    if settings is None or not should_profile(settings):
+        return
+
+    start_timings()
+    g.profile_started = time.perf_counter()
+    g.profile = cProfile.Profile()
+    try:
+        g.profile.enable()
+    except ValueError:
+        g.profile = None  # another profiler is active in this thread, keep the timings only
+
+
+@services_bp.after_app_request
+def finish_profile(response):
+    timings = g.get('server_timing')
+    if timings is None:
+        return response
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+    duration = time.perf_counter() - g.profile_started
+    response.headers['Server-Timing'] = server_timing_header(timings, duration)
+    try:
+        response.headers['X-Profile-Id'] = str(save_profile(profile, response.status_code, duration, dict(timings)))
+    except Exception as e:
+        log_error(None, "Profiling", f"Failed to store the profile of {request.path}: {e}")
+    return response
+
+
+@services_bp.teardown_app_request
+def stop_profile(exc):
+    # The view raised before after_request could run
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+
+
+def save_profile(profile, status, duration, timings):
+    config = current_app.config
+    summary = stats = None
+    if profile is not None:
+        stream = io.StringIO()
+        report = pstats.Stats(profile, stream=stream)
+        report.sort_stats('cumulative').print_stats(config['PROFILING_TOP_FUNCTIONS'])
+        summary, stats = stream.getvalue(), marshal.dumps(report.stats)
+
+    user = g.get('user')
+    table = RequestProfile.__table__
+    # Own transaction, the view's session may hold changes it meant to roll back
+    with db.engine.begin() as connection:
+        profile_id = connection.execute(table.insert().values(
+            method=request.method,
+            path=request.path[:1024],
+            endpoint=request.endpoint,
+            user_id=user.id if user else None,
+            status=status,
+            duration=duration,
+            timings=json.dumps(timings),
+            summary=summary,
+            stats=stats
+        )).inserted_primary_key[0]
+        newest = db.select(table.c.id).order_by(table.c.id.desc()).limit(config['PROFILING_MAX_PROFILES'])
+        connection.execute(table.delete().where(table.c.id.notin_(newest.scalar_subquery())))
+    return profile_id
+
+
+def profile_summary(p):
+    return {
+        'id': p.id,
+        'created_at': p.created_at.isoformat(),
+        'method': p.method,
+        'path': p.path,
+        'endpoint': p.endpoint,
+        'user_id': p.user_id,
+        'status': p.status,
+        'duration': p.duration,
+        'timings': json.loads(p.timings)
+    }
+
+
+@services_bp.route('/profiling', methods=['GET'])
+@admin_required
+def profiling_status():
+    """
+    The current profiling settings and the stored profiles, newest first. ?limit=100
+    """
+    limit = request.args.get('limit', default=100, type=int)
+    profiles = RequestProfile.query.with_entities(
+        RequestProfile.id, RequestProfile.created_at, RequestProfile.method, RequestProfile.path,
+        RequestProfile.endpoint, RequestProfile.user_id, RequestProfile.status, RequestProfile.duration,
+        RequestProfile.timings
+    ).order_by(RequestProfile.id.desc()).limit(max(1, min(limit, 1000))).all()
+    return jsonify({
+        'settings': profiling_settings(),
+        'profiles': [profile_summary(p) for p in profiles]
+    }), 200
+
+
+@services_bp.route('/profiling', methods=['POST'])
+@admin_required
+def start_profiling():
+    """
+    Profile requests for a while. Body can have:
+    { "sample_rate": 1.0, "user_id": 1, "endpoint": "files.files", "path_prefix": "/api/files", "duration": 300 }
+    Requests matching every given filter are profiled with a probability of sample_rate.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        sample_rate = float(data.get('sample_rate', 1.0))
+        duration = int(data.get('duration', 300))
+        user_id = int(data['user_id']) if data.get('user_id') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid parameter value."}), 400
+    if not 0 < sample_rate <= 1 or duration <= 0:
+        return jsonify({"success": False, "error": "Invalid parameter value."}), 400
+
+    settings = {
+        'sample_rate': sample_rate,
+        'user_id': user_id,
+        'endpoint': data.get('endpoint') or None,
+        'path_prefix': data.get('path_prefix') or None,
+        'until': time.time() + min(duration, current_app.config['PROFILING_MAX_DURATION']),
+        'started_by': g.user.id
+    }
+    save_profiling_settings(settings)
+    log_info(g.user, "Profiling", f"Profiling started: {settings}")
+    return jsonify({"success": True, "settings": settings}), 200
+
+
+@services_bp.route('/profiling', methods=['DELETE'])
+@admin_required
+def stop_profiling():
+    save_profiling_settings(None)
+    log_info(g.user, "Profiling", "Profiling stopped")
+    return jsonify({"success": True}), 200
+
+
+@services_bp.route('/profiling/<int:profile_id>', methods=['GET'])
+@admin_required
+def profile_details(profile_id):
+    profile = db.session.get(RequestProfile, profile_id)
+    if profile is None:
+        return jsonify({"success": False, "error": "Profile not found."}), 404
+    return jsonify(dict(profile_summary(profile), summary=profile.summary)), 200
+
+
+@services_bp.route('/profiling/<int:profile_id>/stats', methods=['GET'])
+@admin_required
+def profile_stats(profile_id):
+    """
+    The raw pstats dump, for snakeviz or `python -m pstats`.
+    """
+    profile = db.session.get(RequestProfile, profile_id)
+    if profile is None or profile.stats is None:
+        return jsonify({"success": False, "error": "Profile not found."}), 404
+    response = Response(profile.stats, mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.prof"'
+    return response
@@ -0,0 +1,272 @@
+import fcntl
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from backend.helpers import log_info, log_error
+from backend.models import db
+
+JobSpec = namedtuple('JobSpec', ['name', 'func', 'interval', 'singleton', 'initial_delay', 'enabled'])
+
+# Registered by the @job decorator when the modules of this package are imported
+JOBS = []
+
+LEADER_LOCK_KEY = 0x50546221  # pg advisory lock id shared by all workers of a deployment
+
+
+def job(name, interval, singleton=True, initial_delay=None, enabled=None):
+    """
+    Register a periodic background job. `interval` is in seconds or the name of a config key.
+    Singleton jobs only run on the elected leader, once per deployment; the others run in every
+    worker, e.g. to flush counters kept in that worker's memory. The job can return a number of
+    seconds to run again after that instead of `interval`. `enabled` names a config key that
+    switches the job off when it is falsy. The first run is after `initial_delay`, default one interval.
+    """
+    def decorator(func):
+        JOBS.append(JobSpec(name, func, interval, singleton, initial_delay, enabled))
+        return func
+    return decorator
+
+
+class FileLockElection:
+    """
+    Leader is the worker holding an exclusive flock on a file, released by the kernel when it exits.
+    Only covers workers on the same host.
+    """
+    kind = 'file'
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def try_acquire(self):
+        if self.fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+
+class AdvisoryLockElection:
+    """
+    Leader is the worker holding a session-level PostgreSQL advisory lock on a dedicated connection,
+    released by the server when that connection dies. Covers workers on every host.
+    """
+    kind = 'postgres'
+
+    def __init__(self, engine, key=LEADER_LOCK_KEY):
+        self.engine = engine
+        self.key = key
+        self.connection = None
+
+    def try_acquire(self):
+        if self.connection is not None:
+            try:
+                self.connection.exec_driver_sql('SELECT 1')
+                return True
+            except Exception:
+                # Connection lost, and the lock with it
+                self.connection.invalidate()
+                self.connection = None
+
+        connection = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            acquired = connection.execute(db.text('SELECT pg_try_advisory_lock(:key)'), {'key': self.key}).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self.connection = connection
+        return True
+
+
+class NoElection:
+    """
+    Every worker is the leader, for a single process.
+    """
+    kind = 'off'
+
+    def try_acquire(self):
+        return True
+
+
+class Job:
+
+    def __init__(self, spec, interval, initial_delay, enabled):
+        self.spec = spec
+        self.interval = interval
+        self.enabled = enabled
+        self.next_run = time.monotonic() + initial_delay
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_duration = None
+        self.last_started_at = None
+        self.last_error = None
+
+    def status(self, is_leader):
+        if not self.enabled:
+            state = 'disabled'
+        elif self.running:
+            state = 'running'
+        elif self.spec.singleton and not is_leader:
+            state = 'standby'
+        else:
+            state = 'scheduled'
+        return {
+            'name': self.spec.name,
+            'singleton': self.spec.singleton,
+            'state': state,
+            'interval': self.interval,
+            'next_run_in': round(max(self.next_run - time.monotonic(), 0), 3) if state == 'scheduled' else None,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_started_at': self.last_started_at.isoformat() if self.last_started_at else None,
+            'last_duration': round(self.last_duration, 3) if self.last_duration is not None else None,
+            'avg_duration': round(self.total_duration / self.runs, 3) if self.runs else None,
+            'max_duration': round(self.max_duration, 3),
+            'last_error': self.last_error
+        }
+
+
+class JobScheduler:
+    """
+    Runs the registered jobs of one worker: a single thread keeps time and hands due jobs to a bounded
+    thread pool. A job never overlaps with itself, its next run is planned when the previous one ends.
+    The leader election is retried every `leader_retry` seconds, so a standby worker takes over
+    singleton jobs when the leader exits.
+    """
+
+    def __init__(self, app, specs, max_workers, election, leader_retry):
+        self.app = app
+        self.election = election
+        self.leader_retry = leader_retry
+        self.max_workers = max_workers
+        self.is_leader = False
+        self.pid = os.getpid()
+        self.host = socket.gethostname()
+        self.started_at = datetime.utcnow()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._next_election = 0
+        self.jobs = {}
+        for spec in specs:
+            interval = self._resolve(spec.interval)
+            initial_delay = interval if spec.initial_delay is None else self._resolve(spec.initial_delay)
+            enabled = bool(app.config.get(spec.enabled)) if spec.enabled else True
+            self.jobs[spec.name] = Job(spec, interval, initial_delay, enabled)
+
+    @classmethod
+    def from_config(cls, app, specs):
+        config = app.config
+        mode = config['JOBS_LEADER_ELECTION']
+        with app.app_context():
+            engine = db.engine
+        if mode == 'off':
+            election = NoElection()
+        elif mode == 'postgres' or (mode == 'auto' and engine.dialect.name == 'postgresql'):
+            election = AdvisoryLockElection(engine)
+        else:
+            election = FileLockElection(config['JOBS_LOCK_FILE'])
+        return cls(app, specs, config['JOBS_MAX_WORKERS'], election, config['JOBS_LEADER_RETRY'])
+
+    def _resolve(self, value):
+        return self.app.config[value] if isinstance(value, str) else value
+
+    def start(self):
+        threading.Thread(target=self._loop, name='job-scheduler', daemon=True).start()
+
+    def wake(self, name):
+        """
+        Run a job as soon as possible, if this worker runs it at all.
+        """
+        with self._cond:
+            self.jobs[name].next_run = time.monotonic()
+            self._cond.notify()
+
+    def _runnable(self, job):
+        return job.enabled and not job.running and (self.is_leader or not job.spec.singleton)
+
+    def _elect(self):
+        try:
+            was_leader = self.is_leader
+            self.is_leader = self.election.try_acquire()
+            if self.is_leader != was_leader:
+                log_info(None, "Scheduler", f"Worker {self.pid} on {self.host} "
+                                            f"{'is now' if self.is_leader else 'is no longer'} the job leader")
+        except Exception as e:
+            self.is_leader = False
+            log_error(None, "Scheduler", f"Leader election failed: {e}")
+        self._next_election = time.monotonic() + self.leader_retry
+
+    def _loop(self):
+        while True:
+            now = time.monotonic()
+            if now >= self._next_election:
+                with self.app.app_context():
+                    self._elect()
+            with self._cond:
+                now = time.monotonic()
+                for job in self.jobs.values():
+                    if self._runnable(job) and job.next_run <= now:
+                        job.running = True
+                        self._pool.submit(self._run, job)
+                waiting = [job.next_run for job in self.jobs.values() if self._runnable(job)]
+                timeout = min(waiting + [self._next_election]) - now
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+    def _run(self, job):
+        started = time.monotonic()
+        job.last_started_at = datetime.utcnow()
+        delay = None
+        error = None
+        with self.app.app_context():
+            try:
+                delay = job.spec.func()
+            except Exception as e:
+                db.session.rollback()
+                error = str(e)
+                log_error(None, "Scheduler", f"Job {job.spec.name} failed: {e}")
+
+        duration = time.monotonic() - started
+        with self._cond:
+            job.running = False
+            job.runs += 1
+            job.last_duration = duration
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
+            if error is not None:
+                job.failures += 1
+            job.last_error = error
+            if isinstance(delay, bool) or not isinstance(delay, (int, float)):
+                delay = job.interval
+            job.next_run = time.monotonic() + delay
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            return {
+                'pid': self.pid,
+                'host': self.host,
+                'leader': self.is_leader,
+                'election': self.election.kind,
+                'started_at': self.started_at.isoformat(),
+                'max_workers': self.max_workers,
+                'running': sum(job.running for job in self.jobs.values()),
+                'jobs': [job.status(self.is_leader) for job in self.jobs.values()]
+            }
@@ -1,60 +1,71 @@
-import threading
-import time
 from backend.auth.decorators import admin_required
-import requests
-from flask import jsonify, current_app
+from flask import jsonify, current_app, request
 
-from backend.helpers import log_error
+from backend.servicies.host_metrics import HostMetrics, downsample
 from backend.servicies.upload_clean_up import services_bp
 
-lock = threading.Lock()
+MAX_HISTORY_POINTS = 600  # longer windows are averaged down to this many points
+
+
+@services_bp.record
+def on_load(state):
+    app = state.app
+    app.host_metrics = HostMetrics.from_config(app.config)
+
 
 @services_bp.route('/server_info', methods=['GET'])
 @admin_required
 def server_info():
-    with lock:  # Ensure thread-safe access to the shared data
-        app = current_app
-        server_info_data = app.server_info_data.copy() if app.server_info_data else None
-
-    if server_info_data:
-        return jsonify(server_info_data), 200
-    else:
+    """
+    The latest host sample, in the layout of the Glances API the dashboard was built against.
+    """
+    samples = current_app.host_metrics.read()
+    if not samples:
         return jsonify({'error': 'Server info not available'}), 503
 
-@services_bp.record
-def on_load(state):
-    app = state.app
-    app.server_info = get_server_info(app)
-    app.server_info_data = None
-    app.server_info_last_update = 0
-
-    def update_server_info():
-        while True:
-            with app.app_context():
-                try:
-                    new_data = app.server_info()  # Fetch new server data
-                    if new_data:
-                        with lock:  # Ensure thread-safe update of the shared data
-                            app.server_info_data = new_data
-                            app.server_info_last_update = time.time()
-                except Exception as e:
-                    log_error(None, "ServerInfo", f"Error updating server info: {e}")
-            time.sleep(1)  # Wait for 1 second before the next update
-
-    update_thread = threading.Thread(target=update_server_info, daemon=True)
-    update_thread.start()
-
-def get_server_info(app):
-    def get_info():
-        url = app.config['MONITOR_SERVICE_URL']
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.json()
-            return None
-        except requests.exceptions.RequestException as e:
-            # Log the exception (optional)
-            print(f"RequestException: {e}")
-            return None
-
-    return get_info
+    sample = samples[-1]
+    return jsonify({
+        'timestamp': sample['timestamp'],
+        'quicklook': {
+            'cpu': sample['cpu'],
+            'mem': sample['mem'],
+            'swap': sample['swap'],
+            'load': sample['load1'],
+            'percpu': [{'cpu_number': i, 'total': total} for i, total in enumerate(sample['percpu'])]
+        },
+        'load': {'min1': sample['load1'], 'min5': sample['load5'], 'min15': sample['load15'], 'cpucore': len(sample['percpu'])},
+        'mem': {'percent': sample['mem'], 'used': sample['mem_used'], 'total': sample['mem_total']},
+        'io': {
+            'disk_read': sample['disk_read'],
+            'disk_write': sample['disk_write'],
+            'net_recv': sample['net_recv'],
+            'net_sent': sample['net_sent']
+        },
+        'storage': {'percent': sample['storage']},
+        'app': {
+            'requests': sample['requests'],
+            'bytes_served': sample['bytes_served'],
+            'active_uploads': sample['active_uploads']
+        }
+    }), 200
+
+
+@services_bp.route('/server_info/history', methods=['GET'])
+@admin_required
+def server_info_history():
+    """
+    Host samples of the last ?seconds=300 (at most the whole buffer), oldest first.
+    ?step=5 averages them in buckets of that many seconds; long windows are averaged anyway.
+    """
+    seconds = max(1, request.args.get('seconds', default=300, type=int))
+    step = request.args.get('step', default=0, type=float)
+    step = max(step, seconds / MAX_HISTORY_POINTS)
+
+    metrics = current_app.host_metrics
+    samples = downsample(metrics.read(seconds), step) if step > metrics.interval else metrics.read(seconds)
+    return jsonify({
+        'interval': metrics.interval,
+        'idle_interval': metrics.idle_interval,
+        'step': step,
+        'samples': samples
+    }), 200
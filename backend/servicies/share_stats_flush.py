@@ -0,0 +1,9 @@
+from flask import current_app
+
+from backend.servicies.scheduler import job
+
+
+@job('share_stats_flush', interval='SHARE_STATS_FLUSH_INTERVAL', singleton=False)
+def flush_share_stats():
+    # Every worker collects its own counters
+    current_app.share_stats.flush()
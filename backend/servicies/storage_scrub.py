@@ -0,0 +1,22 @@
+from flask import current_app
+
+from backend.core.scrub import Throttle, scrub_step
+from backend.helpers import log_info
+from backend.models import ScrubFinding
+from backend.servicies.scheduler import job
+
+throttle = None
+
+
+@job('storage_scrub', interval='SCRUB_PAUSE', enabled='SCRUB_INTERVAL')
+def scrub_storage_continuously():
+    # Small checkpointed steps with a pause in between, a restart continues the interrupted pass
+    global throttle
+    config = current_app.config
+    if throttle is None:
+        throttle = Throttle(config['SCRUB_BYTES_PER_SECOND'])
+    if not scrub_step(config, throttle):
+        return None
+    open_findings = ScrubFinding.query.filter(ScrubFinding.resolved.is_(False)).count()
+    log_info(None, "StorageScrub", f"Scrub pass complete, {open_findings} open findings")
+    return config['SCRUB_INTERVAL']
@@ -0,0 +1,25 @@
+from flask import current_app
+
+from backend.core.tiering import tiering_enabled, promote_files, demote_cold_files
+from backend.helpers import log_info
+from backend.servicies.scheduler import job
+
+
+@job('file_access_flush', interval='FILE_ACCESS_FLUSH_INTERVAL', singleton=False)
+def flush_file_access():
+    # Every worker counts its own reads, cold files that were read are promoted right after
+    read_ids = current_app.file_access.flush()
+    if read_ids and tiering_enabled():
+        promoted = promote_files(read_ids)
+        if promoted:
+            log_info(None, "Tiering", f"Promoted {promoted} files to the hot tier")
+
+
+@job('storage_tiering', interval='TIERING_INTERVAL')
+def demote_files_periodically():
+    if not tiering_enabled():
+        return
+    config = current_app.config
+    demoted = demote_cold_files(config['TIERING_COLD_AFTER_DAYS'], config['TIERING_MIN_SIZE'], config['TIERING_BATCH_SIZE'])
+    if demoted:
+        log_info(None, "Tiering", f"Moved {demoted} files to the cold tier")
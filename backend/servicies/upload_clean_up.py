@@ -1,51 +1,25 @@
-import json
-import os
-import shutil
-import threading
-import time
+from datetime import datetime
 
-from flask import Blueprint
+from flask import Blueprint, current_app
 
-from backend.helpers import log_info, log_error
+from backend.core.file_upload import expire_upload_sessions, next_upload_deadline
+from backend.helpers import log_info
+from backend.servicies.scheduler import job
 
-CLEANUP_INTERVAL = 5*60  # 5 minutes
-STALE_THRESHOLD = 10*60  # 10 minutes
-
-cleanup_lock = threading.Lock()
+MIN_WAIT = 1  # seconds, keeps a session that fails to be discarded from turning this into a busy loop
 
 services_bp = Blueprint('services', __name__)
 
-# Start the cleanup thread when the blueprint is registered
-@services_bp.record
-def on_load(state):
-    app = state.app
-    print('Starting cleanup thread')
-    cleanup_thread = threading.Thread(target=cleanup_stale_temp_dirs, args=(app,), daemon=True)
-    cleanup_thread.start()
-
 
-def cleanup_stale_temp_dirs(app):
-    while True:
-        with app.app_context():
-            with cleanup_lock:
-                upload_folders = [
-                    f for f in os.listdir(app.config['UPLOAD_FOLDER'])
-                    if os.path.isdir(os.path.join(app.config['UPLOAD_FOLDER'], f))
-                ]
-                for folder in upload_folders:
-                    if folder.endswith('_temp'):
-                        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-                        tracking_file = os.path.join(temp_dir, 'tracking.json')
-                        if os.path.exists(tracking_file):
-                            try:
-                                with open(tracking_file, 'r') as tf:
-                                    tracking_data = json.load(tf)
-                                    last_updated = tracking_data.get('last_updated', 0)
-                                    if time.time() - last_updated > STALE_THRESHOLD:
-                                        shutil.rmtree(temp_dir, ignore_errors=True)
-                                        log_info(None, "CleanThread", f'Removed stale temp directory: {temp_dir}')
-                            except Exception as e:
-                                log_error(None, "CleanThread", f'Error reading tracking file {tracking_file}: {e}')
-                                shutil.rmtree(temp_dir, ignore_errors=True)
-                                log_info(None, "CleanThread", f'Removed corrupted temp directory: {temp_dir}')
-        time.sleep(CLEANUP_INTERVAL)
+@job('upload_expiry', interval='UPLOAD_SESSION_TTL', initial_delay=0)
+def expire_uploads():
+    # Runs again at the earliest expires_at, the cost of a run only depends on how many sessions expired.
+    # A session created meanwhile expires one TTL from now at the earliest, so waiting one TTL never misses one.
+    expired, reclaimed = expire_upload_sessions()
+    if expired:
+        log_info(None, "CleanThread", f'Expired {expired} abandoned uploads, reclaimed {reclaimed} bytes')
+    deadline = next_upload_deadline()
+    if deadline is None:
+        return None
+    timeout = (deadline - datetime.utcnow()).total_seconds()
+    return min(max(timeout, MIN_WAIT), current_app.config['UPLOAD_SESSION_TTL'])
@@ -1,3 +1,4 @@
 # from backend.share.revoke import *
-# from backend.share.shareDir import *
-from backend.share.shareFile import *
\ No newline at end of file
+from backend.share.shareDir import *
+from backend.share.shareFile import *
+from backend.share.shareStats import *
@@ -0,0 +1,159 @@
+import math
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class HotFileCache:
+    """
+    Popularity-aware cache of memory-mapped files.
+
+    Every request for a path bumps an exponentially decaying request rate.
+    Once a file is requested often enough it is memory-mapped and kept in a
+    byte-bounded LRU, so viral shares are served straight from the shared
+    mapping instead of re-opening and re-reading the file per request.
+    Files that are not hot are never mapped and keep using regular reads.
+    """
+
+    def __init__(self, max_bytes, max_files, max_file_size, min_hits, window, max_tracked=10000):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_file_size = max_file_size
+        self.min_hits = min_hits
+        self.window = window
+        self.max_tracked = max_tracked
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> (mapping, size, mtime_ns)
+        self._rates = {}  # path -> [score, last_seen]
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_bytes=config['HOT_FILE_CACHE_MAX_BYTES'],
+            max_files=config['HOT_FILE_CACHE_MAX_FILES'],
+            max_file_size=config['HOT_FILE_CACHE_MAX_FILE_SIZE'],
+            min_hits=config['HOT_FILE_CACHE_MIN_HITS'],
+            window=config['HOT_FILE_CACHE_WINDOW'],
+        )
+
+    def get(self, path):
+        """
+        Record a request for `path` and return its memory mapping if the file is hot.
+        Returns None when the file should be streamed from disk instead.
+        """
+        if self.max_bytes <= 0 or self.max_files <= 0:
+            return None
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.invalidate(path)
+            return None
+
+        with self._lock:
+            score = self._bump(path)
+            entry = self._entries.get(path)
+            if entry is not None:
+                mapping, size, mtime_ns = entry
+                if size == st.st_size and mtime_ns == st.st_mtime_ns:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return mapping
+                # File was replaced on disk, drop the stale mapping
+                self._drop(path)
+
+            self.misses += 1
+            if not self._should_admit(score, st.st_size):
+                return None
+
+        # Map outside the lock, the mapping is only published once it succeeded
+        mapping = self._map(path, st.st_size)
+        if mapping is None:
+            return None
+
+        with self._lock:
+            if path not in self._entries:
+                self._make_room(st.st_size)
+                self._entries[path] = (mapping, st.st_size, st.st_mtime_ns)
+                self._bytes += st.st_size
+            return self._entries[path][0]
+
+    def invalidate(self, path):
+        with self._lock:
+            self._drop(path)
+            self._rates.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'cached_files': len(self._entries),
+                'cached_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_files': self.max_files,
+                'tracked_files': len(self._rates),
+            }
+
+    def _bump(self, path):
+        now = time.monotonic()
+        rate = self._rates.get(path)
+        if rate is None:
+            if len(self._rates) >= self.max_tracked:
+                self._prune_rates(now)
+            rate = self._rates[path] = [0.0, now]
+        rate[0] = rate[0] * math.exp(-(now - rate[1]) / self.window) + 1
+        rate[1] = now
+        return rate[0]
+
+    def _prune_rates(self, now):
+        # Forget files whose decayed rate dropped below a single request
+        for path, (score, last_seen) in list(self._rates.items()):
+            if path not in self._entries and score * math.exp(-(now - last_seen) / self.window) < 1:
+                del self._rates[path]
+
+    def _should_admit(self, score, size):
+        if size == 0 or size > self.max_file_size or size > self.max_bytes:
+            return False
+        if score < self.min_hits:
+            return False
+        if len(self._entries) < self.max_files:
+            return True
+        # Only displace the least recently used file if we are more popular than it
+        lru_path = next(iter(self._entries))
+        return score > self._rates.get(lru_path, [0.0])[0]
+
+    def _make_room(self, size):
+        while self._entries and (self._bytes + size > self.max_bytes or len(self._entries) >= self.max_files):
+            lru_path = next(iter(self._entries))
+            self._drop(lru_path)
+            self.evictions += 1
+
+    def _drop(self, path):
+        # Mappings are not closed explicitly: responses that are still streaming
+        # hold a reference and the mapping is released once the last one finishes.
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    @staticmethod
+    def _map(path, size):
+        try:
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+            mapping.madvise(mmap.MADV_WILLNEED)
+        return mapping
@@ -0,0 +1,153 @@
+import os
+
+from flask import request, g, jsonify, abort, Response, current_app, stream_with_context
+
+from backend.auth.decorators import login_required
+from backend.core.archive import stream_zip
+from backend.core.pagination import encode_cursor, decode_cursor, get_page_size
+from backend.core.tree import subtree_filter, relative_path
+from backend.helpers import log_warning
+from backend.models import db, File, Directory
+from backend.share.shareFile import share_bp, toggle_share, get_public_share, authorize_share, \
+    file_stream_response, track_share_download
+
+
+@share_bp.route('/dir/<int:dir_id>', methods=['POST'])
+@login_required
+def toggle_share_directory(dir_id):
+    """
+    Toggle share state of a directory, the share covers the whole subtree.
+    If not currently shared, create a new Share record.
+    If already shared, revoke (delete) the share.
+
+    Body can have: { "password": "...", "revoke": false }
+    """
+    user = g.user
+
+    # Check if directory belongs to user
+    dir_obj = Directory.query.filter_by(id=dir_id, user_id=user.id).first()
+    if not dir_obj:
+        return jsonify({"error": "Directory not found or not owned by user"}), 404
+
+    change = {'name': dir_obj.name, 'path': dir_obj.path, 'parent_id': dir_obj.parent_dir_id}
+    return toggle_share(user, 'directory', dir_obj, change, request.get_json() or {})
+
+
+def get_shared_directory(share_key):
+    """
+    Resolve and authorize a directory share. Returns the share and a fresh share token (or None).
+    """
+    share = get_public_share(share_key)
+    if share['object_type'] != 'directory':
+        abort(400, "Not a directory share")
+    if share['dir_path'] is None:
+        abort(404, "Directory not found")
+    return share, authorize_share(share)
+
+
+def shared_files_query(share):
+    """
+    All files of the shared subtree with their directory path, in a single query.
+    """
+    return db.session.query(
+        File.id, File.filename, File.filesize, File.upload_time, File.filepath, Directory.path
+    ).join(
+        Directory, File.directory_id == Directory.id
+    ).filter(
+        File.user_id == share['owner_id'],
+        subtree_filter(share['owner_id'], share['object_id'], share['dir_path'])
+    )
+
+
+@share_bp.route('/s/<share_key>/list', methods=['GET', 'POST'])
+def public_share_list(share_key):
+    """
+    Paginated listing of every file in a shared directory tree.
+    Pass the returned `next_cursor` as ?cursor= to get the following page.
+    """
+    share, share_token = get_shared_directory(share_key)
+    limit = get_page_size()
+
+    query = shared_files_query(share)
+    cursor = request.args.get('cursor')
+    if cursor:
+        last = decode_cursor(cursor)
+        if not last or len(last) != 3:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(db.tuple_(Directory.path, File.filename, File.id) > db.tuple_(*last))
+
+    rows = query.order_by(Directory.path, File.filename, File.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last.path, last.filename, last.id])
+
+    entries = []
+    for row in rows:
+        directory = relative_path(row.path, share['dir_path'])
+        entries.append({
+            'id': row.id,
+            'filename': row.filename,
+            'path': f"{directory}/{row.filename}" if directory else row.filename,
+            'size': row.filesize,
+            'upload_time': row.upload_time.isoformat() if row.upload_time else None
+        })
+
+    response = jsonify({
+        "name": share['dir_name'],
+        "entries": entries,
+        "next_cursor": next_cursor
+    })
+    if share_token:
+        response.headers['X-Share-Token'] = share_token
+        response.headers['Access-Control-Expose-Headers'] = 'X-Share-Token'
+    return response
+
+
+@share_bp.route('/s/<share_key>/files/<int:file_id>/download', methods=['GET', 'POST'])
+def public_share_file_download(share_key, file_id):
+    """
+    Download a single file of a shared directory tree.
+    """
+    share, share_token = get_shared_directory(share_key)
+
+    file = shared_files_query(share).filter(File.id == file_id).first()
+    if not file:
+        abort(404, "File not found")
+
+    blob = current_app.storage.stat(file.filepath)
+    if blob is None:
+        abort(404, "File missing on server")
+
+    try:
+        response = file_stream_response(file.filepath, file.filename, blob.size, share_token)
+        current_app.file_access.record_read(file.id)
+        return track_share_download(share, response)
+    except Exception as e:
+        return jsonify({'success': False, 'error': 'Failed to download file.'}), 500
+
+
+@share_bp.route('/s/<share_key>/archive', methods=['GET', 'POST'])
+def public_share_archive(share_key):
+    """
+    Stream the whole shared directory tree as a ZIP archive.
+    """
+    share, share_token = get_shared_directory(share_key)
+    archive_name = f"{share['dir_name']}.zip"
+
+    entries = []
+    for row in shared_files_query(share).order_by(Directory.path, File.filename):
+        directory = relative_path(row.path, share['dir_path'])
+        entries.append((row.filepath, os.path.join(share['dir_name'], directory, row.filename)))
+
+    def on_missing(filepath, arcname):
+        log_warning(None, "Share archive; File not found", f"{arcname} ({share_key})")
+
+    response = Response(stream_with_context(stream_zip(entries, on_missing=on_missing)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+    response.headers['X-Filename'] = archive_name
+    response.headers['Access-Control-Expose-Headers'] = 'X-Filename, X-Share-Token'
+    if share_token:
+        response.headers['X-Share-Token'] = share_token
+    return track_share_download(share, response)
@@ -1,78 +1,192 @@
-import os
+import hashlib
+import hmac
 import uuid
-from flask import Blueprint, request, g, jsonify, send_file, abort, Response
-from backend.auth.decorators import login_required
+from flask import Blueprint, request, g, jsonify, abort, current_app
+from backend.auth.decorators import login_required, admin_required
+from backend.auth.jwt_utils import generate_share_token, decode_token
+from backend.core.download import blob_response
+from backend.core.changes import record_change, file_path
+from backend.metrics import measure_stream
 from backend.models import db, File, Share
+from backend.share.hot_cache import HotFileCache
+from backend.share.share_cache import ShareCache, is_share_expired
+from backend.share.stats import ShareStatsCollector, count_bytes
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
 share_bp = Blueprint('share_bp', __name__)
 
+@share_bp.record
+def on_load(state):
+    app = state.app
+    app.hot_file_cache = HotFileCache.from_config(app.config)
+    with app.app_context():
+        app.share_cache = ShareCache.from_config(app.config)
+    app.share_stats = ShareStatsCollector()
+
+
 def generate_share_key():
     return str(uuid.uuid4())  # or any random string generator
-@share_bp.route('/file/<int:file_id>', methods=['POST'])
-@login_required
-def toggle_share_file(file_id):
+
+
+def password_fingerprint(password_hash):
     """
-    Toggle share state of a file.
-    If not currently shared, create a new Share record.
-    If already shared, revoke (delete) the share.
+    Short digest of a share's password hash.
+    Embedded in share tokens so that changing the password invalidates tokens already handed out.
+    """
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
 
-    Body can have: { "password": "...", "revoke": false }
+
+def get_public_share(share_key):
+    """
+    Resolve a share key through the share cache, aborting on unknown or expired shares.
+    """
+    share = current_app.share_cache.resolve(share_key)
+    if not share:
+        abort(404, "Invalid share key")
+    if is_share_expired(share):
+        abort(410, "Share link expired")
+    return share
+
+
+def get_share_token():
+    token = request.headers.get('X-Share-Token') or request.args.get('token')
+    if not token:
+        token = (request.get_json(silent=True) or {}).get('share_token')
+    return token
+
+
+def has_valid_share_token(share):
+    """
+    Check the share token of the current request against the share, without touching the password hash.
+    """
+    token = get_share_token()
+    if not token:
+        return False
+
+    payload = decode_token(token)
+    if 'error' in payload or payload.get('token_type') != 'share':
+        return False
+    if payload.get('share_key') != share['share_key']:
+        return False
+    return hmac.compare_digest(payload.get('pwd', ''), password_fingerprint(share['password']))
+
+
+def authorize_share(share):
+    """
+    Enforce the share password, accepting a valid share token instead of the password.
+    Returns a fresh share token when the password had to be checked, None otherwise.
+    """
+    if not share['password'] or has_valid_share_token(share):
+        return None
+
+    data = request.get_json(silent=True) or {}
+    provided_password = data.get('password', None)
+    if not provided_password or not check_password_hash(share['password'], provided_password):
+        abort(403, "Invalid or missing password")
+    # Hand out a token so follow-up requests (retries, resumes) skip the hash check
+    return generate_share_token(share['share_key'], password_fingerprint(share['password']))
+
+
+def track_share_download(share, response):
+    """
+    Count a download of the share and the bytes its response body actually sends.
+    """
+    stats = current_app.share_stats
+    stats.record_hit(share['share_id'])
+    response.response = count_bytes(response.response, stats, share['share_id'])
+    return response
+
+
+def file_stream_response(key, filename, size, share_token=None):
+    # Popular files of a local backend are served from a shared memory mapping, everything else is streamed
+    local_path = current_app.storage.local_path(key)
+    mapping = current_app.hot_file_cache.get(local_path) if local_path else None
+
+    response = blob_response(key, filename, size, mapping=mapping)
+    response.headers['Access-Control-Expose-Headers'] = 'X-Filename, X-Share-Token'
+    if share_token:
+        response.headers['X-Share-Token'] = share_token
+    return response
+
+
+def toggle_share(user, object_type, obj, change, data):
+    """
+    Create, update or revoke the share of `obj`, a file or directory already checked to be owned by `user`.
+    `change` holds the name, path and parent_id recorded in the change log.
     """
-    user = g.user
-    data = request.get_json() or {}
     password = data.get('password')  # optional
     revoke = data.get('revoke', False)
-
-    # Check if file belongs to user
-    file_obj = File.query.filter_by(id=file_id, user_id=user.id).first()
-    if not file_obj:
-        return jsonify({"error": "File not found or not owned by user"}), 404
+    noun = 'File' if object_type == 'file' else 'Directory'
 
     # Check if share already exists
     existing_share = Share.query.filter_by(
         owner_id=user.id,
-        object_type='file',
-        object_id=file_id
+        object_type=object_type,
+        object_id=obj.id
     ).first()
 
     if revoke:
         # Revoke (delete) existing share
         if existing_share:
             db.session.delete(existing_share)
+            record_change(user.id, 'unshare', object_type, obj.id, **change)
             db.session.commit()
+            current_app.share_cache.invalidate(existing_share.share_key)
             return jsonify({"message": "Share revoked"}), 200
         else:
-            return jsonify({"error": "File is not shared"}), 400
+            return jsonify({"error": f"{noun} is not shared"}), 400
     else:
         # Create or update share
         if not existing_share:
             new_share = Share(
                 owner_id=user.id,
-                object_type='file',
-                object_id=file_id,
+                object_type=object_type,
+                object_id=obj.id,
                 share_key=generate_share_key(),
                 permission='read',
                 # Store hashed password if provided
                 password=generate_password_hash(password) if password else None
             )
             db.session.add(new_share)
+            record_change(user.id, 'share', object_type, obj.id, **change)
             db.session.commit()
             return jsonify({
-                "message": "File shared successfully",
+                "message": f"{noun} shared successfully",
                 "share_key": new_share.share_key
             }), 201
         else:
             # If already shared, consider updating password
             existing_share.password = generate_password_hash(password) if password else None
             db.session.commit()
+            current_app.share_cache.invalidate(existing_share.share_key)
             return jsonify({
                 "message": "Share already existed, password updated",
                 "share_key": existing_share.share_key
             }), 200
 
 
+@share_bp.route('/file/<int:file_id>', methods=['POST'])
+@login_required
+def toggle_share_file(file_id):
+    """
+    Toggle share state of a file.
+    If not currently shared, create a new Share record.
+    If already shared, revoke (delete) the share.
+
+    Body can have: { "password": "...", "revoke": false }
+    """
+    user = g.user
+
+    # Check if file belongs to user
+    file_obj = File.query.filter_by(id=file_id, user_id=user.id).first()
+    if not file_obj:
+        return jsonify({"error": "File not found or not owned by user"}), 404
+
+    change = {'name': file_obj.filename, 'path': file_path(file_obj), 'parent_id': file_obj.directory_id}
+    return toggle_share(user, 'file', file_obj, change, request.get_json() or {})
+
+
 @share_bp.route('/s/<share_key>', methods=['GET'])
 def public_share_page(share_key):
     """
@@ -80,77 +194,87 @@ def public_share_page(share_key):
     This can be a minimal page or JSON response
     that your frontend uses to render the share page.
     """
-    share = Share.query.filter_by(share_key=share_key).first()
-    if not share:
-        abort(404, "Invalid share key")
-    if share.is_expired:
-        abort(410, "Share link expired")
+    share = get_public_share(share_key)
 
-    # Confirm it's for a file
-    if share.object_type != 'file':
-        abort(400, "Currently only file shares are supported")
+    if share['object_type'] == 'directory':
+        if share['dir_path'] is None:
+            abort(404, "Directory not found")
+        return jsonify({
+            "type": "directory",
+            "name": share['dir_name'],
+            "needs_password": share['password'] is not None
+        })
 
     # We can return a minimal HTML or JSON for your React app to handle
-    file_id = share.object_id
-    file_obj = File.query.filter_by(id=file_id).first()
-    if not file_obj:
+    if share['filepath'] is None:
         abort(404, "File not found")
 
     # Return basic info, let front-end handle the password prompt if needed
     return jsonify({
-        "filename": file_obj.filename,
-        "needs_password": share.password is not None
+        "type": "file",
+        "filename": share['filename'],
+        "needs_password": share['password'] is not None
     })
-@share_bp.route('/s/<share_key>/download', methods=['POST'])
-def public_share_download(share_key):
+
+
+@share_bp.route('/s/<share_key>/access', methods=['POST'])
+def public_share_access(share_key):
     """
-    Attempt to download the file. If password is set, user must provide correct password.
-    The request can have JSON body with {"password": "..."} if needed.
+    Exchange the share password for a short-lived share token.
+    The password hash is checked once here; downloads then send the token
+    (X-Share-Token header, ?token= or {"share_token": "..."}) instead of the password.
     """
-    share = Share.query.filter_by(share_key=share_key).first()
-    if not share:
-        abort(404, "Invalid share key")
-    if share.is_expired:
-        abort(410, "Share link expired")
-
-    data = request.get_json() or {}
-    provided_password = data.get('password', None)
+    share = get_public_share(share_key)
 
-    # If the share has a hashed password, validate
-    if share.password:
-        if not provided_password or not check_password_hash(share.password, provided_password):
+    fingerprint = ''
+    if share['password']:
+        data = request.get_json(silent=True) or {}
+        provided_password = data.get('password', None)
+        if not provided_password or not check_password_hash(share['password'], provided_password):
             abort(403, "Invalid or missing password")
+        fingerprint = password_fingerprint(share['password'])
+
+    return jsonify({
+        "share_token": generate_share_token(share['share_key'], fingerprint),
+        "expires_in": current_app.config['SHARE_TOKEN_EXPIRES']
+    }), 200
+
+
+@share_bp.route('/s/<share_key>/download', methods=['GET', 'POST'])
+def public_share_download(share_key):
+    """
+    Attempt to download the file. If password is set, user must provide a valid share token
+    or the correct password. The request can have JSON body with {"password": "..."} if needed.
+    """
+    share = get_public_share(share_key)
+
+    # If the share has a hashed password, validate the token or fall back to the password
+    share_token = authorize_share(share)
 
     # All good, proceed with file download
-    file = File.query.filter_by(id=share.object_id).first()
-    if not file:
+    if share['object_type'] != 'file' or share['filepath'] is None:
         abort(404, "File not found")
+    key, filename = share['filepath'], share['filename']
 
-    if not os.path.exists(file.filepath):
+    blob = current_app.storage.stat(key)
+    if blob is None:
         abort(404, "File missing on server")
 
     try:
-        # Instead of using send_file, we create a generator to stream the file contents.
-        def generate():
-            with open(file.filepath, 'rb') as f:
-                while True:
-                    chunk = f.read(8192)  # 8 KB per iteration
-                    if not chunk:
-                        break
-                    yield chunk
-
-        # Build streaming response
-        response = Response(
-            generate(),
-            mimetype='application/octet-stream'
-        )
-        # Set headers for file download
-        response.headers['Content-Disposition'] = f'attachment; filename="{file.filename}"'
-        response.headers['X-Filename'] = file.filename
-        response.headers['Access-Control-Expose-Headers'] = 'X-Filename'
-        return response
-
+        response = file_stream_response(key, filename, blob.size, share_token)
+        response.response = measure_stream(response.response, 'share')
+        current_app.file_access.record_read(share['object_id'])
+        return track_share_download(share, response)
     except Exception as e:
         return jsonify({'success': False, 'error': 'Failed to download file.'}), 500
 
 
+@share_bp.route('/hot_cache', methods=['GET'])
+@admin_required
+def hot_cache_stats():
+    """
+    Hit/miss counters and occupancy of the hot-file cache of this worker.
+    """
+    return jsonify(current_app.hot_file_cache.stats()), 200
+
+
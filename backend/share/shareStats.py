@@ -0,0 +1,53 @@
+from flask import g, jsonify, request, current_app
+
+from backend.auth.decorators import login_required, admin_required
+from backend.models import db, Share, ShareStats
+from backend.share.shareFile import share_bp
+
+
+def share_stats_data(share, stats):
+    # Include counters of this worker that have not been flushed yet
+    hits, bytes_served, last_accessed_at = current_app.share_stats.pending(share.id)
+    if stats:
+        hits += stats.hits
+        bytes_served += stats.bytes_served
+        if stats.last_accessed_at and (last_accessed_at is None or stats.last_accessed_at > last_accessed_at):
+            last_accessed_at = stats.last_accessed_at
+
+    return {
+        'share_key': share.share_key,
+        'owner_id': share.owner_id,
+        'object_type': share.object_type,
+        'object_id': share.object_id,
+        'hits': hits,
+        'bytes_served': bytes_served,
+        'last_accessed_at': last_accessed_at.isoformat() if last_accessed_at else None
+    }
+
+
+@share_bp.route('/stats', methods=['GET'])
+@login_required
+def my_share_stats():
+    """
+    Access counters of all shares owned by the current user.
+    """
+    user = g.user
+    rows = db.session.query(Share, ShareStats).outerjoin(
+        ShareStats, ShareStats.share_id == Share.id
+    ).filter(Share.owner_id == user.id).all()
+
+    return jsonify({'shares': [share_stats_data(share, stats) for share, stats in rows]}), 200
+
+
+@share_bp.route('/stats/all', methods=['GET'])
+@admin_required
+def all_share_stats():
+    """
+    Shares across all users, ordered by the bytes they served.
+    """
+    limit = request.args.get('limit', default=100, type=int)
+    rows = db.session.query(Share, ShareStats).join(
+        ShareStats, ShareStats.share_id == Share.id
+    ).order_by(ShareStats.bytes_served.desc()).limit(max(1, min(limit, 1000))).all()
+
+    return jsonify({'shares': [share_stats_data(share, stats) for share, stats in rows]}), 200
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+
+from backend.helpers import log_warning
+from backend.models import db, File, Share, Directory
+
+
+class MemoryShareCacheBackend:
+    """
+    Process-local LRU with a per-entry TTL.
+    Invalidations only reach this worker, other workers pick up changes once the TTL runs out.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # share_key -> (expires_at, resolved)
+
+    def get(self, share_key):
+        with self._lock:
+            entry = self._entries.get(share_key)
+            if entry is None:
+                return None
+            expires_at, resolved = entry
+            if expires_at < time.monotonic():
+                del self._entries[share_key]
+                return None
+            self._entries.move_to_end(share_key)
+            return resolved
+
+    def set(self, share_key, resolved):
+        with self._lock:
+            self._entries[share_key] = (time.monotonic() + self.ttl, resolved)
+            self._entries.move_to_end(share_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *share_keys):
+        with self._lock:
+            for share_key in share_keys:
+                self._entries.pop(share_key, None)
+
+
+class RedisShareCacheBackend:
+    """
+    Shared store for multi-worker deployments, so an invalidation is seen by every worker.
+    Eviction is left to the Redis maxmemory policy.
+    """
+
+    def __init__(self, url, ttl, prefix='passthebytes:share:'):
+        import redis  # optional dependency, only needed when SHARE_CACHE_URL is set
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, share_key):
+        raw = self.client.get(self.prefix + share_key)
+        return json.loads(raw) if raw else None
+
+    def set(self, share_key, resolved):
+        self.client.setex(self.prefix + share_key, self.ttl, json.dumps(resolved))
+
+    def delete(self, *share_keys):
+        if share_keys:
+            self.client.delete(*[self.prefix + share_key for share_key in share_keys])
+
+
+class ShareCache:
+    """
+    Resolves share keys to everything the public share endpoints need,
+    so popular links don't hit the database on every request.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @classmethod
+    def from_config(cls, config):
+        ttl = config['SHARE_CACHE_TTL']
+        if config.get('SHARE_CACHE_URL'):
+            try:
+                return cls(RedisShareCacheBackend(config['SHARE_CACHE_URL'], ttl))
+            except ImportError:
+                log_warning(None, "Share cache", "redis is not installed, falling back to the in-memory share cache")
+        return cls(MemoryShareCacheBackend(config['SHARE_CACHE_MAX_ENTRIES'], ttl))
+
+    def resolve(self, share_key):
+        """
+        Return the resolved share as a dict, or None if the share key doesn't exist.
+        """
+        try:
+            resolved = self.backend.get(share_key)
+        except Exception as e:
+            log_warning(None, "Share cache", f"Lookup failed, using database: {e}")
+            resolved = None
+        if resolved is not None:
+            return resolved
+
+        resolved = load_share(share_key)
+        if resolved is not None:
+            try:
+                self.backend.set(share_key, resolved)
+            except Exception as e:
+                log_warning(None, "Share cache", f"Store failed: {e}")
+        return resolved
+
+    def invalidate(self, *share_keys):
+        try:
+            self.backend.delete(*share_keys)
+        except Exception as e:
+            log_warning(None, "Share cache", f"Invalidation failed: {e}")
+
+
+def load_share(share_key):
+    # Share and the shared file or directory in a single round trip
+    row = db.session.query(Share, File, Directory).outerjoin(
+        File, db.and_(Share.object_type == 'file', File.id == Share.object_id)
+    ).outerjoin(
+        Directory, db.and_(Share.object_type == 'directory', Directory.id == Share.object_id)
+    ).filter(Share.share_key == share_key).first()
+    if row is None:
+        return None
+
+    share, file_obj, dir_obj = row
+    return {
+        'share_id': share.id,
+        'share_key': share.share_key,
+        'owner_id': share.owner_id,
+        'object_type': share.object_type,
+        'object_id': share.object_id,
+        'password': share.password,
+        'expiration_time': share.expiration_time.timestamp() if share.expiration_time else None,
+        'filepath': file_obj.filepath if file_obj else None,
+        'filename': file_obj.filename if file_obj else None,
+        'filesize': file_obj.filesize if file_obj else None,
+        'dir_name': dir_obj.name if dir_obj else None,
+        'dir_path': dir_obj.path if dir_obj else None,
+    }
+
+
+def is_share_expired(resolved):
+    expiration_time = resolved['expiration_time']
+    return expiration_time is not None and datetime.utcnow().timestamp() > expiration_time
+
+
+def invalidate_object_shares(object_type, object_ids):
+    """
+    Drop cached resolutions of all shares that point at the given files or directories.
+    """
+    if not object_ids:
+        return
+    share_keys = [
+        share_key for (share_key,) in db.session.query(Share.share_key).filter(
+            Share.object_type == object_type,
+            Share.object_id.in_(object_ids)
+        )
+    ]
+    if share_keys:
+        current_app.share_cache.invalidate(*share_keys)
+
+
+def invalidate_file_shares(file_ids):
+    invalidate_object_shares('file', file_ids)
+
+
+def invalidate_directory_shares(dir_ids):
+    invalidate_object_shares('directory', dir_ids)
@@ -0,0 +1,118 @@
+import threading
+from datetime import datetime
+
+from backend.helpers import log_error
+from backend.models import db, Share, ShareStats
+
+
+class ShareStatsCollector:
+    """
+    Collects per-share hits and served bytes in memory and writes them to the
+    database in batches, so downloads never pay for a synchronous UPDATE.
+    Counters are per worker process; every worker flushes its own batch.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # share_id -> [hits, bytes_served, last_accessed_at]
+
+    def record_hit(self, share_id):
+        with self._lock:
+            counters = self._counters(share_id)
+            counters[0] += 1
+            counters[2] = datetime.utcnow()
+
+    def record_bytes(self, share_id, nbytes):
+        with self._lock:
+            self._counters(share_id)[1] += nbytes
+
+    def pending(self, share_id):
+        with self._lock:
+            counters = self._pending.get(share_id)
+            return list(counters) if counters else [0, 0, None]
+
+    def flush(self):
+        """
+        Write all pending counters in one batch. Must run inside an app context.
+        On failure the batch is merged back and retried on the next flush.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        try:
+            share_ids = list(batch)
+            existing = {
+                share_id for (share_id,) in
+                db.session.query(ShareStats.share_id).filter(ShareStats.share_id.in_(share_ids))
+            }
+            # Shares revoked since the hit was recorded are dropped
+            live = {
+                share_id for (share_id,) in
+                db.session.query(Share.id).filter(Share.id.in_(set(share_ids) - existing))
+            }
+
+            updates = [
+                {'b_share_id': share_id, 'b_hits': hits, 'b_bytes': nbytes, 'b_last': last}
+                for share_id, (hits, nbytes, last) in batch.items() if share_id in existing
+            ]
+            if updates:
+                table = ShareStats.__table__
+                last_accessed = db.case(
+                    (db.or_(table.c.last_accessed_at.is_(None), table.c.last_accessed_at < db.bindparam('b_last')),
+                     db.bindparam('b_last')),
+                    else_=table.c.last_accessed_at
+                )
+                db.session.execute(
+                    table.update().where(table.c.share_id == db.bindparam('b_share_id')).values(
+                        hits=table.c.hits + db.bindparam('b_hits'),
+                        bytes_served=table.c.bytes_served + db.bindparam('b_bytes'),
+                        last_accessed_at=last_accessed
+                    ),
+                    updates
+                )
+
+            inserts = [
+                {'share_id': share_id, 'hits': hits, 'bytes_served': nbytes, 'last_accessed_at': last}
+                for share_id, (hits, nbytes, last) in batch.items() if share_id in live
+            ]
+            if inserts:
+                db.session.execute(ShareStats.__table__.insert(), inserts)
+
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._merge_back(batch)
+            log_error(None, "Share stats", f"Failed to flush {len(batch)} share counters: {e}")
+            return 0
+        return len(batch)
+
+    def _counters(self, share_id):
+        counters = self._pending.get(share_id)
+        if counters is None:
+            counters = self._pending[share_id] = [0, 0, None]
+        return counters
+
+    def _merge_back(self, batch):
+        with self._lock:
+            for share_id, (hits, nbytes, last) in batch.items():
+                counters = self._counters(share_id)
+                counters[0] += hits
+                counters[1] += nbytes
+                if last and (counters[2] is None or last > counters[2]):
+                    counters[2] = last
+
+
+def count_bytes(chunks, collector, share_id):
+    """
+    Pass through a response body, recording how many bytes actually went out once it is done.
+    """
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        collector.record_bytes(share_id, sent)
+
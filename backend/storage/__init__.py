@@ -0,0 +1,32 @@
+from backend.storage.base import StorageBackend, BlobStat
+from backend.storage.blobs import COLD_PREFIX, is_blob_key, is_cold_key, new_blob_key, clone_file
+from backend.storage.local import LocalStorage
+from backend.storage.tiered import TieredStorage
+from backend.storage.timed import TimedStorage
+
+
+def create_storage(config):
+    """
+    Storage backend selected by STORAGE_BACKEND: 'local' (default) or 's3'.
+    With COLD_BLOB_FOLDER set, it becomes the hot tier of a TieredStorage.
+    The result is wrapped in a TimedStorage, `.backend` is the actual backend.
+    """
+    backend = _create_backend(config)
+    if config.get('COLD_BLOB_FOLDER'):
+        backend = TieredStorage(backend, LocalStorage(config['COLD_BLOB_FOLDER']))
+    return TimedStorage(backend)
+
+
+def _create_backend(config):
+    if config.get('STORAGE_BACKEND') == 's3':
+        from backend.storage.s3 import S3Storage
+        return S3Storage(
+            bucket=config['S3_BUCKET'],
+            prefix=config.get('S3_PREFIX') or '',
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            access_key_id=config.get('S3_ACCESS_KEY_ID'),
+            secret_access_key=config.get('S3_SECRET_ACCESS_KEY'),
+            legacy_root=config['BLOB_FOLDER'],
+        )
+    return LocalStorage(config['BLOB_FOLDER'])
@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+BlobStat = namedtuple('BlobStat', ['size', 'modified'])  # modified is a naive UTC datetime
+
+
+class StorageBackend:
+    """
+    Where file data lives. Keys are the values of File.filepath.
+
+    Multipart uploads follow the S3 model: parts are numbered from 1, `upload_part` returns
+    a part descriptor ({'PartNumber': ..., 'ETag': ...}) and `complete_multipart` receives them all.
+    """
+
+    # Smallest part every part but the last must have, S3 refuses anything below 5 MiB
+    min_part_size = 0
+
+    def local_path(self, key):
+        """
+        Path of the blob on this machine, or None when it isn't on a local filesystem.
+        """
+        return None
+
+    def put(self, key, fileobj):
+        raise NotImplementedError
+
+    def put_file(self, key, source_path):
+        """
+        Store the content of a local file under `key`.
+        """
+        with open(source_path, 'rb') as f:
+            self.put(key, f)
+
+    def copy(self, source_key, key):
+        raise NotImplementedError
+
+    def create_multipart(self, key):
+        """
+        Start a multipart upload to `key` and return its upload id.
+        """
+        raise NotImplementedError
+
+    def upload_part(self, key, upload_id, part_number, fileobj):
+        raise NotImplementedError
+
+    def complete_multipart(self, key, upload_id, parts):
+        """
+        Assemble the parts into the blob and return its size.
+        """
+        raise NotImplementedError
+
+    def abort_multipart(self, key, upload_id):
+        raise NotImplementedError
+
+    def open(self, key, start=0, end=None):
+        """
+        Iterate over the bytes [start, end) of the blob, or until its end when `end` is None.
+        Raises FileNotFoundError if the blob doesn't exist.
+        """
+        raise NotImplementedError
+
+    def stat(self, key):
+        """
+        BlobStat of the blob, or None if it doesn't exist.
+        """
+        raise NotImplementedError
+
+    def iter_keys(self, start_after=None):
+        """
+        Iterate over all stored keys in a stable order, starting after `start_after`.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Remove the blob. Deleting a blob that doesn't exist is not an error.
+        """
+        raise NotImplementedError
@@ -0,0 +1,52 @@
+import errno
+import fcntl
+import os
+import shutil
+import uuid
+
+FICLONE = 0x40049409  # ioctl request of a Linux reflink, see ioctl_ficlone(2)
+
+# File data is addressed by a blob key <ab>/<cd>/<blob id>, where ab and cd are the first characters
+# of the random id, resolved by the storage backend (below BLOB_FOLDER, or in a bucket).
+# File.filepath stores only the key, so the tree can be reorganized without touching data.
+# Absolute filepaths are the legacy layout (UPLOAD_FOLDER/<user id>/<directory path>/<filename>)
+# until `flask files migrate-blobs` ran.
+# Blobs moved to the cold tier have their key prefixed with COLD_PREFIX, see backend/storage/tiered.py.
+
+COLD_PREFIX = 'cold/'
+
+
+def is_blob_key(filepath):
+    return not os.path.isabs(filepath)
+
+
+def is_cold_key(filepath):
+    return filepath.startswith(COLD_PREFIX)
+
+
+def new_blob_key():
+    blob_id = uuid.uuid4().hex
+    return '/'.join((blob_id[:2], blob_id[2:4], blob_id))
+
+
+def clone_file(source, destination):
+    """
+    Give `destination` the content of `source` without copying bytes where possible:
+    a reflink on copy-on-write filesystems (btrfs, XFS), otherwise a hardlink, which is safe
+    because blobs are never modified in place. Falls back to a regular copy.
+    """
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+    os.remove(destination)
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+    shutil.copyfile(source, destination)
+    return 'copy'
@@ -0,0 +1,115 @@
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+from backend.storage.blobs import is_blob_key, clone_file
+from backend.storage.base import StorageBackend, BlobStat
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class LocalStorage(StorageBackend):
+    """
+    Blobs as files below `root`. Absolute keys (files of the legacy layout) are used as they are.
+    Multipart uploads stage their parts in `root`/.multipart/<upload id>/ until they are completed.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.staging = os.path.join(root, '.multipart')
+
+    def local_path(self, key):
+        return os.path.join(self.root, key) if is_blob_key(key) else key
+
+    def _prepare(self, key):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def put(self, key, fileobj):
+        path = self._prepare(key)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def put_file(self, key, source_path):
+        clone_file(source_path, self._prepare(key))
+
+    def copy(self, source_key, key):
+        clone_file(self.local_path(source_key), self._prepare(key))
+
+    def create_multipart(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.staging, upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, fileobj):
+        part_path = os.path.join(self.staging, upload_id, f'part_{part_number}')
+        with open(part_path, 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+        return {'PartNumber': part_number, 'ETag': str(os.path.getsize(part_path))}
+
+    def complete_multipart(self, key, upload_id, parts):
+        path = self._prepare(key)
+        partial = f'{path}.partial'
+        with open(partial, 'wb') as dst:
+            for part in sorted(parts, key=lambda p: p['PartNumber']):
+                with open(os.path.join(self.staging, upload_id, f"part_{part['PartNumber']}"), 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+        os.replace(partial, path)
+        shutil.rmtree(os.path.join(self.staging, upload_id), ignore_errors=True)
+        return os.path.getsize(path)
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(os.path.join(self.staging, upload_id), ignore_errors=True)
+
+    def open(self, key, start=0, end=None):
+        path = self.local_path(key)
+        f = open(path, 'rb')  # raises FileNotFoundError right away, not on the first chunk
+
+        def generate():
+            with f:
+                f.seek(start)
+                remaining = None if end is None else end - start
+                while remaining is None or remaining > 0:
+                    chunk = f.read(READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    yield chunk
+
+        return generate()
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.local_path(key))
+        except OSError:
+            return None
+        return BlobStat(st.st_size, datetime.utcfromtimestamp(st.st_mtime))
+
+    def iter_keys(self, start_after=None):
+        return self._iter_keys(self.root, '', start_after or '')
+
+    def _iter_keys(self, directory, prefix, start_after):
+        # Directories sort as 'name/', so keys come out in the order of their strings
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name + '/' if e.is_dir() else e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.') or entry.name.endswith('.partial'):
+                continue  # the multipart staging area and blobs being assembled
+            key = prefix + entry.name
+            if entry.is_dir():
+                # Skip subtrees entirely before the resume point
+                if key + '/' >= start_after[:len(key) + 1]:
+                    yield from self._iter_keys(entry.path, key + '/', start_after)
+            elif key > start_after:
+                yield key
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
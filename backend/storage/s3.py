@@ -0,0 +1,124 @@
+from backend.storage.blobs import is_blob_key
+from backend.storage.base import StorageBackend, BlobStat
+from backend.storage.local import LocalStorage
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class S3Storage(StorageBackend):
+    """
+    Blobs as objects of an S3-compatible bucket (AWS S3, MinIO, or moto in tests),
+    under `prefix` + the blob key. Upload chunks map one to one to multipart parts.
+    Absolute keys (files of the legacy layout not migrated yet) are still read from the local disk.
+    """
+
+    min_part_size = 5 * 1024 * 1024
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, access_key_id=None, secret_access_key=None,
+                 legacy_root=''):
+        import boto3  # optional dependency, only needed when STORAGE_BACKEND is 's3'
+        from botocore.exceptions import ClientError
+
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+        )
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ClientError = ClientError
+        self.legacy = LocalStorage(legacy_root)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def local_path(self, key):
+        return None if is_blob_key(key) else key
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, key, fileobj):
+        self.client.upload_fileobj(fileobj, self.bucket, self._key(key))
+
+    def put_file(self, key, source_path):
+        # Managed transfer, large files go up as parallel multipart uploads
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+
+    def copy(self, source_key, key):
+        if not is_blob_key(source_key):
+            # Files of the legacy layout are still on the local disk
+            return self.put_file(key, source_key)
+        # Server-side copy, the data never passes through this node
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(source_key)}, self.bucket, self._key(key))
+
+    def create_multipart(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key))['UploadId']
+
+    def upload_part(self, key, upload_id, part_number, fileobj):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self._key(key), UploadId=upload_id, PartNumber=part_number, Body=fileobj
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def complete_multipart(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+            MultipartUpload={'Parts': sorted(parts, key=lambda p: p['PartNumber'])}
+        )
+        return self.stat(key).size
+
+    def abort_multipart(self, key, upload_id):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+        except self.ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                raise
+
+    def open(self, key, start=0, end=None):
+        if not is_blob_key(key):
+            return self.legacy.open(key, start, end)
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)['Body']
+        except self.ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+        def generate():
+            try:
+                yield from body.iter_chunks(READ_CHUNK_SIZE)
+            finally:
+                body.close()
+
+        return generate()
+
+    def stat(self, key):
+        if not is_blob_key(key):
+            return self.legacy.stat(key)
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return BlobStat(head['ContentLength'], head['LastModified'].replace(tzinfo=None))
+
+    def iter_keys(self, start_after=None):
+        paginator = self.client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+        if start_after:
+            kwargs['StartAfter'] = self._key(start_after)
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):]
+
+    def delete(self, key):
+        if not is_blob_key(key):
+            return self.legacy.delete(key)
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
@@ -0,0 +1,88 @@
+import tempfile
+
+from backend.storage.blobs import COLD_PREFIX, is_cold_key
+from backend.storage.base import StorageBackend
+
+
+class TieredStorage(StorageBackend):
+    """
+    A fast `hot` backend for the working set and a slower, cheaper `cold` one for data nobody reads.
+    Keys starting with COLD_PREFIX live on the cold backend (stored there without the prefix),
+    all others on the hot backend. New uploads always go to the hot tier.
+    """
+
+    def __init__(self, hot, cold):
+        self.hot = hot
+        self.cold = cold
+        self.min_part_size = hot.min_part_size
+
+    def _route(self, key):
+        if is_cold_key(key):
+            return self.cold, key[len(COLD_PREFIX):]
+        return self.hot, key
+
+    def local_path(self, key):
+        backend, key = self._route(key)
+        return backend.local_path(key)
+
+    def put(self, key, fileobj):
+        backend, key = self._route(key)
+        backend.put(key, fileobj)
+
+    def put_file(self, key, source_path):
+        backend, key = self._route(key)
+        backend.put_file(key, source_path)
+
+    def copy(self, source_key, key):
+        source, source_key = self._route(source_key)
+        destination, key = self._route(key)
+        if source is destination:
+            return source.copy(source_key, key)
+
+        # Between tiers the data has to pass through this node
+        local_path = source.local_path(source_key)
+        if local_path:
+            return destination.put_file(key, local_path)
+        with tempfile.TemporaryFile() as spool:
+            for chunk in source.open(source_key):
+                spool.write(chunk)
+            spool.seek(0)
+            destination.put(key, spool)
+
+    def create_multipart(self, key):
+        backend, key = self._route(key)
+        return backend.create_multipart(key)
+
+    def upload_part(self, key, upload_id, part_number, fileobj):
+        backend, key = self._route(key)
+        return backend.upload_part(key, upload_id, part_number, fileobj)
+
+    def complete_multipart(self, key, upload_id, parts):
+        backend, key = self._route(key)
+        return backend.complete_multipart(key, upload_id, parts)
+
+    def abort_multipart(self, key, upload_id):
+        backend, key = self._route(key)
+        backend.abort_multipart(key, upload_id)
+
+    def open(self, key, start=0, end=None):
+        backend, key = self._route(key)
+        return backend.open(key, start, end)
+
+    def stat(self, key):
+        backend, key = self._route(key)
+        return backend.stat(key)
+
+    def iter_keys(self, start_after=None):
+        # All hot keys, then all cold keys
+        if not start_after or not is_cold_key(start_after):
+            yield from self.hot.iter_keys(start_after)
+            start_after = None
+        else:
+            start_after = start_after[len(COLD_PREFIX):]
+        for key in self.cold.iter_keys(start_after):
+            yield COLD_PREFIX + key
+
+    def delete(self, key):
+        backend, key = self._route(key)
+        backend.delete(key)
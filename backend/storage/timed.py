@@ -0,0 +1,47 @@
+import time
+import types
+
+from backend.profiling import current_timings
+
+
+class TimedStorage:
+    """
+    Wraps a storage backend to count the time spent in it into the Server-Timing breakdown of
+    a profiled request. Generators (open, iter_keys) are timed per step.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            timings = current_timings()
+            if timings is None:
+                return attr(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            finally:
+                timings['fs'] += time.perf_counter() - started
+            if isinstance(result, types.GeneratorType):
+                return _timed_steps(result, timings)
+            return result
+
+        return timed
+
+
+def _timed_steps(generator, timings):
+    # The breakdown is a dict of the request, it stays valid once the request is done
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(generator)
+        except StopIteration:
+            return
+        finally:
+            timings['fs'] += time.perf_counter() - started
+        yield item
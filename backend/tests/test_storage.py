@@ -0,0 +1,160 @@
+import io
+import os
+
+import pytest
+from flask import Flask
+
+from backend.core.download import blob_response
+from backend.storage import LocalStorage, new_blob_key
+
+
+@pytest.fixture(params=['local', 's3'])
+def storage(request, tmp_path):
+    if request.param == 'local':
+        yield LocalStorage(str(tmp_path / 'blobs'))
+        return
+
+    moto = pytest.importorskip('moto')
+    pytest.importorskip('boto3')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        from backend.storage.s3 import S3Storage
+        backend = S3Storage('test-bucket', prefix='blobs/', region='us-east-1', legacy_root=str(tmp_path / 'blobs'))
+        backend.client.create_bucket(Bucket='test-bucket')
+        yield backend
+
+
+def part_size(storage):
+    # Every part but the last has to reach the minimum part size of the backend
+    return max(storage.min_part_size, 1024)
+
+
+def store(storage, data):
+    key = new_blob_key()
+    storage.put(key, io.BytesIO(data))
+    return key
+
+
+def test_multipart_upload(storage):
+    key = new_blob_key()
+    first, second = b'a' * part_size(storage), b'b' * 100
+    upload_id = storage.create_multipart(key)
+    parts = [
+        storage.upload_part(key, upload_id, 2, io.BytesIO(second)),
+        storage.upload_part(key, upload_id, 1, io.BytesIO(first)),
+    ]
+
+    assert storage.complete_multipart(key, upload_id, parts) == len(first) + len(second)
+    assert b''.join(storage.open(key)) == first + second
+    assert storage.stat(key).size == len(first) + len(second)
+
+
+def test_abort_multipart(storage):
+    key = new_blob_key()
+    upload_id = storage.create_multipart(key)
+    storage.upload_part(key, upload_id, 1, io.BytesIO(b'data'))
+
+    storage.abort_multipart(key, upload_id)
+    storage.abort_multipart(key, upload_id)  # aborting twice is not an error
+
+    assert storage.stat(key) is None
+    assert list(storage.iter_keys()) == []
+
+
+def test_ranged_open(storage):
+    data = bytes(range(256)) * 4
+    key = store(storage, data)
+
+    assert b''.join(storage.open(key, 10, 20)) == data[10:20]
+    assert b''.join(storage.open(key, 1000)) == data[1000:]
+    assert b''.join(storage.open(key)) == data
+
+
+def test_missing_key(storage):
+    key = new_blob_key()
+
+    assert storage.stat(key) is None
+    with pytest.raises(FileNotFoundError):
+        b''.join(storage.open(key))
+    storage.delete(key)  # deleting a missing blob is not an error
+
+
+def test_copy(storage):
+    key = store(storage, b'original')
+    copy = new_blob_key()
+
+    storage.copy(key, copy)
+    storage.delete(key)
+
+    assert storage.stat(key) is None
+    assert b''.join(storage.open(copy)) == b'original'
+
+
+def test_iter_keys(storage):
+    keys = sorted(store(storage, f'blob {i}'.encode()) for i in range(5))
+
+    assert list(storage.iter_keys()) == keys
+    assert list(storage.iter_keys(keys[1])) == keys[2:]
+    assert list(storage.iter_keys(keys[-1])) == []
+
+
+def test_legacy_absolute_key(storage, tmp_path):
+    # Files of the layout before blob keys, not migrated yet, stay on the local disk
+    path = tmp_path / 'legacy' / 'file.txt'
+    path.parent.mkdir()
+    path.write_bytes(b'legacy content')
+
+    assert storage.stat(str(path)).size == len(b'legacy content')
+    assert b''.join(storage.open(str(path), 7)) == b'content'
+
+    copy = new_blob_key()
+    storage.copy(str(path), copy)
+    assert b''.join(storage.open(copy)) == b'legacy content'
+
+    storage.delete(str(path))
+    assert not path.exists()
+
+
+@pytest.fixture
+def app(storage):
+    app = Flask(__name__)
+    app.storage = storage
+    return app
+
+
+def test_blob_response_whole_file(app, storage):
+    key = store(storage, b'0123456789')
+    with app.test_request_context():
+        response = blob_response(key, 'digits.txt', 10)
+
+        assert response.status_code == 200
+        assert response.headers['Content-Length'] == '10'
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert b''.join(response.response) == b'0123456789'
+
+
+def test_blob_response_range(app, storage):
+    key = store(storage, b'0123456789')
+    with app.test_request_context(headers={'Range': 'bytes=2-5'}):
+        response = blob_response(key, 'digits.txt', 10)
+
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == 'bytes 2-5/10'
+        assert response.headers['Content-Length'] == '4'
+        assert b''.join(response.response) == b'2345'
+
+    with app.test_request_context(headers={'Range': 'bytes=-3'}):
+        response = blob_response(key, 'digits.txt', 10)
+
+        assert response.status_code == 206
+        assert b''.join(response.response) == b'789'
+
+
+def test_blob_response_unsatisfiable_range(app, storage):
+    key = store(storage, b'0123456789')
+    with app.test_request_context(headers={'Range': 'bytes=20-30'}):
+        response = blob_response(key, 'digits.txt', 10)
+
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == 'bytes */10'
@@ -29,6 +29,7 @@ def userData(user):
         'id': user.id,
         'username': user.username,
         'used_space': user.used_space,
+        'reserved_space': user.reserved_space,
         'quota': user.quota,
         'admin': user.is_admin
     }
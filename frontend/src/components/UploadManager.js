@@ -7,7 +7,7 @@ import apiClient from '../services/apiClient';
 const { Dragger } = Upload;
 
 // Configuration
-const CHUNK_SIZE = 4 * 1024 * 1024; // 4 MB
+const CHUNK_SIZE = 8 * 1024 * 1024; // 8 MB, above the 5 MB minimum part size of S3
 const MAX_UPLOAD_FILES = 200;       // Maximum files allowed in total
 
 /**
@@ -22,7 +22,25 @@ const AdminDashboard = ({ toggleTheme, isDarkMode, user }) => {
             .catch((err) => console.error(err));
     };
 
+    const fetchPerformanceHistory = () => {
+        // The server keeps a history, so the charts start filled instead of empty
+        apiClient
+            .get('/services/server_info/history', { params: { seconds: 60 } })
+            .then((response) => {
+                const history = response.data.samples.map((sample) => ({
+                    timestamp: sample.timestamp,
+                    quicklook: { percpu: sample.percpu.map((total) => ({ total })) }
+                }));
+                setPerformanceData((prevData) => {
+                    const older = prevData.length ? history.filter((entry) => entry.timestamp < prevData[0].timestamp) : history;
+                    return [...older, ...prevData].slice(-60);
+                });
+            })
+            .catch((err) => console.error(err));
+    };
+
     useEffect(() => {
+        fetchPerformanceHistory();
         intervalRef.current = setInterval(fetchPerformanceInfo, 1000);
 
         return () => {
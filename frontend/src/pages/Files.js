@@ -1,8 +1,9 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Table, Button, message, Modal, Input, Breadcrumb } from 'antd';
 import { HomeOutlined } from '@ant-design/icons';
 import { Helmet } from 'react-helmet-async';
 import apiClient from '../services/apiClient';
+import subscribeToEvents from '../services/eventsClient';
 import Navbar from '../components/NavBar';
 import FileItem from '../components/FileItem';
 import StorageInfo from '../components/StorageInfo';
@@ -18,20 +19,55 @@ const Files = ({ toggleTheme, isDarkMode, userApp }) => {
     const [isCreateDirModalVisible, setIsCreateDirModalVisible] = useState(false);
     const [newDirName, setNewDirName] = useState('');
     const [breadcrumbs, setBreadcrumbs] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+
+    const currentDirIdRef = useRef(null);
+    const refreshTimerRef = useRef(null);
 
     useEffect(() => {
         fetchFiles();
+        fetchUser();
+    }, []);
+
+    // Changes pushed by the server, e.g. from another tab or device, refresh the listing
+    useEffect(() => {
+        const unsubscribe = subscribeToEvents({
+            change: () => scheduleRefresh(),
+            resync: () => {
+                scheduleRefresh();
+                fetchUser();
+            },
+            quota: (quota) => setUser(prevUser => prevUser ? { ...prevUser, ...quota } : prevUser),
+        });
+        return () => {
+            unsubscribe();
+            clearTimeout(refreshTimerRef.current);
+        };
     }, []);
 
+    // Bursts of changes, like a bulk delete, only cause a single refresh
+    const scheduleRefresh = () => {
+        clearTimeout(refreshTimerRef.current);
+        refreshTimerRef.current = setTimeout(() => fetchFiles(currentDirIdRef.current), 300);
+    };
+
+    // Used and reserved space, kept up to date by the quota events afterwards
+    const fetchUser = () => {
+        apiClient.get('/user')
+            .then(response => setUser(response.data))
+            .catch(err => console.error(err));
+    };
+
     const fetchFiles = (dirId = null) => {
         setCurrentDirId(dirId);
+        currentDirIdRef.current = dirId;
         const url = dirId ? `/files?dir_id=${dirId}` : '/files';
         apiClient.get(url)
             .then(response => {
                 console.log("response.data", response.data);
                 setFiles(response.data.files);
+                setNextCursor(response.data.next_cursor || null);
                 setDirectories(response.data.directories);
-                setUser(response.data.user);
                 setCurrentDirectory(response.data.current_directory || null);
                 setSelectedRowKeys([]);
                 if (response.data.breadcrumbs) {
@@ -46,6 +82,20 @@ const Files = ({ toggleTheme, isDarkMode, userApp }) => {
             .catch(err => console.error(err));
     };
 
+    // Files are paginated by the server, fetch the next page and append it
+    const loadMoreFiles = () => {
+        const params = new URLSearchParams({ cursor: nextCursor });
+        if (currentDirId) {
+            params.set('dir_id', currentDirId);
+        }
+        apiClient.get(`/files?${params.toString()}`)
+            .then(response => {
+                setFiles(prevFiles => [...prevFiles, ...response.data.files]);
+                setNextCursor(response.data.next_cursor || null);
+            })
+            .catch(err => console.error(err));
+    };
+
     const bulkDelete = () => {
         const fileIds = [];
         const dirIds = [];
@@ -253,6 +303,11 @@ const Files = ({ toggleTheme, isDarkMode, userApp }) => {
                 rowSelection={rowSelection}
                 scroll={{ y: 'calc(100vh - 400px)' }}
             />
+            {nextCursor && (
+                <Button onClick={loadMoreFiles} style={{marginTop: 16}}>
+                    Load more
+                </Button>
+            )}
 
             <Modal
                 title="Create New Directory"
@@ -1,21 +1,30 @@
 import React, { useState, useEffect } from 'react';
 import { Helmet } from 'react-helmet-async';
 import { useParams } from 'react-router-dom';
-import { Input, Button, message } from 'antd';
+import { Input, Button, Table, message } from 'antd';
 import apiClient from '../services/apiClient';
 import '../css/PublicSharePage.css';
 
 const PublicSharePage = () => {
     const { shareKey } = useParams();
+    const [shareType, setShareType] = useState(null);
     const [filename, setFilename] = useState('');
     const [needsPassword, setNeedsPassword] = useState(false);
     const [password, setPassword] = useState('');
+    const [shareToken, setShareToken] = useState(null);
+    // Files of a directory share, listed once the share is unlocked
+    const [entries, setEntries] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
 
     useEffect(() => {
         apiClient.get(`/share/s/${shareKey}`)
             .then(res => {
-                setFilename(res.data.filename);
+                setShareType(res.data.type);
+                setFilename(res.data.type === 'directory' ? res.data.name : res.data.filename);
                 setNeedsPassword(res.data.needs_password);
+                if (res.data.type === 'directory' && !res.data.needs_password) {
+                    loadEntries(null, null).catch(err => handleError(err, 'Failed to list the shared files'));
+                }
             })
             .catch(err => {
                 console.error(err);
@@ -23,8 +32,53 @@ const PublicSharePage = () => {
             });
     }, [shareKey]);
 
-    const downloadFile = () => {
-        apiClient.post(`/share/s/${shareKey}/download`, { password }, { responseType: 'blob' })
+    // Exchange the password for a short-lived share token once, then reuse it for downloads
+    const getShareToken = () => {
+        if (!needsPassword || shareToken) {
+            return Promise.resolve(shareToken);
+        }
+        return apiClient.post(`/share/s/${shareKey}/access`, { password })
+            .then(res => {
+                setShareToken(res.data.share_token);
+                return res.data.share_token;
+            });
+    };
+
+    const handleError = (err, failure) => {
+        console.error(err);
+        if (err.response?.status === 403) {
+            setShareToken(null);
+            message.error('Invalid password!');
+        } else {
+            message.error(failure);
+        }
+    };
+
+    // Files of the shared directory tree, a page at a time
+    const loadEntries = (token, cursor) => {
+        const url = cursor ? `/share/s/${shareKey}/list?cursor=${encodeURIComponent(cursor)}` : `/share/s/${shareKey}/list`;
+        return apiClient.post(url, { share_token: token })
+            .then(res => {
+                setEntries(prevEntries => cursor && prevEntries ? [...prevEntries, ...res.data.entries] : res.data.entries);
+                setNextCursor(res.data.next_cursor || null);
+            });
+    };
+
+    const openDirectory = () => {
+        getShareToken()
+            .then(token => loadEntries(token, null))
+            .catch(err => handleError(err, 'Failed to list the shared files'));
+    };
+
+    const loadMoreEntries = () => {
+        getShareToken()
+            .then(token => loadEntries(token, nextCursor))
+            .catch(err => handleError(err, 'Failed to list the shared files'));
+    };
+
+    const download = (url, fallbackName) => {
+        getShareToken()
+            .then(token => apiClient.post(url, { share_token: token }, { responseType: 'blob' }))
             .then(response => {
                 let filenameHeader = response.headers['x-filename'];
                 if (!filenameHeader) {
@@ -32,38 +86,59 @@ const PublicSharePage = () => {
                     if (disposition && disposition.indexOf('filename=') !== -1) {
                         filenameHeader = disposition.split('filename=')[1].replace(/"/g, '');
                     } else {
-                        filenameHeader = filename;
+                        filenameHeader = fallbackName;
                     }
                 }
-                const url = window.URL.createObjectURL(new Blob([response.data]));
+                const blobUrl = window.URL.createObjectURL(new Blob([response.data]));
                 const link = document.createElement('a');
-                link.href = url;
+                link.href = blobUrl;
                 link.setAttribute('download', filenameHeader);
                 document.body.appendChild(link);
                 link.click();
                 link.remove();
             })
-            .catch(err => {
-                console.error(err);
-                if (err.response?.status === 403) {
-                    message.error('Invalid password!');
-                } else {
-                    message.error('Failed to download the file');
-                }
-            });
+            .catch(err => handleError(err, 'Failed to download the file'));
     };
 
+    const downloadFile = () => download(`/share/s/${shareKey}/download`, filename);
+
+    const downloadArchive = () => download(`/share/s/${shareKey}/archive`, `${filename}.zip`);
+
+    const columns = [
+        { title: 'Path', dataIndex: 'path', key: 'path' },
+        {
+            title: 'Size',
+            dataIndex: 'size',
+            key: 'size',
+            render: (size) => `${(size / 1024 / 1024).toFixed(2)} MB`
+        },
+        {
+            title: '',
+            key: 'download',
+            render: (_, record) => (
+                <Button onClick={() => download(`/share/s/${shareKey}/files/${record.id}/download`, record.filename)}>
+                    Download
+                </Button>
+            )
+        }
+    ];
+
+    const isDirectory = shareType === 'directory';
+    const title = isDirectory ? 'Folder Share' : 'File Share';
+
     return (
         <div className="public-share-page">
             <Helmet>
-                <title>{filename ? `${filename} | PassTheBytes` : 'File Share | PassTheBytes'}</title>
+                <title>{filename ? `${filename} | PassTheBytes` : `${title} | PassTheBytes`}</title>
                 <meta name="description" content={filename ? `Download ${filename} securely on PassTheBytes.` : 'Secure file sharing on PassTheBytes.'} />
-                <meta property="og:title" content={filename ? `${filename} | PassTheBytes` : 'File Share | PassTheBytes'} />
+                <meta property="og:title" content={filename ? `${filename} | PassTheBytes` : `${title} | PassTheBytes`} />
                 <meta property="og:description" content={filename ? `Download ${filename} securely on PassTheBytes.` : 'Secure file sharing on PassTheBytes.'} />
                 {/* TODO <meta property="og:image" content="https://yourwebsite.com/placeholder-icon.png" />*/}
             </Helmet>
-            <h2>File Share</h2>
-            {filename ? <p>Filename: {filename}</p> : <p>No file info found.</p>}
+            <h2>{title}</h2>
+            {filename
+                ? <p>{isDirectory ? 'Folder' : 'Filename'}: {filename}</p>
+                : <p>No file info found.</p>}
             {needsPassword && (
                 <div>
                     <Input.Password
@@ -74,9 +149,32 @@ const PublicSharePage = () => {
                     />
                 </div>
             )}
-            <Button className="download-button" type="primary" onClick={downloadFile}>
-                Download
-            </Button>
+            {isDirectory ? (
+                <div>
+                    {needsPassword && entries === null && (
+                        <Button className="download-button" onClick={openDirectory}>
+                            Show files
+                        </Button>
+                    )}
+                    <Button className="download-button" type="primary" onClick={downloadArchive}>
+                        Download all as ZIP
+                    </Button>
+                    {entries !== null && (
+                        <div className="shared-files">
+                            <Table dataSource={entries} columns={columns} rowKey="id" pagination={false} />
+                            {nextCursor && (
+                                <Button className="load-more-button" onClick={loadMoreEntries}>
+                                    Load more
+                                </Button>
+                            )}
+                        </div>
+                    )}
+                </div>
+            ) : (
+                <Button className="download-button" type="primary" onClick={downloadFile}>
+                    Download
+                </Button>
+            )}
         </div>
     );
 };
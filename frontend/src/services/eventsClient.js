@@ -0,0 +1,53 @@
+import apiClient from './apiClient';
+
+const RECONNECT_DELAY = 5000;
+
+// Opens the server event stream and keeps it open until the returned function is called.
+// EventSource can't send the Authorization header, so a short-lived stream token is fetched first,
+// and a fresh one whenever the connection drops.
+const subscribeToEvents = (handlers) => {
+    let source = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const scheduleReconnect = () => {
+        if (!closed && !reconnectTimer) {
+            reconnectTimer = setTimeout(() => {
+                reconnectTimer = null;
+                connect();
+            }, RECONNECT_DELAY);
+        }
+    };
+
+    const connect = () => {
+        apiClient.post('/events/token')
+            .then(response => {
+                if (closed) {
+                    return;
+                }
+                const url = `${apiClient.defaults.baseURL}/events?token=${encodeURIComponent(response.data.token)}`;
+                source = new EventSource(url, { withCredentials: true });
+                Object.entries(handlers).forEach(([type, handler]) => {
+                    source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+                });
+                source.onerror = () => {
+                    // Stream tokens are short-lived, so reconnect with a new one instead of letting EventSource retry
+                    source.close();
+                    scheduleReconnect();
+                };
+            })
+            .catch(() => scheduleReconnect());
+    };
+
+    connect();
+
+    return () => {
+        closed = true;
+        clearTimeout(reconnectTimer);
+        if (source) {
+            source.close();
+        }
+    };
+};
+
+export default subscribeToEvents;